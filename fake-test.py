@@ -1,10 +1,7 @@
 from functools import partial
-from typing import Dict, Type, Optional, List
+from typing import Dict, Type, List
 
-from kubernetes import config, client
-from kubernetes.stream import stream
-
-from test_template import Test, TestBed, Node, DEFAULT_NAMESPACE, TestAction
+from test_template import Test, TestBed, Node, TestAction
 from test_template.actions import SleepAction
 
 
@@ -26,12 +23,8 @@ class FakeAction(TestAction):
         assert len(db_nodes) == 1
 
         mysql_probe = 'mysql -h {} -P 4000 -uroot -e "select tidb_version();"'.format(db_nodes[0].pod_ip)
-        resp = stream(self.test_instance.env_instance.api_core_v1.connect_get_namespaced_pod_exec,
-                      namespace=DEFAULT_NAMESPACE, name=db_nodes[0].pod_name,
-                      command=['bash', '-c', mysql_probe],
-                      stderr=True, stdin=False,
-                      stdout=True, tty=False)
-        self.assert_('tidb_version' in resp, resp)
+        resp = db_nodes[0].run(mysql_probe)
+        self.assert_('tidb_version' in resp.stdout, resp.stderr)
 
 
 class FakeTest(Test):
@@ -45,10 +38,7 @@ class FakeTest(Test):
     def env() -> Type[TestBed]:
         return FakeEnv
 
-    def _init_env(self, env_init_interval: Optional[int] = 1):
-        super()._init_env(env_init_interval)
-
 
 if __name__ == '__main__':
-    config.load_kube_config()
-    FakeTest(api_core_v1=client.CoreV1Api(), api_apps_v1=client.AppsV1Api()).start()
+    from test_template.cli import start
+    start(FakeTest)
@@ -6,8 +6,10 @@ from time import strftime, sleep
 
 import yaml
 from kubernetes import client, config
-from kubernetes.client import V1PodList, CoreV1Api
+from kubernetes.client import CoreV1Api
+from kubernetes.client.rest import ApiException
 from kubernetes.stream import stream
+from kubernetes.watch import Watch
 
 dpl = Path(__file__).parent.resolve() / 'deployment.yaml'
 
@@ -36,17 +38,33 @@ if __name__ == '__main__':
 
     core = client.CoreV1Api()
 
-    # wait for all pods
-    while True:
-        ret: V1PodList = core.list_namespaced_pod(
-            namespace='default',
-            label_selector=','.join('{}={}'.format(*i) for i in d['metadata']['labels'].items()))
-        if all(i.status.phase == 'Running' for i in ret.items):
-            break
-        else:
-            sleep(1)
-
-    name_ip = [(i.metadata.name, i.status.pod_ip) for i in ret.items]
+    # wait for all pods, driven by pod watch events
+    selector = ','.join('{}={}'.format(*i) for i in d['metadata']['labels'].items())
+    pods = {}
+    version = None
+    while not (len(pods) == d['spec']['replicas'] and all(i.status.phase == 'Running' for i in pods.values())):
+        if version is None:
+            ret = core.list_namespaced_pod(namespace='default', label_selector=selector)
+            pods = {i.metadata.name: i for i in ret.items}
+            version = ret.metadata.resource_version
+            continue
+        w = Watch()
+        try:
+            for e in w.stream(core.list_namespaced_pod, namespace='default', label_selector=selector,
+                              resource_version=version, timeout_seconds=60):
+                version = e['object'].metadata.resource_version
+                if e['type'] == 'DELETED':
+                    pods.pop(e['object'].metadata.name, None)
+                else:
+                    pods[e['object'].metadata.name] = e['object']
+                if len(pods) == d['spec']['replicas'] and all(i.status.phase == 'Running' for i in pods.values()):
+                    w.stop()
+        except ApiException as e:
+            if e.status != 410:
+                raise
+            version = None
+
+    name_ip = [(i.metadata.name, i.status.pod_ip) for i in pods.values()]
 
     assert len(name_ip) == d['spec']['replicas']
     kvs = name_ip[:3]
@@ -1,25 +1,23 @@
 from functools import partial
 from typing import Type, List
 
-from kubernetes import client, config
-
 from test_template import TestAction
-from test_template.actions import BashAction
-from test_template.chaos import ChaosManager, Up, Down
+from test_template.actions import BashAction, SleepAction, StartWorkload, StopWorkload
+from test_template.chaos import Up, Down
 from test_template.chaos.operators import NodeOffline, NetworkPartition
 from test_template.mixins import NetworkingV1ApiMixin
 
-from ssb import CopyBuildSsb, SsbDbAndTable, SsbLoadData, SsbQuery, SsbTest
+from ssb import CopyBuildSsb, SsbDbAndTable, SsbLoadData, SsbQuery, SsbTest, ssb_query_workload
 
 
 class SsbChaosTest1(NetworkingV1ApiMixin, SsbTest):
     def test_actions(self) -> List[Type[TestAction]]:
         pd_offline_operator = NodeOffline(
-            ChaosManager(self.env_instance),
+            self.chaos_manager,
             node_type='pd',
             api_net_v1=self.api_net_v1)
         kv_offline_operator = NodeOffline(
-            ChaosManager(self.env_instance),
+            self.chaos_manager,
             node_type='kv',
             api_net_v1=self.api_net_v1)
         return [
@@ -41,7 +39,7 @@ class SsbChaosTest2(NetworkingV1ApiMixin, SsbTest):
             CopyBuildSsb,
             SsbDbAndTable,
             partial(Up, chaos_operator=NetworkPartition(
-                ChaosManager(self.env_instance),
+                self.chaos_manager,
                 api_net_v1=self.api_net_v1)),
             SsbLoadData,
             SsbQuery,
@@ -49,8 +47,36 @@ class SsbChaosTest2(NetworkingV1ApiMixin, SsbTest):
         ]
 
 
+class SsbChaosTest3(NetworkingV1ApiMixin, SsbTest):
+    """
+    Queries at a fixed rate before, during and after a TiKV node is offline.
+    """
+    concurrency = 4
+    qps = 2
+    # seconds of queries before and after the fault
+    baseline_seconds = 60
+    fault_seconds = 120
+
+    def test_actions(self) -> List[Type[TestAction]]:
+        kv_offline_operator = NodeOffline(
+            self.chaos_manager,
+            node_type='kv',
+            api_net_v1=self.api_net_v1)
+        return [
+            CopyBuildSsb,
+            SsbDbAndTable,
+            SsbLoadData,
+            partial(StartWorkload, name='ssb',
+                    workload=partial(ssb_query_workload, concurrency=self.concurrency, qps=self.qps)),
+            partial(SleepAction, sleep_interval=self.baseline_seconds),
+            partial(Up, chaos_operator=kv_offline_operator),
+            partial(SleepAction, sleep_interval=self.fault_seconds),
+            partial(Down, chaos_operator=kv_offline_operator),
+            partial(SleepAction, sleep_interval=self.baseline_seconds),
+            partial(StopWorkload, name='ssb'),
+        ]
+
+
 if __name__ == '__main__':
-    config.load_kube_config()
-    SsbChaosTest1(api_core_v1=client.CoreV1Api(),
-                  api_apps_v1=client.AppsV1Api(),
-                  api_net_v1=client.NetworkingV1Api()).start()
+    from test_template.cli import start
+    start(SsbChaosTest1)
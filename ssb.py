@@ -1,13 +1,18 @@
+import tarfile
 from abc import ABC
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import sha256
+from os import getpid
 from pathlib import Path
-from subprocess import run
-from typing import Type, Dict, List
+from shutil import rmtree
+from subprocess import Popen, PIPE
+from time import time
+from typing import Type, Dict, List, Optional, Tuple
 
-from kubernetes import client, config
-from kubernetes.stream import stream
-
-from test_template import Test, TestBed, Node, DEFAULT_NAMESPACE, TestAction
+from test_template import Test, TestBed, Node, TestAction
 from test_template.mixins import LoggerMixin
+from test_template.session import ExecResult
+from test_template.workload import BackgroundWorkload
 
 
 class SqlBenchEnv(TestBed):
@@ -30,51 +35,216 @@ class SsbBaseAction(TestAction, ABC):
 
         self.bench_base = '/home/tidb/ssb'
 
+    def _kubectl_exec(self, node: Node, cmd: str, **kwargs) -> Popen:
+        return Popen(['kubectl', 'exec', '-i', '-n', node.namespace, node.pod_name, '--', 'bash', '-c', cmd], **kwargs)
+
+    def run_recorded(self, step: str, name: str, cmd: str, node: Optional[Node] = None) -> ExecResult:
+        """
+        Run `cmd` (a `mysql` batch command) in `bench_base` of `node` (`db_node` if not given) and record it to test
+        results.
+
+        Rows are counted from the last line of output if `step` is 'load' (`select row_count()`), or the number of
+        lines excluding header otherwise.
+        """
+        if node is None:
+            node = self.db_node
+        chaos = self.test_instance.chaos_state()
+        start = time()
+        result = node.session.run('cd {base} && {cmd}'.format(base=self.bench_base, cmd=cmd))
+        end = time()
+
+        self.test_instance.results.record(step, name, start, end, rows=self.count_rows(step, result),
+                                          error=None if result.ok else result.stderr.strip(), chaos=chaos)
+        return result
+
+    @staticmethod
+    def count_rows(step: str, result: ExecResult) -> Optional[int]:
+        if not result.ok:
+            return None
+        lines = result.stdout.splitlines()
+        if step == 'load':
+            return int(lines[-1]) if lines and lines[-1].isdigit() else None
+        return max(len(lines) - 1, 0)
+
+
+def _file_digests(root: Path) -> Dict[str, str]:
+    """
+    sha256 of every file under `root`, by path relative to `root` (`./` prefixed, same as `find .`).
+    """
+    ret = {}
+    for f in sorted(root.rglob('*')):
+        if f.is_file() and '.tbl' not in f.name:
+            ret['./{}'.format(f.relative_to(root).as_posix())] = sha256(f.read_bytes()).hexdigest()
+    return ret
+
+
+class CopyBuildSsb(LoggerMixin, SsbBaseAction):
+    """
+    Copy `tidb-bench/ssb` into the pod of `db_node`, build dbgen and generate data of `scale_factor`.
+
+    Built dbgen and generated `.tbl` files are cached by the hash of dbgen sources and the scale factor: in the pod
+    (skipping everything on a hit), and on the host under `cache_dir` if given (which can be a shared volume),
+    from where they are copied into a new pod instead of being built again. Only changed source files are copied.
+    """
+
+    def __init__(self, test_instance: 'Test', scale_factor: int = 1, cache_dir: Optional[str] = None,
+                 **kwargs) -> None:
+        super().__init__(test_instance, **kwargs)
+        self.scale_factor = scale_factor
+        self.cache_dir = None if cache_dir is None else Path(cache_dir).expanduser()
+
+    def _tar_to_pod(self, files: List[Tuple[Path, str]], dest: str):
+        # streamed, generated data can be much larger than memory
+        proc = self._kubectl_exec(self.db_node, 'tar xf - -C {}'.format(dest), stdin=PIPE)
+        with tarfile.open(fileobj=proc.stdin, mode='w|') as tar:
+            for (f, arcname) in files:
+                tar.add(str(f), arcname=arcname)
+        proc.stdin.close()
+        assert proc.wait() == 0, 'failed to copy files to {}:{}'.format(self.db_node.pod_name, dest)
+
+    def _tar_from_pod(self, cmd: str, dest: Path):
+        proc = self._kubectl_exec(self.db_node, cmd, stdout=PIPE)
+        with tarfile.open(fileobj=proc.stdout, mode='r|') as tar:
+            tar.extractall(str(dest))
+        assert proc.wait() == 0, 'failed to copy files from {}'.format(self.db_node.pod_name)
+
+    def _copy_sources(self, bench: Path, local: Dict[str, str]):
+        remote_digests = self.db_node.run(
+            'mkdir -p {base} && cd {base} && find . -type f ! -name "*.tbl*" -exec sha256sum {{}} +'.format(
+                base=self.bench_base)).stdout
+        remote = {path: digest for (digest, path) in (line.split(None, 1) for line in remote_digests.splitlines())}
+        changed = [path for (path, digest) in local.items() if remote.get(path) != digest]
+        self.logger.info('copying %s changed file(s) of %s', len(changed), len(local))
+        if not changed:
+            return
+
+        self._tar_to_pod([(bench / path, path) for path in changed], self.bench_base)
 
-class CopyBuildSsb(SsbBaseAction):
     def run_action(self):
         bench = Path(__file__).parent.resolve() / 'tidb-bench/ssb'
-        run(['kubectl', 'cp', '{}'.format(bench),
-             '{}/{}:{}'.format(DEFAULT_NAMESPACE, self.db_node.pod_name, '/home/tidb')])
+        local = _file_digests(bench)
+
+        key_src = sha256('scale_factor={}\n'.format(self.scale_factor).encode())
+        for (path, digest) in local.items():
+            if path.startswith('./dbgen/'):
+                key_src.update('{} {}\n'.format(path, digest).encode())
+        key = key_src.hexdigest()
+        dbgen = '{}/dbgen'.format(self.bench_base)
 
-        stream(self.test_instance.api_core_v1.connect_get_namespaced_pod_exec,
-               namespace=DEFAULT_NAMESPACE, name=self.db_node.pod_name,
-               command=['bash', '-c',
-                        'cd {base}/dbgen && make -j && ./dbgen -s 1 -T a'.format(base=self.bench_base)],
-               stderr=True, stdin=False,
-               stdout=True, tty=False)
+        self._copy_sources(bench, local)
+
+        if self.db_node.run('test "$(cat {}/.cache-key)" = {}'.format(dbgen, key)).ok:
+            self.logger.info('dbgen and data of %s already in pod', key)
+            return
+
+        cached = None if self.cache_dir is None else self.cache_dir / key
+        if cached is not None and cached.is_dir():
+            self.logger.info('copying dbgen and data from %s', cached)
+            self._tar_to_pod([(f, f.name) for f in cached.iterdir()], dbgen)
+        else:
+            result = self.db_node.run('cd {dbgen} && rm -f *.tbl && make -j && ./dbgen -s {sf} -T a'.format(
+                dbgen=dbgen, sf=self.scale_factor))
+            assert result.ok, 'failed to build dbgen or generate data: {}'.format(result.stderr)
+            if cached is not None:
+                self.logger.info('saving dbgen and data to %s', cached)
+                tmp = self.cache_dir / '{}.tmp-{}'.format(key, getpid())
+                tmp.mkdir(parents=True)
+                self._tar_from_pod('cd {} && tar cf - dbgen *.tbl'.format(dbgen), tmp)
+                # another run may have saved the same key meanwhile
+                try:
+                    tmp.rename(cached)
+                except OSError:
+                    rmtree(str(tmp))
+
+        self.db_node.run('echo {} > {}/.cache-key'.format(key, dbgen))
 
 
 class SsbDbAndTable(SsbBaseAction):
     def run_action(self):
-        stream(self.test_instance.api_core_v1.connect_get_namespaced_pod_exec,
-               namespace=DEFAULT_NAMESPACE, name=self.db_node.pod_name,
-               command=['bash', '-c',
-                        'cd {base} && '
-                        'mysql -h 127.0.0.1 -P 4000 -u root -e "drop database if exists ssb;" && '
-                        'mysql -h 127.0.0.1 -P 4000 -u root -e "create database ssb;" && '
-                        'mysql -h 127.0.0.1 -P 4000 -u root -D ssb < create_table.sql'.format(base=self.bench_base)],
-               stderr=True, stdin=False,
-               stdout=True, tty=False)
+        self.db_node.run('cd {base} && '
+                         'mysql -h 127.0.0.1 -P 4000 -u root -e "drop database if exists ssb;" && '
+                         'mysql -h 127.0.0.1 -P 4000 -u root -e "create database ssb;" && '
+                         'mysql -h 127.0.0.1 -P 4000 -u root -D ssb < create_table.sql'.format(base=self.bench_base))
 
 
 class SsbLoadData(LoggerMixin, SsbBaseAction):
+    """
+    Load tables concurrently, lineorder is split into chunks. Files are spread over all `DbNode`s: each one's files
+    are copied from the pod of `db_node` (where data are generated) into its own pod, and loaded there by `mysql`
+    into its own server, so neither the clients nor the network of one pod are the bottleneck.
+    """
+
+    tables = ('part', 'supplier', 'customer', 'date', 'lineorder')
+
+    def __init__(self, test_instance: 'Test', workers: int = 4, lineorder_chunks: Optional[int] = None,
+                 **kwargs) -> None:
+        super().__init__(test_instance, **kwargs)
+        self.workers = workers
+        self.lineorder_chunks = workers if lineorder_chunks is None else lineorder_chunks
+
+    def _copy_files(self, node: Node, file_names: List[str]):
+        dbgen = '{}/dbgen'.format(self.bench_base)
+        # streamed from pod to pod through this process
+        src = self._kubectl_exec(self.db_node, 'cd {} && tar cf - {}'.format(dbgen, ' '.join(file_names)),
+                                 stdout=PIPE)
+        dst = self._kubectl_exec(node, 'mkdir -p {dbgen} && tar xf - -C {dbgen}'.format(dbgen=dbgen),
+                                 stdin=src.stdout)
+        src.stdout.close()
+        assert dst.wait() == 0 and src.wait() == 0, 'failed to copy {} to {}'.format(file_names, node.pod_name)
+
     def run_action(self):
-        load_sqls = [
-            "mysql --local-infile=1 -h 127.0.0.1 -P 4000 -u root -D ssb -e"
-            " \"load data local infile 'dbgen/{tb_name}.tbl'"
-            " into table {tb_name} fields terminated by '|' lines terminated by '\\n';\"".format(tb_name=i)
-            for i in ('part', 'supplier', 'customer', 'date', 'lineorder')
-        ]
+        from test_template.nodes import DbNode
+        db_nodes = self.test_instance.env_instance.node_instances[DbNode]
+
+        chunk_prefix = 'lineorder.tbl.part-'
+        self.db_node.run('cd {base}/dbgen && rm -f {prefix}* && split -n l/{n} -d -a 3 lineorder.tbl {prefix}'.format(
+            base=self.bench_base, n=self.lineorder_chunks, prefix=chunk_prefix))
+        # biggest first, each on the next node
+        files = [('lineorder', '{}{:03d}'.format(chunk_prefix, i)) for i in range(self.lineorder_chunks)]
+        files += [(tb_name, '{}.tbl'.format(tb_name)) for tb_name in self.tables if tb_name != 'lineorder']
+        loads = [(db_nodes[i % len(db_nodes)], tb_name, file_name) for (i, (tb_name, file_name)) in enumerate(files)]
 
-        for sql_cmd in load_sqls:
-            self.logger.info('`{}`'.format(sql_cmd))
-            stream(self.test_instance.api_core_v1.connect_get_namespaced_pod_exec,
-                   namespace=DEFAULT_NAMESPACE, name=self.db_node.pod_name,
-                   command=['bash', '-c',
-                            'cd {base} && {sql}'.format(base=self.bench_base, sql=sql_cmd)],
-                   stderr=True, stdin=False,
-                   stdout=True, tty=False)
+        copied: Dict[Node, List[str]] = {}
+        for (node, _, file_name) in loads:
+            if node is not self.db_node:
+                copied.setdefault(node, []).append(file_name)
+        if copied:
+            begin = time()
+            with ThreadPoolExecutor(max_workers=len(copied)) as pool:
+                for _ in pool.map(lambda a: self._copy_files(*a), copied.items()):
+                    pass
+            self.logger.info('copied data to %d pod(s) in %.2fs', len(copied), time() - begin)
+
+        def load(node: Node, tb_name: str, file_name: str) -> Tuple[str, float, float, Optional[int]]:
+            sql_cmd = "mysql --local-infile=1 -h 127.0.0.1 -P 4000 -u root -D ssb -N -e" \
+                      " \"load data local infile 'dbgen/{file_name}'" \
+                      " into table {tb_name} fields terminated by '|' lines terminated by '\\n';" \
+                      " select row_count();\"".format(file_name=file_name, tb_name=tb_name)
+            self.logger.info('`%s` on %s', sql_cmd, node)
+            start = time()
+            result = self.run_recorded('load', tb_name, sql_cmd, node=node)
+            if not result.ok:
+                self.logger.error('`%s` on %s exited with %s: %s', sql_cmd, node, result.exit_code, result.stderr)
+            return tb_name, start, time(), self.count_rows('load', result)
+
+        begin = time()
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            loaded = list(pool.map(lambda a: load(*a), loads))
+        total_seconds = time() - begin
+
+        for (node, file_names) in copied.items():
+            node.run('cd {}/dbgen && rm -f {}'.format(self.bench_base, ' '.join(file_names)))
+
+        total_rows = 0
+        for tb_name in self.tables:
+            parts = [i for i in loaded if i[0] == tb_name]
+            rows = sum(i[3] or 0 for i in parts)
+            seconds = max(i[2] for i in parts) - min(i[1] for i in parts)
+            total_rows += rows
+            self.logger.info('%s: %d rows in %.2fs, %.0f rows/s', tb_name, rows, seconds,
+                             rows / seconds if seconds else 0)
+        self.logger.info('total: %d rows in %.2fs, %.0f rows/s', total_rows, total_seconds,
+                         total_rows / total_seconds if total_seconds else 0)
 
 
 class SsbQuery(LoggerMixin, SsbBaseAction):
@@ -82,13 +252,54 @@ class SsbQuery(LoggerMixin, SsbBaseAction):
         for i in range(1, 14):
             sql_cmd = 'mysql -h 127.0.0.1 -P 4000 -u root -D ssb < queries/{}.sql'.format(i)
 
-            self.logger.info('`{}`'.format(sql_cmd))
-            stream(self.test_instance.api_core_v1.connect_get_namespaced_pod_exec,
-                   namespace=DEFAULT_NAMESPACE, name=self.db_node.pod_name,
-                   command=['bash', '-c',
-                            'cd {base} && {sql}'.format(base=self.bench_base, sql=sql_cmd)],
-                   stderr=True, stdin=False,
-                   stdout=True, tty=False)
+            self.logger.info('`%s`', sql_cmd)
+            result = self.run_recorded('query', 'q{}'.format(i), sql_cmd)
+            if not result.ok:
+                self.logger.error('`%s` exited with %s: %s', sql_cmd, result.exit_code, result.stderr)
+
+
+def ssb_queries() -> Dict[str, str]:
+    query_dir = Path(__file__).parent.resolve() / 'tidb-bench/ssb/queries'
+    return {'q{}'.format(i): (query_dir / '{}.sql'.format(i)).read_text() for i in range(1, 14)}
+
+
+def ssb_query_workload(test: Test, concurrency: int = 4, qps: Optional[float] = None) -> BackgroundWorkload:
+    """
+    SSB queries over MySQL connections to all `DbNode`s until stopped, for `actions.StartWorkload`.
+    """
+    from test_template.nodes import DbNode
+    from test_template.workload import MySqlPool, QueryDriver
+
+    pool = MySqlPool([n.pod_ip for n in test.env_instance.node_instances[DbNode]],
+                     size_per_host=concurrency, database='ssb')
+    return QueryDriver(pool, ssb_queries(), test.results, test.chaos_state, step='background').background(
+        concurrency=concurrency, qps=qps, close=pool.close)
+
+
+class SsbQueryDriver(LoggerMixin, SsbBaseAction):
+    """
+    Run SSB queries from the test process over MySQL connections to all `DbNode`s, instead of `mysql` in pod.
+    """
+
+    def __init__(self, test_instance: 'Test', concurrency: int = 1, repeat: int = 1, qps: Optional[float] = None,
+                 duration: Optional[float] = None, **kwargs) -> None:
+        super().__init__(test_instance, **kwargs)
+        self.concurrency = concurrency
+        self.repeat = repeat
+        self.qps = qps
+        self.duration = duration
+
+    def run_action(self):
+        from test_template.nodes import DbNode
+        from test_template.workload import MySqlPool, QueryDriver
+
+        pool = MySqlPool([n.pod_ip for n in self.test_instance.env_instance.node_instances[DbNode]],
+                         size_per_host=self.concurrency, database='ssb')
+        try:
+            QueryDriver(pool, ssb_queries(), self.test_instance.results, self.test_instance.chaos_state).run(
+                concurrency=self.concurrency, repeat=self.repeat, qps=self.qps, duration=self.duration)
+        finally:
+            pool.close()
 
 
 class SsbTest(Test):
@@ -106,5 +317,5 @@ class SsbTest(Test):
 
 
 if __name__ == '__main__':
-    config.load_kube_config()
-    SsbTest(api_core_v1=client.CoreV1Api(), api_apps_v1=client.AppsV1Api()).start()
+    from test_template.cli import start
+    start(SsbTest)
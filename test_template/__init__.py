@@ -1,17 +1,29 @@
+import logging
 from abc import ABC
-from atexit import register
-from random import choice
-from time import sleep, strftime
-from typing import List, Union, Type, Dict, Optional, TypeVar
-
-from kubernetes import client, config
-from kubernetes.client import CoreV1Api, V1Pod, AppsV1Api, V1PodList
-from kubernetes.stream import stream
-
-from .logger import init_logger
+from atexit import register, unregister
+from concurrent.futures import ThreadPoolExecutor
+from random import randrange, Random
+from threading import Thread
+from shlex import quote
+from time import sleep, strftime, monotonic
+from typing import List, Union, Type, Dict, Optional, TypeVar, Tuple, Callable, TYPE_CHECKING
+
+from .labels import LabelManager
 from .mixins import LoggerMixin, CoreV1ApiMixin, AppsV1ApiMixin
-
-init_logger()
+from .results import ResultWriter
+from .session import ExecSession, ExecResult, SessionPool, ExecStream
+from .topology import Topology
+
+if TYPE_CHECKING:
+    # `kubernetes` takes long to import, it's imported where used so that listing tests (see `cli`) doesn't
+    from kubernetes.client import CoreV1Api, V1Pod, AppsV1Api, V1PodList
+    from kubernetes.watch import Watch
+    from .chaos import ChaosManager
+    from .journal import EventJournal
+    from .metrics import MetricsSampler
+    from .logs import LogCollector
+    from .pool import PodPool
+    from .workload import BackgroundWorkload
 
 DEFAULT_NAMESPACE = 'default'
 
@@ -20,12 +32,105 @@ def label_selector(label_dict: Dict[str, str]) -> str:
     return ','.join('{}={}'.format(*i) for i in label_dict.items())
 
 
+class PodWaiter:
+    """
+    State of waiting for `node_count` pods to run, fed by a list and the watch following it (see
+    `TestBed.wait_pods_running`), `resource_version` is None when pods have to be listed (again).
+    """
+
+    def __init__(self, node_count: int, since: float, ready_seconds: Dict[str, float],
+                 logger: logging.Logger) -> None:
+        self.node_count = node_count
+        self.since = since
+        self.ready_seconds = ready_seconds
+        self.logger = logger
+        self.pods: Dict[str, 'V1Pod'] = {}
+        self.resource_version: Optional[str] = None
+
+    def listed(self, pod_list) -> bool:
+        """
+        Replace known pods by a listing, returns whether all are running.
+        """
+        self.pods = {p.metadata.name: p for p in pod_list.items}
+        self.resource_version = pod_list.metadata.resource_version
+        return self.all_running()
+
+    def seen(self, event: dict) -> bool:
+        """
+        Apply a watch event, returns whether all pods are running.
+        """
+        pod: 'V1Pod' = event['object']
+        self.resource_version = pod.metadata.resource_version
+        if event['type'] == 'DELETED':
+            self.pods.pop(pod.metadata.name, None)
+        else:
+            self.pods[pod.metadata.name] = pod
+        return self.all_running()
+
+    def expired(self) -> None:
+        """
+        The resource version of the watch expired (410), pods are listed again.
+        """
+        self.logger.debug('pod watch expired, re-listing')
+        self.resource_version = None
+
+    def all_running(self) -> bool:
+        for p in self.pods.values():
+            if p.status.phase == 'Running' and p.metadata.name not in self.ready_seconds:
+                self.ready_seconds[p.metadata.name] = monotonic() - self.since
+                self.logger.debug('pod %s running after %.2fs', p.metadata.name, self.ready_seconds[p.metadata.name])
+        return len(self.pods) == self.node_count and all(p.status.phase == 'Running' for p in self.pods.values())
+
+    def done(self) -> List['V1Pod']:
+        # no pods to wait for, e.g. a test bed without nodes
+        self.logger.info('%d pods running in %.2fs', self.node_count, max(self.ready_seconds.values(), default=0.))
+        return list(self.pods.values())
+
+
+def tmux_command(cmd: str, session_name: Optional[str] = None) -> str:
+    tmux_cmd = ['tmux', 'new-session', '-d', cmd]
+    if session_name is not None:
+        tmux_cmd += ['-s', session_name]
+    return ' '.join(quote(i) for i in tmux_cmd)
+
+
+def kube_watch() -> 'Watch':
+    from kubernetes.watch import Watch
+    return Watch()
+
+
+def deployment_template(name: str, replicas: int, label: Dict[str, str]) -> dict:
+    return {'apiVersion': 'apps/v1', 'kind': 'Deployment',
+            'metadata': {'name': name},
+            'spec': {'replicas': replicas,
+                     'selector': {'matchLabels': label},
+                     'template': {'metadata': {'labels': label},
+                                  'spec': {
+                                      'containers': [
+                                          {'name': 'base', 'image': 'oraluben/tidb-poc',
+                                           'imagePullPolicy': 'Always',
+                                           'command': ['/bin/bash', '-c', '--'],
+                                           'args': ['sleep infinity'],
+                                           # for faults of `chaos.netem`
+                                           'securityContext': {'capabilities': {'add': ['NET_ADMIN']}}}]}}}}
+
+
 NodeType = Union[str, Type['Node']]
 
 
 class Node(LoggerMixin, CoreV1ApiMixin, ABC):
     image: str
     name: str
+    # service port, used to probe connectivity to this node
+    port: Optional[int] = None
+    # port of Prometheus metrics at `/metrics`, see `metrics.MetricsSampler`
+    metrics_port: Optional[int] = None
+    # paths in the pod (relative to the home directory) of log files, see `logs.LogCollector`
+    log_files: Tuple[str, ...] = ()
+    # stops whatever the node (of any type) started and removes its data, so the pod can be reused by another test
+    reset_command = 'tmux kill-server 2>/dev/null; true'
+    # exec sessions open at the same time, see `session.SessionPool`
+    max_sessions = 8
 
     def __repr__(self) -> str:
         return '<{} as {}>'.format(self.pod_name, self.__class__.__qualname__)
@@ -33,119 +138,386 @@ class Node(LoggerMixin, CoreV1ApiMixin, ABC):
     def is_type(self, other: NodeType):
         return self.name == (other if isinstance(other, str) else other.name)
 
-    def __init__(self, api_core_v1: CoreV1Api, pod: V1Pod, env: 'TestBed', **kwargs):
+    def __init__(self, api_core_v1: 'CoreV1Api', pod: 'V1Pod', env: 'TestBed', **kwargs):
         super().__init__(api_core_v1=api_core_v1, **kwargs)
         self._pod = pod
         self.env = env
+        self._sessions = SessionPool(self.new_session, self.max_sessions)
 
     @property
     def pod_name(self) -> str:
         return self._pod.metadata.name
 
+    @property
+    def namespace(self) -> str:
+        return self.env.namespace
+
     @property
     def pod_ip(self) -> str:
         return self._pod.status.pod_ip
 
     @property
-    def same_type_nodes(self):
-        assert self.__class__ in self.env.node_instances
-        return self.env.node_instances[self.__class__]
+    def metrics_url(self) -> Optional[str]:
+        if self.metrics_port is None:
+            return None
+        return 'http://{}:{}/metrics'.format(self.pod_ip, self.metrics_port)
+
+    @property
+    def ref(self) -> Tuple[str, int]:
+        # identifies the node across test beds of the same `node_def`
+        return self.name, self.index_of_env
 
     @property
-    def index_of_env(self):
-        assert self in self.same_type_nodes
-        return self.same_type_nodes.index(self)
-
-    def run_background_with_tmux(self, cmd: str, session_name: Optional[str] = None):
-        tmux_cmd = ['tmux', 'new-session', '-d', cmd]
-        if session_name is not None:
-            tmux_cmd += ['-s', session_name]
-        self.logger.debug('running {}'.format(tmux_cmd))
-        return stream(self.api_core_v1.connect_get_namespaced_pod_exec, namespace=DEFAULT_NAMESPACE,
-                      name=self.pod_name, command=tmux_cmd,
-                      stderr=True, stdin=False,
-                      stdout=True, tty=False)
+    def same_type_nodes(self) -> List['Node']:
+        return self.env.topology.role(self.__class__)
+
+    @property
+    def index_of_env(self) -> int:
+        return self.env.topology.index_of(self)
+
+    @property
+    def session(self) -> SessionPool:
+        """
+        Sessions running commands of this node, shared by all users (the test, metrics, log collection...).
+        """
+        return self._sessions
+
+    def new_session(self) -> ExecSession:
+        return ExecSession(self.api_core_v1, self.namespace, self.pod_name, exec_stream=self.env.exec_stream)
+
+    def close_session(self):
+        self._sessions.close()
+
+    def run(self, cmd: str, timeout: Optional[float] = None) -> ExecResult:
+        # env may be an `aio.AsyncTestBed`, without journal
+        journal = getattr(self.env, 'journal', None)
+        if journal is None:
+            return self.session.run(cmd, timeout)
+        try:
+            res = self.session.run(cmd, timeout)
+        except Exception as e:
+            journal.record('exec', 'command', logging.ERROR, node='{}-{}'.format(*self.ref), cmd=cmd, error=repr(e))
+            raise
+        level = logging.DEBUG if res.ok else logging.WARNING
+        # most commands succeed, skip building the event unless journaled
+        if journal.enabled('exec', level):
+            journal.record('exec', 'command', level, node='{}-{}'.format(*self.ref), cmd=cmd, rc=res.exit_code,
+                           seconds=res.seconds)
+        return res
+
+    @staticmethod
+    def reach_probe(other: 'Node', timeout: float = 1) -> str:
+        assert other.port is not None, '{} has no port to probe'.format(other)
+        return 'timeout {} bash -c "</dev/tcp/{}/{}"'.format(timeout, other.pod_ip, other.port)
+
+    def can_reach(self, other: 'Node', timeout: float = 1) -> bool:
+        return self.run(self.reach_probe(other, timeout)).ok
+
+    def run_background_with_tmux(self, cmd: str, session_name: Optional[str] = None) -> ExecResult:
+        tmux_cmd = tmux_command(cmd, session_name)
+        self.logger.debug('running %s', tmux_cmd)
+        return self.run(tmux_cmd)
+
+    @property
+    def start_command(self) -> str:
+        """
+        Command of the node process, run in background by `start`.
+        """
+        raise NotImplementedError()
 
     def start(self):
         raise NotImplementedError()
 
+    @property
+    def ready_probe(self) -> Optional[str]:
+        # command which succeeds once the node is ready, nodes without it are considered ready once started
+        return None
+
+    def is_ready(self) -> bool:
+        return self.ready_probe is None or self.run(self.ready_probe).ok
+
+    def wait_ready(self, timeout: float = 60, interval: float = 0.5):
+        deadline = monotonic() + timeout
+        while not self.is_ready():
+            if monotonic() > deadline:
+                raise TimeoutError('{} not ready after {} seconds'.format(self, timeout))
+            sleep(interval)
+
 
 class TestBed(LoggerMixin, CoreV1ApiMixin, AppsV1ApiMixin, ABC):
     label: Optional[Dict[str, str]] = None
+    deployment_name: Optional[str] = None
 
     @staticmethod
     def node_def() -> Dict[Type[Node], int]:
         raise NotImplementedError()
 
-    def create_deployment(self, node_count: int, wait_seconds=30, label: Optional[Dict[str, str]] = None) -> V1PodList:
+    def create_deployment(self, node_count: int, wait_seconds=300, label: Optional[Dict[str, str]] = None) \
+            -> 'V1PodList':
         if label is None:
             label = {
                 'dpl-random-pod-label': '0_{}_0'.format(hash(self))
             }
         self.label = label
         same_label_pods = self.api_core_v1.list_namespaced_pod(
-            namespace=DEFAULT_NAMESPACE,
+            namespace=self.namespace,
             label_selector=label_selector(label))
         assert len(same_label_pods.items) == 0
 
         dpl_name = 'dpl-name-{}'.format(strftime("%Y%m%d-%H%M%S"))
+        dpl_template = deployment_template(dpl_name, node_count, label)
 
-        dpl_template = {'apiVersion': 'apps/v1', 'kind': 'Deployment',
-                        'metadata': {'name': dpl_name},
-                        'spec': {'replicas': node_count,
-                                 'selector': {'matchLabels': label},
-                                 'template': {'metadata': {'labels': label},
-                                              'spec': {
-                                                  'containers': [
-                                                      {'name': 'base', 'image': 'oraluben/tidb-poc',
-                                                       'imagePullPolicy': 'Always',
-                                                       'command': ['/bin/bash', '-c', '--'],
-                                                       'args': ['sleep infinity']}]}}}}
-        self.logger.info('creating deployment {}'.format(dpl_name))
-        self.api_apps_v1.create_namespaced_deployment(namespace='default', body=dpl_template)
-
-        register(lambda: self.api_apps_v1.delete_namespaced_deployment(
-            namespace=DEFAULT_NAMESPACE, name=dpl_name))
+        self.logger.info('creating deployment %s', dpl_name)
+        created_at = monotonic()
+        self.api_apps_v1.create_namespaced_deployment(namespace=self.namespace, body=dpl_template)
+        self.deployment_name = dpl_name
+        register(self.destroy)
 
         self.logger.info('waiting for pods')
+        return self.wait_pods_running(label, node_count, wait_seconds, since=created_at)
+
+    def destroy(self):
+        """
+        Delete the deployment (or release claimed pods to the pool), otherwise it's done at exit.
+        """
+        if self.label_manager is not None:
+            self.label_manager.close()
+        if self.deployment_name is None and self.claim is None:
+            self.stop_journal()
+            return
+        # logs are gone with pods (or reset)
+        self.stop_log_collection()
+        self.stop_metrics()
+        self.stop_watch_topology()
+        if self.claim is not None:
+            self.release_pods()
+            self.stop_journal()
+            unregister(self.destroy)
+            return
+        from kubernetes.client.rest import ApiException
+        self.logger.info('deleting deployment %s', self.deployment_name)
+        try:
+            self.api_apps_v1.delete_namespaced_deployment(namespace=self.namespace, name=self.deployment_name)
+        except ApiException as e:
+            # e.g. its namespace is already deleted
+            if e.status != 404:
+                raise
+        self.deployment_name = None
+        self.stop_journal()
+        unregister(self.destroy)
+
+    pod_ready_seconds: Dict[str, float]
+
+    def wait_pods_running(self, label: Dict[str, str], node_count: int, wait_seconds: float,
+                          since: Optional[float] = None) -> 'V1PodList':
+        """
+        Wait until `node_count` pods matching `label` are running, driven by a watch on pods.
+
+        The watch is re-established from the last seen resource version when the server closes it, and re-listed
+        if that version has expired. Seconds from `since` to each pod running are kept in `pod_ready_seconds`.
+        """
+        from kubernetes.client import V1PodList
+        from kubernetes.client.rest import ApiException
+
+        selector = label_selector(label)
+        if since is None:
+            since = monotonic()
+        deadline = since + wait_seconds
+        self.pod_ready_seconds = {}
+        waiter = PodWaiter(node_count, since, self.pod_ready_seconds, self.logger)
+
+        while True:
+            if waiter.resource_version is None and waiter.listed(
+                    self.api_core_v1.list_namespaced_pod(namespace=self.namespace, label_selector=selector)):
+                break
 
-        ret: Optional[V1PodList] = None
-        for i in range(wait_seconds):
-            ret = self.api_core_v1.list_namespaced_pod(
-                namespace=DEFAULT_NAMESPACE,
-                label_selector=label_selector(label))
-            if len(ret.items) == node_count and all(i.status.phase == 'Running' for i in ret.items):
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                self.logger.error('pods not ready after %s seconds, got statuses: %s',
+                                  wait_seconds, [p.status.phase for p in waiter.pods.values()])
+                assert False
+
+            w = self.new_watch()
+            try:
+                for event in w.stream(self.api_core_v1.list_namespaced_pod, namespace=self.namespace,
+                                      label_selector=selector, resource_version=waiter.resource_version,
+                                      timeout_seconds=max(1, int(remaining))):
+                    if waiter.seen(event):
+                        w.stop()
+            except ApiException as e:
+                if e.status != 410:
+                    raise
+                waiter.expired()
+            if waiter.all_running():
                 break
-            else:
-                sleep(1)
-        else:
-            self.logger.error('pods not ready after {} seconds, got statuses: '.format(
-                wait_seconds,
-                [i.status.phase for i in ret.items]))
-            assert False
-        return ret
 
-    node_instances: Dict[Type[Node], List[Node]]
+        return V1PodList(items=waiter.done())
 
-    def __init__(self, api_core_v1: CoreV1Api, api_apps_v1: AppsV1Api, **kwargs):
+    node_instances: Dict[Type[Node], List[Node]]
+    topology: Topology
+    _topology_watch: Optional[Thread] = None
+    metrics: Optional['MetricsSampler'] = None
+    logs: Optional['LogCollector'] = None
+    journal: Optional['EventJournal'] = None
+    label_manager: Optional[LabelManager] = None
+    # id of pods claimed from `pool`
+    claim: Optional[str] = None
+
+    def __init__(self, api_core_v1: 'CoreV1Api', api_apps_v1: 'AppsV1Api', namespace: str = DEFAULT_NAMESPACE,
+                 pool: Optional['PodPool'] = None, new_watch: Optional[Callable[[], 'Watch']] = None,
+                 exec_stream: Optional[ExecStream] = None, **kwargs):
+        """
+        :param pool: claim pods from it (in its namespace) instead of creating a deployment, and release them back
+            by `destroy`
+        :param new_watch: creates pod watches, `kube_watch` by default
+        :param exec_stream: opens exec streams of node sessions, see `session.ExecSession`
+        """
         assert self.node_def
         super().__init__(api_core_v1=api_core_v1, api_apps_v1=api_apps_v1, **kwargs)
 
+        self.new_watch = kube_watch if new_watch is None else new_watch
+        self.exec_stream = exec_stream
+        self.pool = pool
+        self.namespace = namespace if pool is None else pool.namespace
         self.node_instances = {}
 
-        pods = self.create_deployment(sum(self.node_def().values()))
+        if pool is None:
+            pods = self.create_deployment(sum(self.node_def().values()))
+        else:
+            pods = self.claim_pods(sum(self.node_def().values()))
 
         for (t, c) in self.node_def().items():
             self.node_instances[t] = []
             for _ in range(c):
                 self.node_instances[t].append(t(self.api_core_v1, pods.items.pop(), self))
-
-    def start(self, interval: Optional[float] = None):
-        for (t, l) in self.node_instances.items():
-            for n in l:
-                n.start()
-                if interval is not None:
-                    sleep(interval)
+        self.topology = Topology(self.node_instances)
+        self.label_manager = LabelManager(self.api_core_v1, self.namespace, listener=self.topology.update_labels)
+
+    def claim_pods(self, node_count: int, wait_seconds: float = 300) -> 'V1PodList':
+        from kubernetes.client import V1PodList
+        begin = monotonic()
+        self.claim, pods = self.pool.claim(node_count, wait_seconds)
+        self.label = self.pool.claim_label(self.claim)
+        register(self.destroy)
+        self.logger.info('%s pods claimed in %.2fs', node_count, monotonic() - begin)
+        return V1PodList(items=pods)
+
+    def release_pods(self):
+        """
+        Reset every node and release its pod to the pool, pods failed to reset are discarded.
+        """
+        def reset(n: Node) -> bool:
+            try:
+                ok = n.run(n.reset_command, timeout=60).ok
+            except Exception as e:
+                self.logger.warning('failed to reset %s: %s', n, e)
+                ok = False
+            n.close_session()
+            return ok
+
+        nodes = self.topology.nodes()
+        with ThreadPoolExecutor(max_workers=len(nodes)) as pool:
+            reset_ok = list(pool.map(reset, nodes))
+        for (n, ok) in zip(nodes, reset_ok):
+            if not ok:
+                self.pool.discard(n.pod_name)
+        self.pool.release(n.pod_name for (n, ok) in zip(nodes, reset_ok) if ok)
+        self.logger.info('released %s pod(s) of claim %s', sum(reset_ok), self.claim)
+        self.claim = None
+
+    def node_at(self, role: str, index: int) -> Node:
+        """
+        Node by its `Node.ref`.
+        """
+        return self.topology.at(role, index)
+
+    def watch_topology(self):
+        """
+        Keep `topology` up to date with changes of pods (IP, labels and phase) by a pod watch in background.
+        """
+        if self._topology_watch is not None:
+            return
+
+        def run():
+            while self._topology_watch is not None:
+                w = self.new_watch()
+                try:
+                    # each round starts with the current state of all pods
+                    for event in w.stream(self.api_core_v1.list_namespaced_pod, namespace=self.namespace,
+                                          label_selector=label_selector(self.label), timeout_seconds=60):
+                        self.topology.update_pod(event['object'], deleted=event['type'] == 'DELETED')
+                        if self._topology_watch is None:
+                            w.stop()
+                except Exception as e:
+                    self.logger.warning('pod watch of topology failed, retrying: %s', e)
+                    sleep(1)
+
+        self._topology_watch = Thread(target=run, daemon=True)
+        self._topology_watch.start()
+
+    def stop_watch_topology(self):
+        self._topology_watch = None
+
+    def start_metrics(self, interval: float = 5, path: Optional[str] = None, **kwargs) -> 'MetricsSampler':
+        """
+        Sample metrics of all nodes in background as `metrics`, see `metrics.MetricsSampler` for arguments.
+        """
+        from .metrics import MetricsSampler
+        assert self.metrics is None
+        self.metrics = MetricsSampler(self, interval=interval, path=path, **kwargs).start()
+        return self.metrics
+
+    def stop_metrics(self):
+        if self.metrics is not None:
+            self.metrics.stop()
+
+    def start_log_collection(self, directory: str, **kwargs) -> 'LogCollector':
+        """
+        Collect `Node.log_files` of all nodes into `directory` in background as `logs`, until `stop_log_collection`
+        or `destroy`; see `logs.LogCollector` for arguments and `logs.LogStore` to read them.
+        """
+        from .logs import LogCollector
+        assert self.logs is None
+        self.logs = LogCollector(self, directory, **kwargs).start()
+        return self.logs
+
+    def stop_log_collection(self):
+        if self.logs is not None:
+            self.logs.stop()
+
+    def start_journal(self, path: str, **kwargs) -> 'EventJournal':
+        """
+        Journal events of the test (commands of nodes included) to `path` as `journal`, until `stop_journal` or
+        `destroy`; see `journal.EventJournal` for arguments.
+        """
+        from .journal import EventJournal
+        assert self.journal is None
+        self.journal = EventJournal(path, **kwargs).start()
+        return self.journal
+
+    def stop_journal(self):
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+
+    def start(self, max_workers: Optional[int] = None, ready_timeout: float = 60) -> Dict[Type[Node], float]:
+        """
+        Start all nodes role by role (in `node_def` order), returns seconds taken by each role.
+
+        Nodes of the same role are started concurrently, next role starts only after all nodes of current role
+        pass `Node.is_ready`.
+        """
+        phases: Dict[Type[Node], float] = {}
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            for (t, l) in self.node_instances.items():
+                begin = monotonic()
+                for _ in pool.map(lambda n: n.start(), l):
+                    pass
+                for _ in pool.map(lambda n: n.wait_ready(ready_timeout), l):
+                    pass
+                phases[t] = monotonic() - begin
+                self.logger.info('%s %s node(s) ready in %.2fs', len(l), t.name, phases[t])
+        return phases
 
 
 class TestAction(ABC):
@@ -165,6 +537,11 @@ class TestAction(ABC):
 
 class Test(LoggerMixin, CoreV1ApiMixin, AppsV1ApiMixin, ABC):
     env_instance: TestBed
+    result_path = 'results.jsonl.gz'
+    # events of actions, chaos and commands are journaled here if given, see `journal.EventJournal`
+    journal_path: Optional[str] = None
+    _results: Optional[ResultWriter] = None
+    _chaos_manager: Optional['ChaosManager'] = None
 
     @staticmethod
     def env() -> Type[TestBed]:
@@ -173,9 +550,21 @@ class Test(LoggerMixin, CoreV1ApiMixin, AppsV1ApiMixin, ABC):
     def test_actions(self) -> List[Type[TestAction]]:
         raise NotImplementedError()
 
-    def __init__(self, api_core_v1: CoreV1Api, api_apps_v1: AppsV1Api, **kwargs) -> None:
+    def __init__(self, api_core_v1: 'CoreV1Api', api_apps_v1: 'AppsV1Api', namespace: str = DEFAULT_NAMESPACE,
+                 pool: Optional['PodPool'] = None, new_watch: Optional[Callable[[], 'Watch']] = None,
+                 exec_stream: Optional[ExecStream] = None, **kwargs) -> None:
+        """
+        :param namespace: where pods (and NetworkPolicies of chaos operators) of this test are created
+        :param pool: where pods of the test bed are claimed from, see `TestBed`
+        :param new_watch: passed to the test bed, as `exec_stream` (see `TestBed`)
+        """
         super().__init__(api_core_v1=api_core_v1, api_apps_v1=api_apps_v1, **kwargs)
-        self.env_instance = self.env()(api_core_v1=self.api_core_v1, api_apps_v1=api_apps_v1, **kwargs)
+        self.namespace = namespace if pool is None else pool.namespace
+        # background workloads by name, see `actions.StartWorkload`
+        self.workloads: Dict[str, 'BackgroundWorkload'] = {}
+        self.env_instance = self.env()(api_core_v1=self.api_core_v1, api_apps_v1=api_apps_v1,
+                                       namespace=self.namespace, pool=pool, new_watch=new_watch,
+                                       exec_stream=exec_stream, **kwargs)
 
     def start(self):
         self.logger.info('initialing test environment')
@@ -185,40 +574,95 @@ class Test(LoggerMixin, CoreV1ApiMixin, AppsV1ApiMixin, ABC):
         self._run_test()
         self.logger.info('test finished, cleaning up...')
 
-    def _init_env(self, env_init_interval: Optional[int] = None):
-        self.env_instance.start(env_init_interval)
+    @property
+    def results(self) -> ResultWriter:
+        if self._results is None:
+            run_id = strftime('%Y%m%d-%H%M%S')
+            if self.namespace != DEFAULT_NAMESPACE:
+                # tests running at the same time are told apart by namespace
+                run_id = '{}-{}'.format(run_id, self.namespace)
+            self._results = ResultWriter(self.result_path, run_id=run_id)
+        return self._results
+
+    def new_chaos_manager(self) -> 'ChaosManager':
+        """
+        Override to create the chaos manager with other arguments, e.g. a seed or a timeline to record.
+        """
+        from .chaos import ChaosManager
+        return ChaosManager(self.env_instance)
+
+    @property
+    def chaos_manager(self) -> 'ChaosManager':
+        """
+        Chaos manager of this test, created (and started) on first use.
+        """
+        if self._chaos_manager is None:
+            self._chaos_manager = self.new_chaos_manager()
+            if self.env_instance.metrics is not None:
+                self.env_instance.metrics.attach(self._chaos_manager)
+            if self.env_instance.journal is not None:
+                self.env_instance.journal.attach(self._chaos_manager)
+        return self._chaos_manager
+
+    def chaos_state(self) -> str:
+        if self._chaos_manager is None:
+            return ''
+        return self._chaos_manager.active_state()
+
+    def _init_env(self):
+        if self.journal_path is not None and self.env_instance.journal is None:
+            self.env_instance.start_journal(self.journal_path, fields={'run': self.results.run_id})
+        self.env_instance.start()
+
+    def _run_action(self, action_instance: TestAction):
+        journal = self.env_instance.journal
+        if journal is None:
+            return action_instance.run_action()
+        name = action_instance.__class__.__name__
+        journal.record('action', 'start', action=name, chaos=self.chaos_state())
+        begin = monotonic()
+        try:
+            action_instance.run_action()
+        except BaseException as e:
+            journal.record('action', 'end', logging.ERROR, action=name, seconds=monotonic() - begin, error=repr(e))
+            raise
+        journal.record('action', 'end', action=name, seconds=monotonic() - begin, chaos=self.chaos_state())
 
     def _run_test(self):
         for action in self.test_actions():
             action_instance = action(test_instance=self)
-            self.logger.info('running {}'.format(action_instance.__class__.__name__))
-            action_instance.run_action()
-        from .chaos import ChaosManager
-        ChaosManager(self.env_instance).stop()
+            self.logger.info('running %s', action_instance.__class__.__name__)
+            self._run_action(action_instance)
+        for (name, workload) in self.workloads.items():
+            if workload.running:
+                self.logger.info('stopping workload %s left running', name)
+                workload.stop()
+        if self._chaos_manager is not None:
+            self._chaos_manager.close()
 
 
 V = TypeVar('V')
 
 
-def pop_random(l: List[V]) -> Optional[V]:
+def pop_random(l: List[V], rng: Optional[Random] = None) -> Optional[V]:
     if not l:
         return None
-    rand_idx = choice([i for i in range(len(l))])
-    return l.pop(rand_idx)
+    return l.pop((randrange if rng is None else rng.randrange)(len(l)))
 
 
 def get_label(node: Node) -> Dict[str, str]:
-    config.load_kube_config()
-    client.CoreV1Api()
-    return client.CoreV1Api().read_namespaced_pod(
+    return node.api_core_v1.read_namespaced_pod(
         name=node.pod_name,
-        namespace=DEFAULT_NAMESPACE).metadata.labels
+        namespace=node.namespace).metadata.labels
 
 
-def update_label(node: Node, labels: Dict[str, str]):
-    config.load_kube_config()
-    client.CoreV1Api()
-    return client.CoreV1Api().patch_namespaced_pod(
+def update_label(node: Node, labels: Dict[str, str]) -> 'V1Pod':
+    """
+    Merge `labels` into labels of the pod, unlike `LabelManager.add` they are not tracked to be removed.
+    """
+    pod = node.api_core_v1.patch_namespaced_pod(
         name=node.pod_name,
-        namespace=DEFAULT_NAMESPACE,
+        namespace=node.namespace,
         body={'metadata': {'labels': labels}})
+    node.env.topology.update_labels(node, labels)
+    return pod
@@ -1,4 +1,7 @@
+from typing import Callable
+
 from . import Test, TestAction
+from .workload import BackgroundWorkload
 
 
 class SleepAction(TestAction):
@@ -15,3 +18,38 @@ class BashAction(TestAction):
     def run_action(self):
         from subprocess import run
         run(['bash'])
+
+
+class StartWorkload(TestAction):
+    """
+    Start a workload running in background of following actions, as `Test.workloads[name]`.
+    """
+
+    def __init__(self, test_instance: 'Test', name: str, workload: Callable[['Test'], BackgroundWorkload],
+                 **kwargs) -> None:
+        super().__init__(test_instance, **kwargs)
+        self.name = name
+        self.workload = workload
+
+    def run_action(self):
+        running = self.test_instance.workloads.get(self.name)
+        self.assert_(running is None or not running.running, 'workload {} is already running'.format(self.name))
+        self.test_instance.workloads[self.name] = self.workload(self.test_instance).start()
+
+
+class StopWorkload(TestAction):
+    """
+    Stop `Test.workloads[name]` and log its throughput and latency of each interval.
+    """
+
+    def __init__(self, test_instance: 'Test', name: str, **kwargs) -> None:
+        super().__init__(test_instance, **kwargs)
+        self.name = name
+
+    def run_action(self):
+        workload = self.test_instance.workloads[self.name]
+        workload.stop()
+        for i in workload.intervals:
+            p99 = 'n/a' if i.latency.count == 0 else '{:.3f}s'.format(i.latency.percentile(99))
+            self.test_instance.logger.info('%s: %.1f ops/s, %s failed, p99 %s [%s]',
+                                           self.name, i.throughput, i.failed, p99, i.chaos)
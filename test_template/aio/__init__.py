@@ -0,0 +1,367 @@
+"""
+Asyncio counterpart of the framework core, on `kubernetes_asyncio`.
+
+Test beds are defined as usual (a `TestBed` subclass with `node_def`, and `Node` subclasses with `start_command` and
+`ready_probe`); here the nodes only describe what to run, while commands, labels and pod operations are coroutines
+driven by one event loop.
+"""
+import asyncio
+from abc import ABC
+from time import monotonic, strftime
+from typing import Optional, Dict, Type, List, Iterable
+from uuid import uuid4
+
+from kubernetes_asyncio.client import CoreV1Api, AppsV1Api, V1Pod
+from kubernetes_asyncio.client.rest import ApiException
+from kubernetes_asyncio.stream import WsApiClient
+from kubernetes_asyncio.watch import Watch
+
+from .. import DEFAULT_NAMESPACE, Node, TestBed, PodWaiter, label_selector, deployment_template, tmux_command
+from ..labels import _label_path, LabelListener
+from ..mixins import LoggerMixin, CoreV1ApiMixin, AppsV1ApiMixin
+from ..session import FRAME, ExecResult, MarkedOutput
+from ..topology import Topology
+
+STDIN, STDOUT, STDERR, ERROR = range(4)
+
+
+class AsyncExecSession(LoggerMixin, CoreV1ApiMixin):
+    """
+    Long-lived `bash` inside a pod over a websocket, see `session.ExecSession`.
+    """
+
+    def __init__(self, api_core_v1: CoreV1Api, namespace: str, pod_name: str, **kwargs) -> None:
+        """
+        :param api_core_v1: API client on a `WsApiClient`, exec is only available through websocket
+        """
+        super().__init__(api_core_v1=api_core_v1, **kwargs)
+        self.namespace = namespace
+        self.pod_name = pod_name
+        self._lock: Optional[asyncio.Lock] = None
+        self._ws = None
+
+    def __repr__(self) -> str:
+        return '<AsyncExecSession on {}>'.format(self.pod_name)
+
+    async def _connect(self):
+        self.logger.debug('opening shell on %s', self.pod_name)
+        ws = await self.api_core_v1.connect_get_namespaced_pod_exec(
+            namespace=self.namespace, name=self.pod_name, command=['bash'],
+            stderr=True, stdin=True, stdout=True, tty=False, _preload_content=False)
+        if not hasattr(ws, 'send_bytes'):
+            # `WsApiClient` returns the connect context (to be used by `async with`) instead of the websocket
+            ws = await ws
+        self._ws = ws
+
+    async def close(self):
+        if self._ws is not None:
+            await self._ws.close()
+            self._ws = None
+
+    async def _read(self, marker: str) -> ExecResult:
+        out = MarkedOutput(marker, with_exit_code=True)
+        err = MarkedOutput(marker, with_exit_code=False)
+        begin = monotonic()
+        while not out.done or not err.done:
+            msg = await self._ws.receive()
+            if not isinstance(msg.data, bytes):
+                self._ws = None
+                raise ConnectionError('shell on {} closed: {}'.format(self.pod_name, msg.type))
+            if not msg.data[1:]:
+                continue
+            (channel, data) = (msg.data[0], msg.data[1:].decode(errors='replace'))
+            if channel == STDOUT and not out.done:
+                out.feed(data)
+            elif channel == STDERR and not err.done:
+                err.feed(data)
+            elif channel == ERROR:
+                self.logger.warning('error from shell on %s: %s', self.pod_name, data)
+        return ExecResult(out.exit_code, out.text, err.text, monotonic() - begin)
+
+    async def run(self, cmd: str, timeout: Optional[float] = None) -> ExecResult:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._ws is None or self._ws.closed:
+                await self._connect()
+
+            marker = '__exec_{}__'.format(uuid4().hex)
+            await self._ws.send_bytes(bytes([STDIN]) + FRAME.format(cmd=cmd, marker=marker).encode())
+            try:
+                return await asyncio.wait_for(self._read(marker), timeout)
+            except asyncio.TimeoutError:
+                # the shell is still busy with the command, drop it
+                await self.close()
+                raise TimeoutError('`{}` on {} timed out after {} seconds'.format(cmd, self.pod_name, timeout))
+
+
+class AsyncLabelManager(LoggerMixin, CoreV1ApiMixin):
+    """
+    Async `labels.LabelManager`, at most `max_concurrency` patches are in flight.
+    """
+
+    def __init__(self, api_core_v1: CoreV1Api, namespace: str, max_concurrency: int = 16,
+                 listener: Optional[LabelListener] = None, **kwargs) -> None:
+        super().__init__(api_core_v1=api_core_v1, **kwargs)
+        self.namespace = namespace
+        self.max_concurrency = max_concurrency
+        self.listener = listener
+        self._sem: Optional[asyncio.Semaphore] = None
+        self._applied: Dict[str, Dict[str, str]] = {}
+
+    def applied(self, node: Node) -> Dict[str, str]:
+        return dict(self._applied.get(node.pod_name, {}))
+
+    async def _patch(self, node: Node, patch: List[dict]):
+        if not patch:
+            return
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self.max_concurrency)
+        async with self._sem:
+            await self.api_core_v1.patch_namespaced_pod(name=node.pod_name, namespace=self.namespace, body=patch)
+
+    async def add(self, nodes: Iterable[Node], labels: Dict[str, str]):
+        async def _add(n: Node):
+            await self._patch(n, [{'op': 'add', 'path': _label_path(k), 'value': v} for (k, v) in labels.items()])
+            self._applied.setdefault(n.pod_name, {}).update(labels)
+            if self.listener is not None:
+                self.listener(n, labels, [])
+
+        nodes = list(nodes)
+        self.logger.debug('adding labels %s on %d pod(s)', labels, len(nodes))
+        await asyncio.gather(*(_add(n) for n in nodes))
+
+    async def remove(self, nodes: Iterable[Node], keys: Iterable[str]):
+        keys = list(keys)
+
+        async def _remove(n: Node):
+            applied = self._applied.get(n.pod_name, {})
+            to_remove = [k for k in keys if k in applied]
+            await self._patch(n, [{'op': 'remove', 'path': _label_path(k)} for k in to_remove])
+            for k in to_remove:
+                applied.pop(k, None)
+            if to_remove and self.listener is not None:
+                self.listener(n, {}, to_remove)
+
+        nodes = list(nodes)
+        self.logger.debug('removing labels %s from %d pod(s)', keys, len(nodes))
+        await asyncio.gather(*(_remove(n) for n in nodes))
+
+
+class AsyncNode(LoggerMixin):
+    """
+    Runs what `node` describes through an `AsyncExecSession`.
+    """
+
+    def __init__(self, node: Node, session: AsyncExecSession, **kwargs) -> None:
+        super().__init__(logger_name=node.pod_name, **kwargs)
+        self.node = node
+        self.session = session
+
+    def __repr__(self) -> str:
+        return '<{} as async {}>'.format(self.node.pod_name, self.node.__class__.__qualname__)
+
+    async def run(self, cmd: str, timeout: Optional[float] = None) -> ExecResult:
+        return await self.session.run(cmd, timeout)
+
+    async def can_reach(self, other: 'AsyncNode', timeout: float = 1) -> bool:
+        return (await self.run(Node.reach_probe(other.node, timeout))).ok
+
+    async def run_background_with_tmux(self, cmd: str, session_name: Optional[str] = None) -> ExecResult:
+        tmux_cmd = tmux_command(cmd, session_name)
+        self.logger.debug('running %s', tmux_cmd)
+        return await self.run(tmux_cmd)
+
+    async def start(self):
+        await self.run_background_with_tmux(self.node.start_command)
+
+    async def is_ready(self) -> bool:
+        probe = self.node.ready_probe
+        return probe is None or (await self.run(probe)).ok
+
+    async def wait_ready(self, timeout: float = 60, interval: float = 0.5):
+        deadline = monotonic() + timeout
+        while not await self.is_ready():
+            if monotonic() > deadline:
+                raise TimeoutError('{} not ready after {} seconds'.format(self, timeout))
+            await asyncio.sleep(interval)
+
+
+class AsyncTestBed(LoggerMixin, CoreV1ApiMixin, AppsV1ApiMixin):
+    """
+    Test bed of `env.node_def()`, created by `create_deployment` and removed by `destroy`.
+
+    `node_instances` holds the `Node`s as in `TestBed` (so their commands can refer to each other), `async_nodes`
+    the `AsyncNode`s running them, both indexed by `topology` once created.
+    """
+    deployment_name: Optional[str] = None
+    label: Optional[Dict[str, str]] = None
+    topology: Optional[Topology] = None
+
+    def __init__(self, env: Type[TestBed], api_core_v1: CoreV1Api, api_apps_v1: AppsV1Api,
+                 namespace: str = DEFAULT_NAMESPACE, api_core_v1_ws: Optional[CoreV1Api] = None, **kwargs) -> None:
+        """
+        :param api_core_v1_ws: client for exec, default to one on a `WsApiClient` of the same configuration
+        """
+        super().__init__(api_core_v1=api_core_v1, api_apps_v1=api_apps_v1, **kwargs)
+        self.env = env
+        self.namespace = namespace
+        self._own_ws_client = api_core_v1_ws is None
+        if api_core_v1_ws is None:
+            api_core_v1_ws = CoreV1Api(api_client=WsApiClient(configuration=api_core_v1.api_client.configuration))
+        self.api_core_v1_ws = api_core_v1_ws
+        self.label_manager = AsyncLabelManager(api_core_v1, namespace)
+        self.node_instances: Dict[Type[Node], List[Node]] = {}
+        self.async_nodes: Dict[Type[Node], List[AsyncNode]] = {}
+        self.pod_ready_seconds: Dict[str, float] = {}
+
+    def node_at(self, role: str, index: int) -> Node:
+        return self.topology.at(role, index)
+
+    def async_node(self, node: Node) -> AsyncNode:
+        return self.async_nodes[node.__class__][node.index_of_env]
+
+    async def create_deployment(self, wait_seconds: float = 300):
+        node_def = self.env.node_def()
+        node_count = sum(node_def.values())
+        self.label = {'dpl-random-pod-label': '0_{}_0'.format(hash(self))}
+        self.deployment_name = 'dpl-name-{}'.format(strftime("%Y%m%d-%H%M%S"))
+
+        self.logger.info('creating deployment %s', self.deployment_name)
+        created_at = monotonic()
+        await self.api_apps_v1.create_namespaced_deployment(
+            namespace=self.namespace, body=deployment_template(self.deployment_name, node_count, self.label))
+        pods = await asyncio.wait_for(self.wait_pods_running(self.label, node_count, created_at), wait_seconds)
+
+        for (t, c) in node_def.items():
+            self.node_instances[t] = [t(self.api_core_v1, pods.pop(), self) for _ in range(c)]
+            self.async_nodes[t] = [AsyncNode(n, AsyncExecSession(self.api_core_v1_ws, self.namespace, n.pod_name))
+                                   for n in self.node_instances[t]]
+        self.topology = Topology(self.node_instances)
+        self.label_manager.listener = self.topology.update_labels
+
+    async def wait_pods_running(self, label: Dict[str, str], node_count: int, since: float) -> List[V1Pod]:
+        """
+        See `TestBed.wait_pods_running`, without deadline (cancel it instead).
+        """
+        selector = label_selector(label)
+        waiter = PodWaiter(node_count, since, self.pod_ready_seconds, self.logger)
+
+        while True:
+            if waiter.resource_version is None and waiter.listed(
+                    await self.api_core_v1.list_namespaced_pod(namespace=self.namespace, label_selector=selector)):
+                break
+
+            try:
+                async with Watch().stream(self.api_core_v1.list_namespaced_pod, namespace=self.namespace,
+                                          label_selector=selector, resource_version=waiter.resource_version) as stream:
+                    async for event in stream:
+                        if waiter.seen(event):
+                            break
+            except ApiException as e:
+                if e.status != 410:
+                    raise
+                waiter.expired()
+            if waiter.all_running():
+                break
+
+        return waiter.done()
+
+    async def start(self, ready_timeout: float = 60) -> Dict[Type[Node], float]:
+        """
+        Start all nodes role by role as `TestBed.start`, nodes of the same role are gathered.
+        """
+        phases: Dict[Type[Node], float] = {}
+        for (t, l) in self.async_nodes.items():
+            begin = monotonic()
+            await asyncio.gather(*(n.start() for n in l))
+            await asyncio.gather(*(n.wait_ready(ready_timeout) for n in l))
+            phases[t] = monotonic() - begin
+            self.logger.info('%s %s node(s) ready in %.2fs', len(l), t.name, phases[t])
+        return phases
+
+    async def destroy(self):
+        try:
+            await asyncio.gather(*(n.session.close() for l in self.async_nodes.values() for n in l))
+            if self.deployment_name is None:
+                return
+            self.logger.info('deleting deployment %s', self.deployment_name)
+            try:
+                await self.api_apps_v1.delete_namespaced_deployment(namespace=self.namespace,
+                                                                    name=self.deployment_name)
+            except ApiException as e:
+                if e.status != 404:
+                    raise
+            self.deployment_name = None
+        finally:
+            # also when the deployment was never created, or creating it failed
+            if self._own_ws_client:
+                self._own_ws_client = False
+                await self.api_core_v1_ws.api_client.close()
+
+
+class AsyncTestAction(ABC):
+    test_instance: 'AsyncTest'
+
+    def __init__(self, test_instance: 'AsyncTest', **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.test_instance = test_instance
+
+    async def run_action(self):
+        raise NotImplementedError()
+
+
+class AsyncTest(LoggerMixin, CoreV1ApiMixin, AppsV1ApiMixin, ABC):
+    """
+    Async `Test`: `await test.start()` creates the test bed of `env()`, runs `test_actions` and removes the test bed.
+    """
+    env_instance: AsyncTestBed
+    _chaos_manager = None
+
+    @staticmethod
+    def env() -> Type[TestBed]:
+        raise NotImplementedError()
+
+    def test_actions(self) -> List[Type[AsyncTestAction]]:
+        raise NotImplementedError()
+
+    def __init__(self, api_core_v1: CoreV1Api, api_apps_v1: AppsV1Api, namespace: str = DEFAULT_NAMESPACE,
+                 api_core_v1_ws: Optional[CoreV1Api] = None, **kwargs) -> None:
+        super().__init__(api_core_v1=api_core_v1, api_apps_v1=api_apps_v1, **kwargs)
+        self.namespace = namespace
+        self.env_instance = AsyncTestBed(self.env(), api_core_v1, api_apps_v1, namespace, api_core_v1_ws)
+
+    def new_chaos_manager(self):
+        """
+        Override to create the chaos manager with other arguments, e.g. a seed or a timeline to record or replay.
+        """
+        from .chaos import AsyncChaosManager
+        return AsyncChaosManager(self.env_instance)
+
+    @property
+    def chaos_manager(self):
+        """
+        `aio.chaos.AsyncChaosManager` of this test, created on first use.
+        """
+        if self._chaos_manager is None:
+            self._chaos_manager = self.new_chaos_manager()
+        return self._chaos_manager
+
+    def chaos_state(self) -> str:
+        return '' if self._chaos_manager is None else self._chaos_manager.active_state()
+
+    async def start(self):
+        self.logger.info('initialing test environment')
+        try:
+            await self.env_instance.create_deployment()
+            await self.env_instance.start()
+            self.logger.info('start testing')
+            for action in self.test_actions():
+                action_instance = action(test_instance=self)
+                self.logger.info('running %s', action_instance.__class__.__name__)
+                await action_instance.run_action()
+        finally:
+            self.logger.info('test finished, cleaning up...')
+            if self._chaos_manager is not None:
+                await self._chaos_manager.close()
+            await self.env_instance.destroy()
@@ -0,0 +1,296 @@
+"""
+Coroutine-based chaos: operators and a manager driving each operator's arrivals as a task of the event loop.
+
+Scheduling decisions, and the choices and state of operators, are shared with `chaos` (see `chaos.BaseChaosManager`,
+`chaos.operators.NodeOfflineBase` and `chaos.operators.NetworkPartitionBase`); only the I/O is done here.
+"""
+import asyncio
+from abc import ABC
+from functools import wraps
+from time import time, monotonic
+from typing import Optional, Any, List, Dict, Tuple
+
+from kubernetes_asyncio.client.rest import ApiException
+
+from . import AsyncTestBed, AsyncTestAction, AsyncNode
+from ..chaos import BaseChaosManager, OperatorSchedule
+from ..chaos.operators import NodeOfflineBase, NetworkPartitionBase, ReachabilityWait
+from ..chaos.rules import ConflictRule
+from ..chaos.schedule import Arrival
+from ..chaos.timing import FaultTiming
+
+
+def _timed(phase: str, func):
+    @wraps(func)
+    async def wrapper(self: 'AsyncChaosOperator', *args, **kwargs):
+        if self._timing:
+            return await func(self, *args, **kwargs)
+        self._timing = True
+        try:
+            issued_at, issued_mono = time(), monotonic()
+            ret = await func(self, *args, **kwargs)
+            acked_at = time()
+            effective_at = await self.confirm(phase == 'activate')
+        finally:
+            self._timing = False
+        self._mgr.transitioned(self, phase, issued_mono, FaultTiming(
+            self.__class__.__name__, phase, issued_at, acked_at, effective_at))
+        return ret
+
+    return wrapper
+
+
+class AsyncChaosOperator(ABC):
+    """
+    `chaos.ChaosOperator` with coroutine `activate`, `deactivate` and `confirm`, timed the same way.
+    """
+    _mgr: 'AsyncChaosManager'
+    _timing: bool = False
+    targets: Optional[Any] = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        for phase in ('activate', 'deactivate'):
+            if phase in cls.__dict__:
+                setattr(cls, phase, _timed(phase, cls.__dict__[phase]))
+
+    def __init__(self, chaos_manager: 'AsyncChaosManager', **kwargs) -> None:
+        super().__init__(**kwargs)
+        self._mgr = chaos_manager
+
+    async def confirm(self, active: bool) -> Optional[float]:
+        return None
+
+    async def activate(self, targets: Optional[Any] = None):
+        raise NotImplementedError()
+
+    async def deactivate(self):
+        raise NotImplementedError()
+
+    @property
+    def tag(self) -> str:
+        return self.__class__.__name__
+
+    @property
+    def can_activate(self) -> bool:
+        raise NotImplementedError()
+
+    @property
+    def can_deactivate(self) -> bool:
+        return not self.can_activate
+
+
+class AsyncChaosManager(BaseChaosManager):
+    """
+    Same scheduling as `chaos.ChaosManager` (arrivals, durations, `max_active_faults`, rules, record and replay),
+    without threads: every added operator has a task waiting for its arrivals, and transitions are tasks of their own.
+    Replayed events are applied one after another, each waiting for the transition of its operator in flight.
+    """
+
+    def __init__(self, env: AsyncTestBed, seed: Optional[int] = None, record: Optional[str] = None,
+                 replay: Optional[str] = None, max_active_faults: Optional[int] = None,
+                 rules: Optional[List[ConflictRule]] = None) -> None:
+        super().__init__(env, seed=seed, record=record, replay=replay, max_active_faults=max_active_faults,
+                         rules=rules)
+        # id of operator -> task waiting for its arrivals
+        self._drivers: Dict[int, asyncio.Task] = {}
+        # id of operator -> (action, task) in flight
+        self._busy: Dict[int, Tuple[str, asyncio.Task]] = {}
+        # id of operator -> task of its scheduled deactivation
+        self._timers: Dict[int, asyncio.Task] = {}
+        self._replayer: Optional[asyncio.Task] = None
+
+    def add_chaos_operator(self, op: AsyncChaosOperator, arrival: Optional[Arrival] = None,
+                           min_duration: Optional[float] = None, max_duration: Optional[float] = None):
+        """
+        See `chaos.ChaosManager.add_chaos_operator`, must be called from the event loop.
+        """
+        schedule = self._new_schedule(op, arrival, min_duration, max_duration)
+        if self._replay is None:
+            self._drivers[id(op)] = asyncio.ensure_future(self._drive(op, schedule))
+        elif self._replayer is None:
+            # offsets are still from the creation of the manager
+            self._replayer = asyncio.ensure_future(self._replay_timeline())
+
+    async def remove_chaos_operator(self, op: AsyncChaosOperator):
+        driver = self._drivers.pop(id(op), None)
+        if driver is not None:
+            driver.cancel()
+        if id(op) in self._timers:
+            self._timers.pop(id(op)).cancel()
+        await self._wait_idle(op)
+        self.ops.remove(op)
+        if op.can_deactivate:
+            await op.deactivate()
+
+    async def _wait_idle(self, op: AsyncChaosOperator):
+        while id(op) in self._busy:
+            await asyncio.wait([self._busy[id(op)][1]])
+
+    def busy_action(self, op: AsyncChaosOperator) -> Optional[str]:
+        return self._busy[id(op)][0] if id(op) in self._busy else None
+
+    async def _drive(self, op: AsyncChaosOperator, schedule: OperatorSchedule):
+        rng = self.random_of(op, 'arrival')
+        while True:
+            await asyncio.sleep(schedule.next_delay(rng))
+            if id(op) in self._busy:
+                self.logger.debug('%s is busy, skipped', op)
+                continue
+            action = self.decide(op, 'arrival', schedule)
+            if action is not None:
+                self._submit(op, action, schedule if action == 'activate' else None)
+
+    async def _replay_timeline(self):
+        for event in self._replay:
+            await asyncio.sleep(max(0., self._started_at + event.offset - monotonic()))
+            op = self.replayed_op(event)
+            if op is None:
+                continue
+            await self._wait_idle(op)
+            if event.action == 'activate' and not (op.can_activate and self.may_activate(op)):
+                continue
+            if event.action == 'deactivate' and not op.can_deactivate:
+                continue
+            self._submit(op, event.action, targets=event.targets)
+
+    def _submit(self, op: AsyncChaosOperator, action: str, schedule: Optional[OperatorSchedule] = None,
+                targets: Optional[Any] = None):
+        self._busy[id(op)] = (action, asyncio.ensure_future(self._transition(op, action, schedule, targets)))
+
+    async def _transition(self, op: AsyncChaosOperator, action: str, schedule: Optional[OperatorSchedule],
+                          targets: Optional[Any]):
+        try:
+            self.logger.info('%s %s', 'activating' if action == 'activate' else 'deactivating', op)
+            if action == 'activate' and targets is not None:
+                await op.activate(targets=targets)
+            else:
+                await getattr(op, action)()
+        except Exception as e:
+            self.logger.exception('failed to %s %s: %s', action, op, e)
+        finally:
+            self._busy.pop(id(op), None)
+        if schedule is not None and schedule.min_duration is not None and id(op) in self._drivers:
+            self._timers[id(op)] = asyncio.ensure_future(self._deactivate_later(
+                op, self.random_of(op, 'duration').uniform(schedule.min_duration, schedule.max_duration)))
+
+    async def _deactivate_later(self, op: AsyncChaosOperator, delay: float):
+        await asyncio.sleep(delay)
+        await self._wait_idle(op)
+        self._timers.pop(id(op), None)
+        if op.can_deactivate:
+            self._submit(op, 'deactivate')
+
+    async def close(self):
+        """
+        Stop all arrivals (and the replay), wait for transitions in flight, then deactivate operators still active.
+        """
+        if self._replayer is not None:
+            self._replayer.cancel()
+        for op in list(self.ops):
+            await self.remove_chaos_operator(op)
+        self.close_recorder()
+
+
+async def wait_reachable(pair: Optional[Tuple[AsyncNode, AsyncNode]], reachable: bool,
+                         timeout: float) -> Optional[float]:
+    """
+    Async `chaos.operators.wait_reachable`.
+    """
+    if pair is None:
+        return None
+    wait = ReachabilityWait(pair, reachable, timeout)
+    while True:
+        probed_at = time()
+        if wait.done(probed_at, await pair[0].can_reach(pair[1])):
+            return wait.result
+
+
+class AsyncNodeOffline(NodeOfflineBase, AsyncChaosOperator):
+    """
+    Async `chaos.operators.NodeOffline`.
+    """
+
+    async def activate(self, targets: Optional[Any] = None):
+        (new_label, policy) = self._take_offline(targets)
+        env = self._mgr.env
+        try:
+            await env.label_manager.add([self.offline_node], new_label)
+            await self.api_net_v1.create_namespaced_network_policy(namespace=env.namespace, body=policy)
+        except Exception:
+            self.logger.warning('failed to take %s offline, undoing', self.offline_node)
+            try:
+                await env.label_manager.remove([self.offline_node], [self.offline_label_key])
+            finally:
+                self._back_online()
+            raise
+
+    async def deactivate(self):
+        self.logger.info('deleting NetworkPolicy %s', self.offline_policy_name)
+        try:
+            await self.api_net_v1.delete_namespaced_network_policy(namespace=self._mgr.env.namespace,
+                                                                   name=self.offline_policy_name)
+        except ApiException as e:
+            if e.status != 404:
+                raise
+        await self._mgr.env.label_manager.remove([self.offline_node], [self.offline_label_key])
+        self._back_online()
+
+    async def confirm(self, active: bool) -> Optional[float]:
+        pair = self._probe_nodes()
+        if pair is not None:
+            pair = tuple(self._mgr.env.async_node(n) for n in pair)
+        return await wait_reachable(pair, not active, self.probe_timeout)
+
+
+class AsyncNetworkPartition(NetworkPartitionBase, AsyncChaosOperator):
+    """
+    Async `chaos.operators.NetworkPartition`.
+    """
+
+    async def activate(self, targets: Optional[Any] = None):
+        self._partition(targets)
+        env = self._mgr.env
+        # label both regions first, policies select pods by these labels
+        await asyncio.gather(*(env.label_manager.add(self.regions[ri], self._region_label(ri)) for ri in (0, 1)))
+        await asyncio.gather(*(self.api_net_v1.create_namespaced_network_policy(
+            namespace=env.namespace, body=self._region_policy(ri)) for ri in (0, 1)))
+        self.logger.info('partitioned %s by %s', self.regions, self.region_policy_names)
+
+    async def _delete_region_policy(self, ri: int):
+        try:
+            await self.api_net_v1.delete_namespaced_network_policy(namespace=self._mgr.env.namespace,
+                                                                   name=self.region_policy_names[ri])
+        except ApiException as e:
+            if e.status != 404:
+                raise
+
+    async def deactivate(self):
+        self.logger.info('deleting regions %s', self.region_policy_names)
+        await asyncio.gather(*(self._delete_region_policy(ri) for ri in (0, 1)))
+        await self._mgr.env.label_manager.remove(sum(self.regions, []), [self.region_label_key])
+        self._healed()
+
+    async def confirm(self, active: bool) -> Optional[float]:
+        pair = self.probe_pair
+        if pair is not None:
+            pair = tuple(self._mgr.env.async_node(n) for n in pair)
+        return await wait_reachable(pair, not active, self.probe_timeout)
+
+
+class AsyncChaosAction(AsyncTestAction, ABC):
+    operator: AsyncChaosOperator
+
+    def __init__(self, test_instance, chaos_operator: AsyncChaosOperator, **kwargs) -> None:
+        super().__init__(test_instance, **kwargs)
+        self.operator = chaos_operator
+
+
+class AsyncUp(AsyncChaosAction):
+    async def run_action(self):
+        self.test_instance.chaos_manager.add_chaos_operator(self.operator)
+
+
+class AsyncDown(AsyncChaosAction):
+    async def run_action(self):
+        await self.test_instance.chaos_manager.remove_chaos_operator(self.operator)
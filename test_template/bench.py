@@ -0,0 +1,170 @@
+"""
+Benchmarks of the framework's own control plane against `fake.FakeCluster`.
+
+    python -m test_template.bench -o bench.json
+    python -m test_template.bench -o new.json --compare bench.json
+"""
+import json
+import logging
+from argparse import ArgumentParser
+from subprocess import run, PIPE
+from time import monotonic, strftime, sleep
+from typing import Dict, Type, List, Optional, Callable
+
+from . import TestBed, Node, get_label
+from .chaos import ChaosManager, ChaosOperator
+from .chaos.operators import NodeOffline, NetworkPartition
+from .chaos.schedule import Fixed
+from .fake import FakeCluster
+from .logger import init_logger
+from .nodes import PdNode, KvNode, DbNode
+
+
+def _env_cls(node_count: int) -> Type[TestBed]:
+    class BenchEnv(TestBed):
+        @staticmethod
+        def node_def() -> Dict[Type[Node], int]:
+            return {PdNode: 3, KvNode: node_count - 4, DbNode: 1}
+
+    return BenchEnv
+
+
+class _Toggle(ChaosOperator):
+    active = False
+
+    def activate(self):
+        self.active = True
+
+    def deactivate(self):
+        self.active = False
+
+    @property
+    def can_activate(self) -> bool:
+        return not self.active
+
+
+def _bed_apis(apis: dict) -> dict:
+    # of `TestBed`, operators take `api_net_v1`
+    return {k: v for (k, v) in apis.items() if k != 'api_net_v1'}
+
+
+def bench_test_bed(cluster: FakeCluster, node_count: int) -> dict:
+    apis = cluster.apis()
+    begin = monotonic()
+    env = _env_cls(node_count)(**_bed_apis(apis))
+    created = monotonic() - begin
+    phases = env.start()
+    return {'create_seconds': created, 'start_seconds': monotonic() - begin - created,
+            'phase_seconds': {t.name: s for (t, s) in phases.items()}}
+
+
+def bench_operators(cluster: FakeCluster, node_count: int, rounds: int) -> dict:
+    apis = cluster.apis()
+    env = _env_cls(node_count)(**_bed_apis(apis))
+    # no operator is added to it, so nothing is triggered by its worker
+    mgr = ChaosManager(env)
+    ops = [NodeOffline(mgr, node_type='kv', api_net_v1=apis['api_net_v1']),
+           NetworkPartition(mgr, api_net_v1=apis['api_net_v1'])]
+    for op in ops:
+        for _ in range(rounds):
+            op.activate()
+            op.deactivate()
+    mgr.close()
+    return mgr.timings.to_dict()
+
+
+def bench_labels(cluster: FakeCluster, node_count: int) -> dict:
+    apis = cluster.apis()
+    env = _env_cls(node_count)(**_bed_apis(apis))
+    nodes = env.topology.nodes()
+
+    begin = monotonic()
+    # read-modify-write of every pod, as labels used to be updated
+    for n in nodes:
+        labels = get_label(n)
+        labels['bench-label'] = '0'
+        n.api_core_v1.patch_namespaced_pod(name=n.pod_name, namespace=n.namespace,
+                                           body={'metadata': {'labels': labels}})
+    read_patch = monotonic() - begin
+
+    begin = monotonic()
+    env.label_manager.add(nodes, {'bench-label-2': '0'})
+    env.label_manager.remove(nodes, ['bench-label-2'])
+    return {'read_patch_seconds': read_patch, 'manager_add_remove_seconds': monotonic() - begin}
+
+
+def bench_decisions(cluster: FakeCluster, op_count: int, seconds: float) -> dict:
+    apis = cluster.apis()
+    env = _env_cls(7)(**_bed_apis(apis))
+    begin = monotonic()
+    mgr = ChaosManager(env, max_workers=8)
+    for _ in range(op_count):
+        mgr.add_chaos_operator(_Toggle(mgr), arrival=Fixed(1e-6))
+    sleep(seconds)
+    mgr.stop()
+    mgr.worker.join()
+    return {'decisions_per_second': len(mgr.timings.records) / (monotonic() - begin)}
+
+
+def run_all(node_counts: List[int], rounds: int, latency: float) -> dict:
+    def cluster() -> FakeCluster:
+        return FakeCluster(latency=latency, seed=0)
+
+    results = {}
+    for c in node_counts:
+        results['test_bed/{}'.format(c)] = bench_test_bed(cluster(), c)
+        results['operators/{}'.format(c)] = bench_operators(cluster(), c, rounds)
+        results['labels/{}'.format(c)] = bench_labels(cluster(), c)
+    results['chaos_manager/decisions'] = bench_decisions(cluster(), 16, 1)
+    return results
+
+
+def _flatten(d: dict, prefix: str = '') -> Dict[str, float]:
+    ret = {}
+    for (k, v) in d.items():
+        key = '{}{}'.format(prefix, k)
+        if isinstance(v, dict):
+            ret.update(_flatten(v, key + '/'))
+        elif isinstance(v, (int, float)) and not isinstance(v, bool):
+            ret[key] = v
+    return ret
+
+
+def compare(base: dict, new: dict, only: Optional[Callable[[str], bool]] = None):
+    """
+    Print metrics of two result files side by side, with ratio new / base.
+    """
+    (b, n) = (_flatten(base['results']), _flatten(new['results']))
+    for key in sorted(set(b) & set(n)):
+        if only is not None and not only(key):
+            continue
+        ratio = n[key] / b[key] if b[key] else float('nan')
+        print('{:<80} {:>14.6g} {:>14.6g} {:>8.3f}'.format(key, b[key], n[key], ratio))
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('-o', '--output', required=True, help='result file (JSON)')
+    parser.add_argument('-n', '--node-counts', type=int, nargs='+', default=[7, 25, 50, 100])
+    parser.add_argument('-r', '--rounds', type=int, default=10, help='activate/deactivate rounds per operator')
+    parser.add_argument('-l', '--latency', type=float, default=0.002, help='seconds added to each API call')
+    parser.add_argument('--compare', help='previous result file to compare with')
+    args = parser.parse_args()
+
+    init_logger()
+    logging.disable(logging.INFO)
+    commit = run(['git', 'rev-parse', 'HEAD'], stdout=PIPE, stderr=PIPE, universal_newlines=True).stdout.strip()
+    result = {'commit': commit, 'time': strftime('%Y-%m-%dT%H:%M:%S'),
+              'params': {'node_counts': args.node_counts, 'rounds': args.rounds, 'latency': args.latency},
+              'results': run_all(args.node_counts, args.rounds, args.latency)}
+    with open(args.output, 'w') as f:
+        json.dump(result, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            # bucket counts are not comparable metrics
+            compare(json.load(f), result, only=lambda k: '/buckets/' not in k)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic
+from typing import NamedTuple, Optional, List, Type, Tuple
+from uuid import uuid4
+
+from kubernetes.client import CoreV1Api, AppsV1Api
+from kubernetes.client.rest import ApiException
+
+from . import Test
+from .mixins import LoggerMixin, CoreV1ApiMixin, AppsV1ApiMixin
+
+
+class CampaignResult(NamedTuple):
+    test: str
+    namespace: str
+    seconds: float
+    # repr of the exception failed the test, None if passed
+    error: Optional[str]
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+class Campaign(LoggerMixin, CoreV1ApiMixin, AppsV1ApiMixin):
+    """
+    Run tests in parallel, each in a namespace of its own which is deleted after the test.
+
+    With a `pool.PodPool` passed as `pool`, tests claim pods from it instead, all in the namespace of the pool.
+    """
+
+    def __init__(self, api_core_v1: CoreV1Api, api_apps_v1: AppsV1Api, max_parallel: int = 4,
+                 namespace_prefix: str = 'chaos', **test_kwargs) -> None:
+        """
+        :param test_kwargs: passed to every test, e.g. `api_net_v1` for tests with chaos operators
+        """
+        super().__init__(api_core_v1=api_core_v1, api_apps_v1=api_apps_v1)
+        self.max_parallel = max_parallel
+        self.namespace_prefix = namespace_prefix
+        self.test_kwargs = test_kwargs
+        self.tests: List[Tuple[Type[Test], dict]] = []
+
+    def add(self, test: Type[Test], **kwargs) -> 'Campaign':
+        self.tests.append((test, kwargs))
+        return self
+
+    def _create_namespace(self, index: int) -> str:
+        name = '{}-{}-{}'.format(self.namespace_prefix, index, uuid4().hex[:8])
+        self.api_core_v1.create_namespace(body={'apiVersion': 'v1', 'kind': 'Namespace', 'metadata': {'name': name}})
+        return name
+
+    def _delete_namespace(self, name: str):
+        try:
+            self.api_core_v1.delete_namespace(name=name)
+        except ApiException as e:
+            if e.status != 404:
+                raise
+
+    def _run_one(self, index: int, test: Type[Test], kwargs: dict) -> CampaignResult:
+        pool = dict(self.test_kwargs, **kwargs).get('pool')
+        namespace = self._create_namespace(index) if pool is None else pool.namespace
+        self.logger.info('running %s in namespace %s', test.__name__, namespace)
+        begin = monotonic()
+        error = None
+        test_instance = None
+        try:
+            test_instance = test(api_core_v1=self.api_core_v1, api_apps_v1=self.api_apps_v1, namespace=namespace,
+                                 **dict(self.test_kwargs, **kwargs))
+            test_instance.start()
+        except Exception as e:
+            self.logger.exception('%s in namespace %s failed', test.__name__, namespace)
+            error = repr(e)
+        finally:
+            # each step of the teardown runs even if the previous one raised, the namespace is deleted last
+            try:
+                if test_instance is not None:
+                    try:
+                        if test_instance._chaos_manager is not None:
+                            test_instance._chaos_manager.close()
+                    finally:
+                        test_instance.env_instance.destroy()
+            finally:
+                if pool is None:
+                    self._delete_namespace(namespace)
+        result = CampaignResult(test.__name__, namespace, monotonic() - begin, error)
+        self.logger.info('%s in namespace %s %s in %.1fs', test.__name__, namespace,
+                         'passed' if result.ok else 'failed', result.seconds)
+        return result
+
+    def run(self) -> List[CampaignResult]:
+        """
+        Run all added tests, at most `max_parallel` at the same time; results are in the order tests are added.
+        """
+        with ThreadPoolExecutor(max_workers=self.max_parallel) as pool:
+            results = list(pool.map(lambda a: self._run_one(a[0], *a[1]), enumerate(self.tests)))
+        self.logger.info('%s/%s tests passed', sum(1 for r in results if r.ok), len(results))
+        return results
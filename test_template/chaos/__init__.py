@@ -1,25 +1,75 @@
 from abc import ABC
-from random import choice, random
-from threading import Thread
-from time import sleep
-from typing import Optional, List
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+from heapq import heappush, heappop
+from itertools import count
+from random import Random, SystemRandom
+from threading import Thread, Condition
+from time import time, monotonic
+from typing import Optional, List, NamedTuple, Dict, Tuple, Any, Callable, Iterator
 
 from test_template import TestBed, TestAction, Test, LoggerMixin
+from .rules import ConflictRule, PdMajorityRule
+from .schedule import Arrival, Poisson, Randoms
+from .timeline import TimelineEvent, TimelineRecorder, load_timeline
+from .timing import ChaosTimings, FaultTiming
+
+
+def _timed(phase: str, func):
+    @wraps(func)
+    def wrapper(self: 'ChaosOperator', *args, **kwargs):
+        if self._timing:
+            # called through super() from an overriding subclass, already timed
+            return func(self, *args, **kwargs)
+        self._timing = True
+        try:
+            issued_at, issued_mono = time(), monotonic()
+            ret = func(self, *args, **kwargs)
+            acked_at = time()
+            effective_at = self.confirm(phase == 'activate')
+        finally:
+            self._timing = False
+        self._mgr.transitioned(self, phase, issued_mono, FaultTiming(
+            self.__class__.__name__, phase, issued_at, acked_at, effective_at))
+        return ret
+
+    return wrapper
 
 
 class ChaosOperator(ABC):
     _mgr: 'ChaosManager'
+    _timing: bool = False
+    # what the last activation was applied on, JSON serializable with nodes as `Node.ref`; passed back to `activate`
+    # to reproduce it
+    targets: Optional[Any] = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # every activate/deactivate is timed, see `ChaosManager.timings`
+        for phase in ('activate', 'deactivate'):
+            if phase in cls.__dict__:
+                setattr(cls, phase, _timed(phase, cls.__dict__[phase]))
 
     def __init__(self, chaos_manager: 'ChaosManager', **kwargs) -> None:
         super().__init__(**kwargs)
         self._mgr = chaos_manager
 
-    def activate(self):
+    def confirm(self, active: bool) -> Optional[float]:
+        """
+        Wait until the fault is observed to be (in)active, returns the time it was observed or None if unknown.
+        """
+        return None
+
+    def activate(self, targets: Optional[Any] = None):
         raise NotImplementedError()
 
     def deactivate(self):
         raise NotImplementedError()
 
+    @property
+    def tag(self) -> str:
+        return self.__class__.__name__
+
     @property
     def can_activate(self) -> bool:
         raise NotImplementedError()
@@ -30,7 +80,187 @@ class ChaosOperator(ABC):
         return not self.can_activate
 
 
-class ChaosManager(LoggerMixin):
+# called with the key of the operator (see `ChaosManager.op_key`) and timing of each transition
+TransitionListener = Callable[[str, FaultTiming], None]
+
+
+class OperatorSchedule(NamedTuple):
+    arrival: Arrival
+    # if both None, each arrival toggles the operator; otherwise it's deactivated after a random duration in range
+    min_duration: Optional[float]
+    max_duration: Optional[float]
+    # of the registration, events scheduled by an earlier one (before the operator was removed and added back) are
+    # dropped
+    generation: int
+    # index of each arrival of this registration, arrival processes keep no state of their own so that one can be
+    # shared by operators
+    arrivals: Iterator[int]
+
+    def next_delay(self, rng: Random) -> float:
+        return self.arrival.next_delay(rng, next(self.arrivals))
+
+
+class BaseChaosManager(LoggerMixin):
+    """
+    What `ChaosManager` and `aio.chaos.AsyncChaosManager` share: schedules, keys and random generators of operators,
+    conflict checks, listeners and the recorded (or replayed) timeline. Subclasses drive the transitions.
+    """
+    polling_interval = 10
+    trigger_rate = 0.5
+
+    ops: List[Any]
+
+    def __init__(self, env, seed: Optional[int] = None, record: Optional[str] = None, replay: Optional[str] = None,
+                 max_active_faults: Optional[int] = None, rules: Optional[List[ConflictRule]] = None) -> None:
+        super().__init__()
+        self.env = env
+        self.ops = []
+        self.timings = ChaosTimings()
+        if seed is None and record is not None:
+            seed = SystemRandom().randrange(2 ** 32)
+        self.seed = seed
+        self.randoms = Randoms(seed)
+        self.max_active_faults = max_active_faults
+        self.rules = [PdMajorityRule()] if rules is None else rules
+        self._keys: Dict[int, str] = {}
+        self._listeners: List[TransitionListener] = []
+        self._generations = count()
+        self._started_at = monotonic()
+        self._recorder = None if record is None else TimelineRecorder(
+            record, seed, {t.name: len(l) for (t, l) in env.node_instances.items()})
+        self._replay = None if replay is None else load_timeline(replay)[1]
+
+    def _new_schedule(self, op, arrival: Optional[Arrival], min_duration: Optional[float],
+                      max_duration: Optional[float]) -> OperatorSchedule:
+        """
+        Register `op` (not yet added) with its schedule, the arrival process defaults to a Poisson process at the rate
+        of `trigger_rate` per `polling_interval`.
+        """
+        if arrival is None:
+            arrival = Poisson(self.trigger_rate / self.polling_interval)
+        if min_duration is not None or max_duration is not None:
+            min_duration = max_duration if min_duration is None else min_duration
+            max_duration = min_duration if max_duration is None else max_duration
+            assert 0 <= min_duration <= max_duration
+        assert op not in self.ops
+        self.ops.append(op)
+        if id(op) not in self._keys:
+            self._keys[id(op)] = '{}#{}'.format(op.tag, sum(1 for k in self._keys.values()
+                                                            if k.rsplit('#', 1)[0] == op.tag))
+        return OperatorSchedule(arrival, min_duration, max_duration, next(self._generations), count())
+
+    def op_key(self, op) -> str:
+        """
+        Key of `op` which stays the same across runs of the same test: its tag and index among same tag operators.
+        """
+        return self._keys[id(op)]
+
+    def random_of(self, op, purpose: str) -> Random:
+        """
+        Random generator of `op` for `purpose` (`arrival`, `duration` or `targets`), derived from `seed` and the key of
+        `op`: operators are activated concurrently, a generator shared by all of them would be drawn in an order
+        depending on thread timing.
+        """
+        return self.randoms.get(self._keys.get(id(op), op.tag), purpose)
+
+    def record_transition(self, op, phase: str, issued: float):
+        if self._recorder is not None and id(op) in self._keys:
+            self._recorder.record(TimelineEvent(issued - self._started_at, self.op_key(op), phase,
+                                                op.targets if phase == 'activate' else None))
+
+    def close_recorder(self):
+        if self._recorder is not None:
+            self._recorder.close()
+            self._recorder = None
+
+    def add_listener(self, listener: TransitionListener):
+        """
+        Call `listener` after each activation and deactivation, on the thread (or in the event loop) which ran it.
+        """
+        self._listeners.append(listener)
+
+    def notify(self, op, timing: FaultTiming):
+        for listener in self._listeners:
+            try:
+                listener(self._keys.get(id(op), op.tag), timing)
+            except Exception as e:
+                self.logger.warning('chaos listener %s failed: %s', listener, e)
+
+    def transitioned(self, op, phase: str, issued: float, timing: FaultTiming):
+        """
+        Account a timed transition of `op` issued at `issued` (monotonic clock).
+        """
+        self.timings.record(timing)
+        self.record_transition(op, phase, issued)
+        self.notify(op, timing)
+        self.logger.info('%s %s acknowledged in %.3fs, effective in %s', op, phase, timing.ack_seconds,
+                         'unknown' if timing.effective_at is None else '%.3fs' % timing.effective_seconds)
+
+    def busy_action(self, op) -> Optional[str]:
+        """
+        Transition of `op` in flight, if any.
+        """
+        raise NotImplementedError()
+
+    def active_operators(self) -> List[Any]:
+        """
+        Operators active or being activated, excluding those being deactivated.
+        """
+        ret = []
+        for op in self.ops:
+            action = self.busy_action(op)
+            if action == 'activate' or (action is None and op.can_deactivate):
+                ret.append(op)
+        return ret
+
+    def active_state(self) -> str:
+        return ','.join(sorted(op.tag for op in self.active_operators()))
+
+    def _reject_reason(self, op) -> Optional[str]:
+        if self.max_active_faults is not None and len(self.active_operators()) >= self.max_active_faults:
+            return 'already {} active faults'.format(self.max_active_faults)
+        for rule in self.rules:
+            if not rule.allows(self, op):
+                return 'not allowed by {}'.format(rule)
+        return None
+
+    def may_activate(self, op) -> bool:
+        """
+        Check limits and rules before activating `op`, rejections are logged (and journaled).
+        """
+        reason = self._reject_reason(op)
+        if reason is None:
+            return True
+        self.logger.info('not activating %s: %s', op, reason)
+        journal = getattr(self.env, 'journal', None)
+        if journal is not None:
+            journal.record('chaos', 'rejected', op=self.op_key(op), reason=reason)
+        return False
+
+    def replayed_op(self, event: TimelineEvent):
+        """
+        Operator of a replayed event, None (with a warning) if no operator of its key is added.
+        """
+        op = next((i for i in self.ops if self.op_key(i) == event.op), None)
+        if op is None:
+            self.logger.warning('%s is not added, skipped %s at %.3fs', event.op, event.action, event.offset)
+        return op
+
+    def decide(self, op, kind: str, schedule: OperatorSchedule) -> Optional[str]:
+        """
+        Action on an `arrival` (or scheduled `deactivate`) of `op`, with no transition of it in flight; None to skip.
+        """
+        if kind == 'deactivate':
+            return 'deactivate'
+        if op.can_activate:
+            return 'activate' if self.may_activate(op) else None
+        if schedule.min_duration is None:
+            return 'deactivate'
+        self.logger.debug('%s is still active, skipped', op)
+        return None
+
+
+class ChaosManager(BaseChaosManager):
     def __iadd__(self, op):
         assert isinstance(op, ChaosOperator)
         self.add_chaos_operator(op)
@@ -41,35 +271,60 @@ class ChaosManager(LoggerMixin):
         self.remove_chaos_operator(op)
         return self
 
-    def add_chaos_operator(self, op: ChaosOperator):
-        assert op not in self.ops
-        self.ops.append(op)
+    def add_chaos_operator(self, op: ChaosOperator, arrival: Optional[Arrival] = None,
+                           min_duration: Optional[float] = None, max_duration: Optional[float] = None):
+        """
+        Add `op` to be triggered on its own `arrival` process, default to a Poisson process at the rate of
+        `trigger_rate` per `polling_interval`.
+        """
+        with self._cond:
+            schedule = self._new_schedule(op, arrival, min_duration, max_duration)
+            self._schedules[id(op)] = schedule
+            if self._replay is None:
+                self._push(monotonic() + schedule.next_delay(self.random_of(op, 'arrival')), 'arrival', op,
+                           schedule.generation)
 
     def remove_chaos_operator(self, op: ChaosOperator):
-        idx = self.ops.index(op)
-        removed = self.ops.pop(idx)
+        with self._cond:
+            while id(op) in self._busy:
+                self._cond.wait()
+            idx = self.ops.index(op)
+            removed = self.ops.pop(idx)
+            # pending events of it are dropped when popped
+            self._schedules.pop(id(op))
         if removed.can_deactivate:
             removed.deactivate()
 
-    _singleton: Optional['ChaosManager'] = None
-    polling_interval = 10
-
-    def __new__(cls, *args, **kwargs):
-        if cls._singleton is None:
-            cls._singleton = super().__new__(cls)
-            cls._singleton.__init__(*args, **kwargs)
-        return cls._singleton
+    # delay of a deactivation (or replayed event) while the operator is still busy
+    busy_retry_interval = 0.1
 
     running: bool = False
-    ops: List[ChaosOperator]
 
-    def __init__(self, env: TestBed, start=True) -> None:
-        super().__init__()
+    def __init__(self, env: TestBed, start=True, seed: Optional[int] = None, record: Optional[str] = None,
+                 replay: Optional[str] = None, max_workers: int = 4, max_active_faults: Optional[int] = None,
+                 rules: Optional[List[ConflictRule]] = None) -> None:
+        """
+        Operators are activated and deactivated concurrently on `max_workers` threads.
+
+        :param max_active_faults: limit of operators active at the same time
+        :param rules: checked before each activation, default to `PdMajorityRule()`
+        :param seed: seed of all random decisions (arrivals, durations and targets of operators)
+        :param record: path to record the chaos timeline to
+        :param replay: path of a recorded timeline, to apply its events (at the same offsets and on the same nodes
+            by role and index) instead of random ones
+        """
+        super().__init__(env, seed=seed, record=record, replay=replay, max_active_faults=max_active_faults,
+                         rules=rules)
 
         self.worker = Thread(target=self.main)
-        self.ops = []
-
-        self.env = env
+        self._cond = Condition()
+        # (due on monotonic clock, sequence, event kind, operator, generation of its schedule)
+        self._events: List[Tuple[float, int, str, Any, Optional[int]]] = []
+        self._seq = count()
+        self._schedules: Dict[int, OperatorSchedule] = {}
+        # id of operator -> action in flight
+        self._busy: Dict[int, str] = {}
+        self._pool = ThreadPoolExecutor(max_workers=max_workers)
 
         if start:
             self.start()
@@ -78,33 +333,140 @@ class ChaosManager(LoggerMixin):
             self.logger.info('waiting for chaos worker to terminate')
             self.worker.join()
 
+    def _push(self, due: float, kind: str, op: Any, generation: Optional[int] = None):
+        heappush(self._events, (due, next(self._seq), kind, op, generation))
+        self._cond.notify()
+
     # Create a thread to trigger chaos operations
 
     def start(self):
+        self.running = True
+        self._started_at = monotonic()
+        if self._replay is not None:
+            with self._cond:
+                for e in self._replay:
+                    self._push(self._started_at + e.offset, 'replay', e)
         self.worker.start()
 
     def stop(self):
         assert self.running
-        self.running = False
+        with self._cond:
+            self.running = False
+            self._cond.notify_all()
+
+    def close(self):
+        """
+        Stop and wait for the worker, then remove all operators, deactivating those still active, and close the
+        timeline once their deactivations are recorded.
+        """
+        if self.running:
+            self.stop()
+        if self.worker.is_alive():
+            self.worker.join()
+        for op in list(self.ops):
+            self.remove_chaos_operator(op)
+        self.close_recorder()
+
+    def busy_action(self, op: ChaosOperator) -> Optional[str]:
+        return self._busy.get(id(op))
+
+    def _next_event(self) -> Optional[Tuple[float, str, Any, Optional[int]]]:
+        """
+        Wait for the next due event of operators still managed, None if stopped.
+        """
+        with self._cond:
+            while self.running:
+                if not self._events:
+                    self._cond.wait()
+                    continue
+                (due, _, kind, op, generation) = self._events[0]
+                wait = due - monotonic()
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue
+                heappop(self._events)
+                if kind == 'replay':
+                    return due, kind, op, generation
+                schedule = self._schedules.get(id(op))
+                if schedule is None or schedule.generation != generation:
+                    continue
+                if kind == 'arrival':
+                    # next arrival only depends on this one, not on how long the operation takes
+                    self._push(due + schedule.next_delay(self.random_of(op, 'arrival')), 'arrival', op,
+                               generation)
+                return due, kind, op, generation
+            return None
+
+    def _dispatch(self, kind: str, item, generation: Optional[int] = None):
+        """
+        Decide what to do with a due event, and run it on the worker pool.
+        """
+        targets = None
+        if kind == 'replay':
+            event: TimelineEvent = item
+            op = self.replayed_op(event)
+            if op is None:
+                return
+            action, targets = event.action, event.targets
+        else:
+            op: ChaosOperator = item
+            action = None
 
-    def main(self):
-        self.running = True
-        self.logger.info('chaos worker start')
-        while self.running:
-            trigger_rate = 0.5
-            if self.ops and trigger_rate < random():
-                op: ChaosOperator = choice(self.ops)
-                if op.can_activate:
-                    self.logger.info('activating {}'.format(op))
+        with self._cond:
+            if id(op) in self._busy:
+                if kind == 'arrival':
+                    self.logger.debug('%s is busy, skipped', op)
+                else:
+                    self._push(monotonic() + self.busy_retry_interval, kind, item, generation)
+                return
+            if action is None:
+                # decided while no transition of it is in flight, so its state can't change under us
+                schedule = self._schedules.get(id(op))
+                if schedule is None or schedule.generation != generation:
+                    return
+                action = self.decide(op, kind, schedule)
+                if action is None:
+                    return
+            elif action == 'activate' and not self.may_activate(op):
+                return
+            self._busy[id(op)] = action
+        self._pool.submit(self._transition, op, action, targets)
+
+    def _transition(self, op: ChaosOperator, action: str, targets: Optional[Any]):
+        try:
+            if action == 'activate' and op.can_activate:
+                self.logger.info('activating %s', op)
+                if targets is None:
                     op.activate()
-                elif op.can_deactivate:
-                    self.logger.info('deactivating {}'.format(op))
-                    op.deactivate()
                 else:
-                    self.logger.error('{} cannot be activated or deactivated, looks like there\'s an inconsistency.')
-
-            sleep(self.polling_interval)
+                    op.activate(targets=targets)
+                schedule = self._schedules.get(id(op))
+                if self._replay is None and schedule is not None and schedule.min_duration is not None:
+                    duration = self.random_of(op, 'duration').uniform(schedule.min_duration, schedule.max_duration)
+                    with self._cond:
+                        self._push(monotonic() + duration, 'deactivate', op, schedule.generation)
+            elif action == 'deactivate' and op.can_deactivate:
+                self.logger.info('deactivating %s', op)
+                op.deactivate()
+            else:
+                self.logger.error('%s cannot be %sd, looks like there\'s an inconsistency.', op, action)
+        except Exception as e:
+            self.logger.exception('failed to %s %s: %s', action, op, e)
+        finally:
+            with self._cond:
+                self._busy.pop(id(op), None)
+                self._cond.notify_all()
 
+    def main(self):
+        self.logger.info('chaos worker start')
+        while True:
+            event = self._next_event()
+            if event is None:
+                break
+            self._dispatch(*event[1:])
+
+        # let operations in flight finish
+        self._pool.shutdown(wait=True)
         self.logger.info('chaos worker end')
 
 
@@ -113,17 +475,11 @@ class ChaosAction(TestAction, ABC):
     Monitor chaos actions
     """
 
-    _mgr: Optional[ChaosManager] = None
     operator: ChaosOperator
 
-    @classmethod
-    def set_manager(cls, manager: ChaosManager):
-        cls._mgr = manager
-
-    def __new__(cls, test_instance: Test, manager=None, **kwargs) -> 'ChaosAction':
-        if cls._mgr is None:
-            cls.set_manager(ChaosManager(env=test_instance.env_instance))
-        return super().__new__(cls)
+    @property
+    def _mgr(self) -> ChaosManager:
+        return self.test_instance.chaos_manager
 
     def __init__(self, test_instance: 'Test', chaos_operator: ChaosOperator, **kwargs) -> None:
         super().__init__(test_instance, **kwargs)
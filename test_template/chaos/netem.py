@@ -0,0 +1,241 @@
+"""
+Network faults applied inside the pod of the target node through exec: latency, loss and bandwidth by `tc` (netem and
+tbf qdiscs), and drops between peers by `iptables`.
+
+Unlike NetworkPolicies they don't depend on the CNI plugin and are in place once the command returns, but the image
+needs `iproute2` and `iptables` (with passwordless `sudo` for them), and the container the `NET_ADMIN` capability.
+"""
+from atexit import register, unregister
+from time import time, sleep
+from typing import Optional, Any, List
+
+from . import ChaosOperator, ChaosManager
+from .operators import wait_reachable
+from .. import Node, NodeType
+from ..mixins import LoggerMixin
+
+# health reason of nodes under a fault of these operators, so each node has at most one at a time
+REASON = 'netem'
+
+
+class InPodNetworkFault(LoggerMixin, ChaosOperator):
+    """
+    Fault applied by running `apply_commands` on a random healthy node of `node_type` (or the node of `targets`),
+    reverted by `revert_commands`. The node is unhealthy while the fault is active, so other operators pick others.
+    """
+    # prefix of commands which need root, pods run as an unprivileged user
+    sudo = 'sudo -n '
+    interface = 'eth0'
+
+    node: Optional[Node] = None
+    # kept after deactivation to confirm the fault is gone
+    last_node: Optional[Node] = None
+    confirm_timeout: float = 10
+    confirm_interval: float = 0.1
+
+    def __init__(self, chaos_manager: ChaosManager, node_type: NodeType, **kwargs) -> None:
+        super().__init__(chaos_manager=chaos_manager, **kwargs)
+        self.node_type = node_type
+
+    @property
+    def role_name(self) -> str:
+        # not `type_name`, which `rules.PdMajorityRule` takes as a node taken offline
+        return self.node_type if isinstance(self.node_type, str) else self.node_type.name
+
+    @property
+    def tag(self) -> str:
+        return '{}:{}'.format(self.__class__.__name__, self.role_name)
+
+    @property
+    def can_activate(self) -> bool:
+        return self.node is None
+
+    def apply_commands(self) -> List[str]:
+        raise NotImplementedError()
+
+    def revert_commands(self) -> List[str]:
+        raise NotImplementedError()
+
+    def check_command(self) -> str:
+        """
+        Command succeeding only while the fault is in place on `last_node`.
+        """
+        raise NotImplementedError()
+
+    def _select(self, targets: Optional[Any]):
+        topology = self._mgr.env.topology
+        if targets is None:
+            self.node = topology.take_random(self.node_type, self._mgr.random_of(self, 'targets'), REASON)
+            assert self.node is not None, 'no healthy nodes of type {} left'.format(self.node_type)
+        else:
+            self.node = topology.at(*targets[0])
+            topology.set_healthy(self.node, False, REASON)
+        self.last_node = self.node
+        self.targets = [list(self.node.ref)]
+
+    def _run(self, commands: List[str]) -> bool:
+        ok = True
+        for cmd in commands:
+            res = self.node.run(self.sudo + cmd)
+            if not res.ok:
+                self.logger.error('`%s` failed on %s: %s', cmd, self.node, res.stderr.strip())
+                ok = False
+        return ok
+
+    def activate(self, targets: Optional[Any] = None):
+        assert self.can_activate
+        self._select(targets)
+        commands = self.apply_commands()
+        self.logger.info('applying `%s` on %s', '; '.join(commands), self.node)
+        register(self.deactivate)
+        if not self._run(commands):
+            # don't leave a partly applied fault
+            self.deactivate()
+            raise RuntimeError('failed to apply {} on {}'.format(self.tag, self.last_node))
+
+    def deactivate(self):
+        self.logger.info('reverting %s on %s', self.tag, self.node)
+        self._run(self.revert_commands())
+        self._mgr.env.topology.set_healthy(self.node, True, REASON)
+        self.node = None
+        unregister(self.deactivate)
+
+    def confirm(self, active: bool) -> Optional[float]:
+        if self.last_node is None:
+            return None
+        deadline = time() + self.confirm_timeout
+        while True:
+            checked_at = time()
+            if self.last_node.run(self.sudo + self.check_command()).ok == active:
+                return checked_at
+            if checked_at > deadline:
+                self.logger.error('%s not %s on %s after %ss',
+                                  self.tag, 'applied' if active else 'reverted', self.last_node, self.confirm_timeout)
+                return None
+            sleep(self.confirm_interval)
+
+
+class QdiscFault(InPodNetworkFault):
+    """
+    Replace the root qdisc of the interface by `qdisc`, which shapes outgoing traffic of the node.
+    """
+
+    @property
+    def qdisc(self) -> str:
+        raise NotImplementedError()
+
+    def apply_commands(self) -> List[str]:
+        return ['tc qdisc replace dev {} root {}'.format(self.interface, self.qdisc)]
+
+    def revert_commands(self) -> List[str]:
+        return ['tc qdisc del dev {} root'.format(self.interface)]
+
+    def check_command(self) -> str:
+        return 'tc qdisc show dev {} | grep -q "qdisc {} "'.format(self.interface, self.qdisc.split()[0])
+
+
+class NetworkDelay(QdiscFault):
+    """
+    Delay packets sent by the node by `delay_ms`, ± `jitter_ms` (`correlation` % dependent on the last packet).
+    """
+
+    def __init__(self, chaos_manager: ChaosManager, node_type: NodeType, delay_ms: float = 100,
+                 jitter_ms: float = 0, correlation: float = 0, **kwargs) -> None:
+        super().__init__(chaos_manager=chaos_manager, node_type=node_type, **kwargs)
+        self.delay_ms = delay_ms
+        self.jitter_ms = jitter_ms
+        self.correlation = correlation
+
+    @property
+    def qdisc(self) -> str:
+        ret = 'netem delay {}ms'.format(self.delay_ms)
+        if self.jitter_ms:
+            ret += ' {}ms'.format(self.jitter_ms)
+            if self.correlation:
+                ret += ' {}%'.format(self.correlation)
+        return ret
+
+
+class PacketLoss(QdiscFault):
+    """
+    Drop `percent` % of packets sent by the node at random (`correlation` % dependent on the last packet).
+    """
+
+    def __init__(self, chaos_manager: ChaosManager, node_type: NodeType, percent: float = 10,
+                 correlation: float = 0, **kwargs) -> None:
+        super().__init__(chaos_manager=chaos_manager, node_type=node_type, **kwargs)
+        self.percent = percent
+        self.correlation = correlation
+
+    @property
+    def qdisc(self) -> str:
+        ret = 'netem loss {}%'.format(self.percent)
+        if self.correlation:
+            ret += ' {}%'.format(self.correlation)
+        return ret
+
+
+class BandwidthLimit(QdiscFault):
+    """
+    Cap the bandwidth of the node to `rate` (in `tc` units, e.g. `1mbit`), queueing packets for at most `latency_ms`.
+    """
+
+    def __init__(self, chaos_manager: ChaosManager, node_type: NodeType, rate: str = '1mbit',
+                 burst: str = '32kbit', latency_ms: float = 400, **kwargs) -> None:
+        super().__init__(chaos_manager=chaos_manager, node_type=node_type, **kwargs)
+        self.rate = rate
+        self.burst = burst
+        self.latency_ms = latency_ms
+
+    @property
+    def qdisc(self) -> str:
+        return 'tbf rate {} burst {} latency {}ms'.format(self.rate, self.burst, self.latency_ms)
+
+
+class PeerDrop(InPodNetworkFault):
+    """
+    Drop all packets between the node and `peers` random other nodes of `peer_type` (of any type if None), while both
+    keep talking to the rest, unlike `operators.NetworkPartition`.
+
+    Targets are `[node, [peers]]`.
+    """
+    peer_nodes: Optional[List[Node]] = None
+
+    def __init__(self, chaos_manager: ChaosManager, node_type: NodeType, peer_type: Optional[NodeType] = None,
+                 peers: int = 1, **kwargs) -> None:
+        super().__init__(chaos_manager=chaos_manager, node_type=node_type, **kwargs)
+        self.peer_type = peer_type
+        self.peers = peers
+
+    def _select(self, targets: Optional[Any]):
+        super()._select(targets)
+        topology = self._mgr.env.topology
+        if targets is None:
+            candidates = [n for n in (topology.nodes() if self.peer_type is None else topology.role(self.peer_type))
+                          if n is not self.node]
+            assert candidates, 'no peers of type {} for {}'.format(self.peer_type, self.node)
+            self.peer_nodes = self._mgr.random_of(self, 'targets').sample(candidates, min(self.peers, len(candidates)))
+        else:
+            self.peer_nodes = [topology.at(*ref) for ref in targets[1]]
+        self.targets.append([list(n.ref) for n in self.peer_nodes])
+
+    def _rules(self, action: str) -> List[str]:
+        ips = ','.join(n.pod_ip for n in self.peer_nodes)
+        return ['iptables {} INPUT -s {} -j DROP'.format(action, ips),
+                'iptables {} OUTPUT -d {} -j DROP'.format(action, ips)]
+
+    def apply_commands(self) -> List[str]:
+        return self._rules('-I')
+
+    def revert_commands(self) -> List[str]:
+        return self._rules('-D')
+
+    def check_command(self) -> str:
+        return 'iptables -C OUTPUT -d {} -j DROP'.format(self.peer_nodes[0].pod_ip)
+
+    def confirm(self, active: bool) -> Optional[float]:
+        # probe the connection itself where the peer has a port
+        peer = next((n for n in self.peer_nodes or () if n.port is not None), None)
+        if peer is None:
+            return super().confirm(active)
+        return wait_reachable((self.last_node, peer), not active, self.confirm_timeout)
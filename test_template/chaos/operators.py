@@ -1,138 +1,294 @@
 from atexit import register, unregister
-from random import choice
-from typing import Optional, Dict, List, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from time import time
+from random import Random
+from typing import Optional, List, Tuple, Any, Dict, Type, TYPE_CHECKING
 
-from . import ChaosOperator, ChaosManager
-from .. import Node, DEFAULT_NAMESPACE, pop_random, NodeType, update_label, get_label
+from kubernetes.client.rest import ApiException
+
+from . import ChaosOperator
+from .. import Node, pop_random, NodeType
 from ..mixins import NetworkingV1ApiMixin, LoggerMixin
 
+if TYPE_CHECKING:
+    from ..topology import Topology
+
 """
 Operator class: A kind of actions
 Operator instance: one action can be executed during test, can have multiple instance in one test.
 """
 
 
-class NodeOffline(NetworkingV1ApiMixin, LoggerMixin, ChaosOperator):
-    @property
-    def can_activate(self) -> bool:
-        return self.offline_node is None
+class ReachabilityWait:
+    """
+    Deadline and outcome of waiting for connectivity of `pair` to be `reachable`, fed with results of probes sent by
+    `wait_reachable` (or `aio.chaos.wait_reachable`).
+    """
+    result: Optional[float] = None
 
-    def activate(self):
-        assert self.can_activate
-        nodes = sum(self._mgr.env.node_instances.values(), [])
+    def __init__(self, pair: Tuple[Any, Any], reachable: bool, timeout: float) -> None:
+        self.pair = pair
+        self.reachable = reachable
+        self.timeout = timeout
+        self.deadline = time() + timeout
 
-        # todo: abstract node selection
-        same_type_node = [n for n in nodes if n.is_type(self.node_type)]
-        assert same_type_node, 'no nodes of type {}'.format(self.node_type)
-        self.offline_node = pop_random(same_type_node)
+    def done(self, probed_at: float, reached: bool) -> bool:
+        """
+        Whether waiting is over after a probe sent at `probed_at`, `result` is the time it was observed (or None).
+        """
+        if reached == self.reachable:
+            self.result = probed_at
+            return True
+        if probed_at > self.deadline:
+            self.pair[0].logger.error('connectivity between %s and %s not %s after %ss',
+                                      self.pair[0], self.pair[1], 'restored' if self.reachable else 'cut', self.timeout)
+            return True
+        return False
 
-        old_labels: Dict[str, str] = get_label(self.offline_node)
-        self.offline_label_key = 'random-offline-label_{}_0'.format(hash(self))
 
-        new_label = {self.offline_label_key: '0_{}_0'.format(hash(self))}
-        old_labels.update(new_label)
-        update_label(self.offline_node, old_labels)
-
-        tmp_np_name = 'np-deny-all-{}'.format(hash(self))
-        deny_all_policy = {'apiVersion': 'networking.k8s.io/v1',
-                           'kind': 'NetworkPolicy',
-                           'metadata': {'name': tmp_np_name, },
-                           'spec': {'podSelector': {'matchLabels': new_label},
-                                    'policyTypes': ['Ingress', 'Egress'], }}
-
-        self.logger.info('taking {} offline by NetworkPolicy {}'.format(self.offline_node, tmp_np_name))
-        self.api_net_v1.create_namespaced_network_policy(namespace=DEFAULT_NAMESPACE, body=deny_all_policy)
-        self.offline_policy_name = tmp_np_name
-        register(self.deactivate)
+def wait_reachable(pair: Optional[Tuple[Node, Node]], reachable: bool, timeout: float) -> Optional[float]:
+    """
+    Probe from `pair[0]` to `pair[1]` until connectivity is `reachable`, returns the time it was observed.
+    """
+    if pair is None:
+        return None
+    wait = ReachabilityWait(pair, reachable, timeout)
+    while True:
+        # a failed probe only returns after its timeout, so take the time it was sent
+        probed_at = time()
+        if wait.done(probed_at, pair[0].can_reach(pair[1])):
+            return wait.result
+
+
+def probe_source(topology: 'Topology', target: Node) -> Optional[Node]:
+    """
+    A healthy node other than `target` to probe it from, None if there's none left: a probe from a node under a fault
+    of its own tells nothing about `target`.
+    """
+    for role in topology.roles():
+        for n in topology.healthy(role):
+            if n is not target:
+                return n
+    return None
 
-    def deactivate(self):
-        self.logger.info('deleting NetworkPolicy {}'.format(self.offline_policy_name))
-        self.api_net_v1.delete_namespaced_network_policy(namespace=DEFAULT_NAMESPACE,
-                                                         name=self.offline_policy_name)
-        labels = get_label(self.offline_node)
-        labels.pop(self.offline_label_key)
-        update_label(self.offline_node, labels)
-        self.offline_label_key = None
-        self.offline_node = None
-        self.offline_policy_name = None
-        unregister(self.deactivate)
 
+def deny_all_policy(name: str, match_labels: Dict[str, str]) -> dict:
+    return {'apiVersion': 'networking.k8s.io/v1',
+            'kind': 'NetworkPolicy',
+            'metadata': {'name': name, },
+            'spec': {'podSelector': {'matchLabels': match_labels},
+                     'policyTypes': ['Ingress', 'Egress'], }}
+
+
+def region_policy(name: str, match_labels: Dict[str, str], region: List[Node]) -> dict:
+    # pods of the region only talk to each other
+    network_policy_peer = [{'ipBlock': {'cidr': '{}/32'.format(i.pod_ip)}} for i in region]
+    return {'apiVersion': 'networking.k8s.io/v1',
+            'kind': 'NetworkPolicy',
+            'metadata': {'name': name, },
+            'spec': {
+                'podSelector': {'matchLabels': match_labels},
+                'policyTypes': ['Ingress', 'Egress'],
+                'ingress': [{'from': network_policy_peer}],
+                'egress': [{'to': network_policy_peer}], }}
+
+
+def random_regions(node_instances: Dict[Type[Node], List[Node]], rng: Random) -> Tuple[List[Node], List[Node]]:
+    """
+    Split nodes into two regions, the first one has at least one node of each role.
+    """
+    regions = ([], [])
+    for (node_cls, node_list) in node_instances.items():
+        node_list: List[Node] = node_list.copy()
+        itm = pop_random(node_list, rng)
+        if itm is not None:
+            regions[0].append(itm)
+        while node_list:
+            rng.choice([r for r in regions]).append(pop_random(node_list, rng))
+    return regions
+
+
+class NodeOfflineBase(NetworkingV1ApiMixin, LoggerMixin):
+    """
+    Choices and state of taking a node of `node_type` offline by a deny-all NetworkPolicy, shared by `NodeOffline` and
+    `aio.chaos.AsyncNodeOffline`, which make the API calls.
+    """
     offline_node: Optional[Node] = None
     offline_label_key: Optional[str] = None
     offline_policy_name: Optional[str] = None
+    # kept after deactivation to confirm the node is back online
+    probe_target: Optional[Node] = None
+    probe_timeout: float = 30
 
-    def __init__(self, chaos_manager: ChaosManager, node_type: NodeType, **kwargs) -> None:
+    def __init__(self, chaos_manager, node_type: NodeType, **kwargs) -> None:
         super().__init__(chaos_manager=chaos_manager, **kwargs)
         self.node_type = node_type
 
+    @property
+    def type_name(self) -> str:
+        return self.node_type if isinstance(self.node_type, str) else self.node_type.name
 
-class NetworkPartition(NetworkingV1ApiMixin, LoggerMixin, ChaosOperator):
-    def activate(self):
-        self.regions = ([], [])
+    @property
+    def tag(self) -> str:
+        return '{}:{}'.format(self.__class__.__name__, self.type_name)
 
-        for (node_cls, node_list) in self._mgr.env.node_instances.items():
-            node_list: List[Node] = node_list.copy()
-            itm = pop_random(node_list)
-            if itm is not None:
-                self.regions[0].append(itm)
-            while node_list:
-                choice([r for r in self.regions]).append(pop_random(node_list))
+    @property
+    def can_activate(self) -> bool:
+        return self.offline_node is None
 
-        self.region_label_key = 'random-offline-label_{}_0'.format(hash(self))
-        self.region_policy_names = tuple(['np-region-{}-{}'.format(hash(self), i) for i in [0, 1]])
-        for ri in (0, 1):
-            region = self.regions[ri]
+    def _take_offline(self, targets: Optional[Any]) -> Tuple[Dict[str, str], dict]:
+        """
+        Pick the node (marked unhealthy), returns the label to add on it and the NetworkPolicy selecting that label.
+        """
+        assert self.can_activate
+        topology = self._mgr.env.topology
+        if targets is None:
+            # nodes taken offline by other operators are unhealthy
+            self.offline_node = topology.take_random(self.node_type, self._mgr.random_of(self, 'targets'))
+            assert self.offline_node is not None, 'no nodes of type {} left online'.format(self.node_type)
+        else:
+            self.offline_node = topology.at(*targets[0])
+            topology.set_healthy(self.offline_node, False)
+        self.targets = [list(self.offline_node.ref)]
+        self.probe_target = self.offline_node
 
-            matched_label = {self.region_label_key: str(ri)}
+        self.offline_label_key = 'random-offline-label_{}_0'.format(hash(self))
+        new_label = {self.offline_label_key: '0_{}_0'.format(hash(self))}
+        self.offline_policy_name = 'np-deny-all-{}'.format(hash(self))
+        self.logger.info('taking %s offline by NetworkPolicy %s', self.offline_node, self.offline_policy_name)
+        return new_label, deny_all_policy(self.offline_policy_name, new_label)
 
-            for n in region:
-                labels = get_label(n)
-                labels.update(matched_label)
-                update_label(n, labels)
+    def _back_online(self):
+        self._mgr.env.topology.set_healthy(self.offline_node, True)
+        self.offline_label_key = None
+        self.offline_node = None
+        self.offline_policy_name = None
 
-            network_policy_peer = [{'ipBlock': {'cidr': '{}/32'.format(i.pod_ip)}} for i in region]
+    def _probe_nodes(self) -> Optional[Tuple[Node, Node]]:
+        # picked on each confirmation, the source may be under a fault of another operator since the activation
+        if self.probe_target is None or self.probe_target.port is None:
+            return None
+        source = probe_source(self._mgr.env.topology, self.probe_target)
+        if source is None:
+            self.logger.warning('no healthy node left to probe %s from', self.probe_target)
+            return None
+        return source, self.probe_target
 
-            region_policy = {'apiVersion': 'networking.k8s.io/v1',
-                             'kind': 'NetworkPolicy',
-                             'metadata': {'name': self.region_policy_names[ri], },
-                             'spec': {
-                                 'podSelector': {'matchLabels': matched_label},
-                                 'policyTypes': ['Ingress', 'Egress'],
-                                 'ingress': [{'from': network_policy_peer}],
-                                 'egress': [{'to': network_policy_peer}], }}
 
-            self.logger.info('applying region on {} by {}'.format(region, format(self.region_policy_names[ri])))
-            resp = self.api_net_v1.create_namespaced_network_policy(namespace=DEFAULT_NAMESPACE, body=region_policy)
+class NodeOffline(NodeOfflineBase, ChaosOperator):
+    def activate(self, targets: Optional[Any] = None):
+        (new_label, policy) = self._take_offline(targets)
+        try:
+            self._mgr.env.label_manager.add([self.offline_node], new_label)
+            self.api_net_v1.create_namespaced_network_policy(namespace=self._mgr.env.namespace, body=policy)
+        except Exception:
+            # not left half active: deactivation would then be scheduled for a policy which doesn't exist
+            self.logger.warning('failed to take %s offline, undoing', self.offline_node)
+            try:
+                self._mgr.env.label_manager.remove([self.offline_node], [self.offline_label_key])
+            finally:
+                self._back_online()
+            raise
         register(self.deactivate)
 
     def deactivate(self):
-        # activate is not atomic (or fast enough), so there may be some inconsistency
+        self.logger.info('deleting NetworkPolicy %s', self.offline_policy_name)
         try:
-            for i in (0, 1):
-                self.logger.info('deleting region on {}'.format(self.regions[i]))
-                self.api_net_v1.delete_namespaced_network_policy(namespace=DEFAULT_NAMESPACE,
-                                                                 name=self.region_policy_names[i])
-            for ns in self._mgr.env.node_instances.values():
-                for n in ns:
-                    labels = get_label(n)
-                    labels.pop(self.region_label_key)
-                    update_label(n, labels)
-            self.regions = None
-            self.region_label_key = None
-            self.region_policy_names = None
-            unregister(self.deactivate)
-        except Exception as e:
-            # self.logger.debug('exception when deactivating:')
-            # self.logger.exception(e)
-            pass
+            self.api_net_v1.delete_namespaced_network_policy(namespace=self._mgr.env.namespace,
+                                                             name=self.offline_policy_name)
+        except ApiException as e:
+            # deleted already, e.g. by a cleanup of the namespace
+            if e.status != 404:
+                raise
+        self._mgr.env.label_manager.remove([self.offline_node], [self.offline_label_key])
+        self._back_online()
+        unregister(self.deactivate)
 
-    @property
-    def can_activate(self) -> bool:
-        return self.regions is None
+    def confirm(self, active: bool) -> Optional[float]:
+        return wait_reachable(self._probe_nodes(), not active, self.probe_timeout)
 
+
+class NetworkPartitionBase(NetworkingV1ApiMixin, LoggerMixin):
+    """
+    Choices and state of splitting nodes into two regions by NetworkPolicies, shared by `NetworkPartition` and
+    `aio.chaos.AsyncNetworkPartition`, which make the API calls.
+    """
     regions: Optional[Tuple[List[Node], List[Node]]] = None
     region_label_key: Optional[str] = None
     region_policy_names: Optional[Tuple[str, str]] = None
+    # kept after deactivation to confirm the partition has healed
+    probe_pair: Optional[Tuple[Node, Node]] = None
+    probe_timeout: float = 30
 
-    def __init__(self, chaos_manager: ChaosManager, **kwargs) -> None:
+    def __init__(self, chaos_manager, **kwargs) -> None:
         super().__init__(chaos_manager=chaos_manager, **kwargs)
+
+    @property
+    def can_activate(self) -> bool:
+        return self.regions is None
+
+    def _partition(self, targets: Optional[Any]):
+        env = self._mgr.env
+        if targets is None:
+            self.regions = random_regions(env.node_instances, self._mgr.random_of(self, 'targets'))
+        else:
+            self.regions = tuple([env.topology.at(*ref) for ref in region] for region in targets)
+        self.targets = [[list(n.ref) for n in region] for region in self.regions]
+
+        self.region_label_key = 'random-offline-label_{}_0'.format(hash(self))
+        self.region_policy_names = tuple(['np-region-{}-{}'.format(hash(self), i) for i in [0, 1]])
+        self.probe_pair = next(((a, b) for a in self.regions[0] for b in self.regions[1] if b.port is not None),
+                                None)
+        if self.probe_pair is None:
+            self.logger.warning('no node pair to probe partition of %s', self.regions)
+
+    def _region_label(self, ri: int) -> Dict[str, str]:
+        return {self.region_label_key: str(ri)}
+
+    def _region_policy(self, ri: int) -> dict:
+        return region_policy(self.region_policy_names[ri], self._region_label(ri), self.regions[ri])
+
+    def _healed(self):
+        self.regions = None
+        self.region_label_key = None
+        self.region_policy_names = None
+
+
+class NetworkPartition(NetworkPartitionBase, ChaosOperator):
+    def activate(self, targets: Optional[Any] = None):
+        self._partition(targets)
+        register(self.deactivate)
+
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            # label both regions first, policies select pods by these labels
+            for _ in pool.map(lambda ri: self._mgr.env.label_manager.add(self.regions[ri], self._region_label(ri)),
+                              (0, 1)):
+                pass
+            for _ in pool.map(self._create_region_policy, (0, 1)):
+                pass
+
+    def _create_region_policy(self, ri: int):
+        self.logger.info('applying region on %s by %s', self.regions[ri], self.region_policy_names[ri])
+        self.api_net_v1.create_namespaced_network_policy(namespace=self._mgr.env.namespace,
+                                                         body=self._region_policy(ri))
+
+    def _delete_region_policy(self, ri: int):
+        self.logger.info('deleting region on %s', self.regions[ri])
+        try:
+            self.api_net_v1.delete_namespaced_network_policy(namespace=self._mgr.env.namespace,
+                                                             name=self.region_policy_names[ri])
+        except ApiException as e:
+            # activation may have failed before this policy was created
+            if e.status != 404:
+                raise
+
+    def confirm(self, active: bool) -> Optional[float]:
+        return wait_reachable(self.probe_pair, not active, self.probe_timeout)
+
+    def deactivate(self):
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            for _ in pool.map(self._delete_region_policy, (0, 1)):
+                pass
+        self._mgr.env.label_manager.remove(sum(self.regions, []), [self.region_label_key])
+        self._healed()
+        unregister(self.deactivate)
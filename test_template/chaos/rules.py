@@ -0,0 +1,39 @@
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from . import ChaosManager, ChaosOperator
+
+
+class ConflictRule:
+    """
+    Checked before activating an operator, against operators already active (or being activated).
+    """
+
+    def allows(self, mgr: 'ChaosManager', op: 'ChaosOperator') -> bool:
+        raise NotImplementedError()
+
+    def __repr__(self) -> str:
+        return self.__class__.__name__
+
+
+class PdMajorityRule(ConflictRule):
+    """
+    Don't let `NodeOffline` operators take down a majority of PD nodes, unless `allow_majority_loss`.
+
+    Operators taking nodes of a role offline are told by their `type_name` (see `NodeOffline`), so async ones
+    (see `aio.chaos`) count as well.
+    """
+
+    def __init__(self, allow_majority_loss: bool = False) -> None:
+        self.allow_majority_loss = allow_majority_loss
+
+    def allows(self, mgr: 'ChaosManager', op: 'ChaosOperator') -> bool:
+        from ..nodes import PdNode
+
+        if self.allow_majority_loss or getattr(op, 'type_name', None) != PdNode.name:
+            return True
+        pd_count = len(mgr.env.topology.role(PdNode))
+        offline = sum(1 for o in mgr.active_operators()
+                      if o is not op and getattr(o, 'type_name', None) == PdNode.name)
+        # remaining PDs must still form a quorum
+        return pd_count - (offline + 1) >= pd_count // 2 + 1
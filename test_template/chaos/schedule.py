@@ -0,0 +1,71 @@
+from abc import ABC
+from random import Random
+from threading import Lock
+from typing import Dict, Optional
+
+
+class Randoms:
+    """
+    Random generators derived from one `seed` by name, e.g. one per operator and purpose: what each draws doesn't
+    depend on the order others draw in (on other threads), so a seed reproduces every stream of decisions.
+    """
+
+    def __init__(self, seed: Optional[int]) -> None:
+        self.seed = seed
+        self._lock = Lock()
+        self._by_name: Dict[str, Random] = {}
+
+    def get(self, *name: str) -> Random:
+        key = '/'.join(name)
+        with self._lock:
+            if key not in self._by_name:
+                self._by_name[key] = Random(None if self.seed is None else '{}/{}'.format(self.seed, key))
+            return self._by_name[key]
+
+
+class Arrival(ABC):
+    """
+    Arrival process of chaos events of one operator.
+
+    Processes keep no state: what they draw is from `rng` of the operator, and the position in the process is given,
+    so one process can be passed for several operators.
+    """
+
+    def next_delay(self, rng: Random, index: int) -> float:
+        """
+        Seconds from the previous arrival (or from the operator being added) to arrival `index` (from 0).
+        """
+        raise NotImplementedError()
+
+
+class Fixed(Arrival):
+    def __init__(self, interval: float) -> None:
+        self.interval = interval
+
+    def next_delay(self, rng: Random, index: int) -> float:
+        return self.interval
+
+
+class Poisson(Arrival):
+    def __init__(self, rate: float) -> None:
+        # arrivals per second
+        self.rate = rate
+
+    def next_delay(self, rng: Random, index: int) -> float:
+        return rng.expovariate(self.rate)
+
+
+class Burst(Arrival):
+    """
+    `count` arrivals `interval` seconds apart, then a quiet period of `gap` seconds.
+    """
+
+    def __init__(self, count: int, interval: float, gap: float) -> None:
+        assert count > 0
+        self.count = count
+        self.interval = interval
+        self.gap = gap
+
+    def next_delay(self, rng: Random, index: int) -> float:
+        # the first arrival of each burst but the first one comes after the gap
+        return self.gap if index and index % self.count == 0 else self.interval
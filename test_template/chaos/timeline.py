@@ -0,0 +1,42 @@
+import json
+from threading import Lock
+from typing import NamedTuple, Optional, List, Tuple, Any, Dict
+
+
+class TimelineEvent(NamedTuple):
+    # seconds since chaos manager started
+    offset: float
+    # operator key, see `ChaosManager.op_key`
+    op: str
+    action: str
+    # operator specific, with nodes as [role, index], see `ChaosOperator.targets`
+    targets: Optional[Any] = None
+
+
+class TimelineRecorder:
+    """
+    Chaos timeline file: a JSON header line (seed and node counts by role) followed by one line per event.
+    """
+
+    def __init__(self, path: str, seed: int, nodes: Dict[str, int]) -> None:
+        self.path = path
+        self._lock = Lock()
+        self._f = open(path, 'w')
+        self._write({'seed': seed, 'nodes': nodes})
+
+    def _write(self, obj: dict):
+        with self._lock:
+            self._f.write(json.dumps(obj) + '\n')
+            self._f.flush()
+
+    def record(self, event: TimelineEvent):
+        self._write(event._asdict())
+
+    def close(self):
+        self._f.close()
+
+
+def load_timeline(path: str) -> Tuple[dict, List[TimelineEvent]]:
+    with open(path) as f:
+        header = json.loads(f.readline())
+        return header, [TimelineEvent(**json.loads(line)) for line in f if line.strip()]
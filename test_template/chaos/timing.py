@@ -0,0 +1,60 @@
+import json
+from threading import Lock
+from typing import NamedTuple, Optional, List, Dict, Tuple
+
+from ..stats import Histogram
+
+
+class FaultTiming(NamedTuple):
+    operator: str
+    phase: str
+    # wall clock times: request issued, API call acknowledged and fault (or recovery) confirmed by probe
+    issued_at: float
+    acked_at: float
+    effective_at: Optional[float]
+
+    @property
+    def ack_seconds(self) -> float:
+        return self.acked_at - self.issued_at
+
+    @property
+    def effective_seconds(self) -> Optional[float]:
+        return None if self.effective_at is None else self.effective_at - self.issued_at
+
+
+class ChaosTimings:
+    """
+    Timings of every `ChaosOperator.activate`/`deactivate`, with histograms per (operator type, phase, metric).
+    """
+
+    def __init__(self) -> None:
+        self._lock = Lock()
+        self.records: List[FaultTiming] = []
+        self.histograms: Dict[Tuple[str, str, str], Histogram] = {}
+
+    def _histogram(self, key: Tuple[str, str, str]) -> Histogram:
+        if key not in self.histograms:
+            self.histograms[key] = Histogram()
+        return self.histograms[key]
+
+    def record(self, timing: FaultTiming):
+        with self._lock:
+            self.records.append(timing)
+            self._histogram((timing.operator, timing.phase, 'ack')).record(timing.ack_seconds)
+            if timing.effective_seconds is not None:
+                self._histogram((timing.operator, timing.phase, 'effective')).record(timing.effective_seconds)
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            ret: Dict[str, Dict[str, Dict[str, dict]]] = {}
+            for ((op, phase, metric), h) in sorted(self.histograms.items()):
+                ret.setdefault(op, {}).setdefault(phase, {})[metric] = h.to_dict()
+            return ret
+
+    def export(self, path: str):
+        histograms = self.to_dict()
+        # transitions are recorded from other threads meanwhile
+        with self._lock:
+            records = [r._asdict() for r in self.records]
+        with open(path, 'w') as f:
+            json.dump({'histograms': histograms, 'records': records}, f, indent=2)
@@ -0,0 +1,334 @@
+"""
+Command line runner of tests (subclasses of `Test`) defined in scripts, e.g. `python -m test_template list`.
+
+Tests are found by parsing scripts rather than importing them, so listing and checking them doesn't wait for
+`kubernetes` or workload dependencies to import. Public class attributes of a test (e.g. `Test.result_path`) are its
+parameters, which can be overridden by `-p name=value`.
+"""
+import ast
+import inspect
+import sys
+from argparse import ArgumentParser
+from fnmatch import fnmatchcase
+from importlib.util import spec_from_file_location, module_from_spec
+from pathlib import Path
+from typing import Dict, List, Optional, Any, Iterable, NamedTuple, Type, TYPE_CHECKING
+
+from .logger import init_logger, get_logger
+
+if TYPE_CHECKING:
+    from . import Test
+
+# methods every runnable test defines itself or inherits from a test which does
+_REQUIRED = ('env', 'test_actions')
+
+
+class TestInfo(NamedTuple):
+    name: str
+    path: str
+    line: int
+    doc: Optional[str]
+    # of this test and its bases, by name: the literal value, or its source if not literal
+    params: Dict[str, Any]
+    runnable: bool
+
+    @property
+    def ref(self) -> str:
+        return '{}:{}'.format(self.path, self.name)
+
+
+class _ClassDef(NamedTuple):
+    node: ast.ClassDef
+    path: str
+    source: str
+
+    @property
+    def bases(self) -> List[str]:
+        # names only, classes are told apart by name
+        return [b.attr if isinstance(b, ast.Attribute) else getattr(b, 'id', '') for b in self.node.bases]
+
+    def attributes(self) -> Dict[str, Any]:
+        ret = {}
+        for stmt in self.node.body:
+            if isinstance(stmt, ast.Assign):
+                (targets, value) = (stmt.targets, stmt.value)
+            elif isinstance(stmt, ast.AnnAssign) and stmt.value is not None:
+                (targets, value) = ([stmt.target], stmt.value)
+            else:
+                continue
+            for t in targets:
+                if isinstance(t, ast.Name) and not t.id.startswith('_'):
+                    try:
+                        ret[t.id] = ast.literal_eval(value)
+                    except ValueError:
+                        ret[t.id] = ast.get_source_segment(self.source, value)
+        return ret
+
+    def methods(self) -> List[str]:
+        return [f.name for f in self.node.body if isinstance(f, (ast.FunctionDef, ast.AsyncFunctionDef))]
+
+
+def _class_defs(path: Path) -> List[_ClassDef]:
+    source = path.read_text()
+    try:
+        tree = ast.parse(source, str(path))
+    except SyntaxError as e:
+        get_logger('cli').warning('skipping %s: %s', path, e)
+        return []
+    return [_ClassDef(n, str(path), source) for n in tree.body if isinstance(n, ast.ClassDef)]
+
+
+def _scripts(paths: Iterable[str]) -> List[Path]:
+    ret = []
+    for p in map(Path, paths):
+        ret += sorted(p.glob('*.py')) if p.is_dir() else [p]
+    return ret
+
+
+def discover(paths: Iterable[str] = ('.',)) -> List[TestInfo]:
+    """
+    Tests defined in scripts of `paths` (files, or directories whose `*.py` files are scanned), without importing them.
+    """
+    # `Test` itself, for its parameters
+    (base,) = [c for c in _class_defs(Path(__file__).parent / '__init__.py') if c.node.name == 'Test']
+    defs = [c for p in _scripts(paths) for c in _class_defs(p)]
+    by_name: Dict[str, _ClassDef] = {'Test': base}
+
+    # subclasses of subclasses, across scripts (e.g. `ssb-chaos.py` extends tests of `ssb.py`)
+    changed = True
+    while changed:
+        changed = False
+        for c in defs:
+            if c.node.name not in by_name and any(b in by_name for b in c.bases):
+                by_name[c.node.name] = c
+                changed = True
+
+    def lineage(c: _ClassDef) -> List[_ClassDef]:
+        # from `Test` down to `c`, bases in reverse order so that the first base overrides the others
+        ret = []
+        for b in reversed(c.bases):
+            if b in by_name and by_name[b] is not c:
+                ret += [a for a in lineage(by_name[b]) if a not in ret]
+        return ret + [c]
+
+    ret = []
+    for (name, c) in by_name.items():
+        if c is base:
+            continue
+        params: Dict[str, Any] = {}
+        methods = set()
+        for a in lineage(c):
+            params.update(a.attributes())
+            if a is not base:
+                methods.update(a.methods())
+        ret.append(TestInfo(name, c.path, c.node.lineno, ast.get_docstring(c.node), params,
+                            all(m in methods for m in _REQUIRED)))
+    return ret
+
+
+def select(tests: List[TestInfo], patterns: Iterable[str]) -> List[TestInfo]:
+    """
+    Runnable tests matching any of `patterns`: names, `path:name`, or shell-style wildcards of them.
+    """
+    ret = []
+    for pattern in patterns:
+        matched = [t for t in tests if t.runnable and (fnmatchcase(t.name, pattern) or fnmatchcase(t.ref, pattern))]
+        if not matched:
+            raise ValueError('no test matches {}'.format(pattern))
+        ret += [t for t in matched if t not in ret]
+    return ret
+
+
+def parse_params(params: Iterable[str]) -> Dict[str, Any]:
+    """
+    `name=value` pairs, values are Python literals or taken as strings.
+    """
+    ret = {}
+    for p in params:
+        (name, sep, value) = p.partition('=')
+        if not sep:
+            raise ValueError('parameter {} is not name=value'.format(p))
+        try:
+            ret[name] = ast.literal_eval(value)
+        except (ValueError, SyntaxError):
+            ret[name] = value
+    return ret
+
+
+def check_params(tests: List[TestInfo], params: Dict[str, Any]):
+    """
+    Each of `params` must be a parameter of at least one of `tests`, tests are only given their own (see
+    `params_of`).
+    """
+    unknown = sorted(set(params) - {name for t in tests for name in t.params})
+    if unknown:
+        raise ValueError('unknown parameter(s) {} of {}, known: {}'.format(
+            ', '.join(unknown), ', '.join(t.name for t in tests),
+            ', '.join(sorted({name for t in tests for name in t.params}))))
+
+
+def params_of(test: TestInfo, params: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: v for (k, v) in params.items() if k in test.params}
+
+
+class LoadError(Exception):
+    """
+    A script of tests failed to import, as opposed to a wrong command line.
+    """
+
+
+def load(test: TestInfo, params: Optional[Dict[str, Any]] = None) -> Type['Test']:
+    """
+    Import the script of `test` and return its class, subclassed with `params` as class attributes if given.
+
+    Raises `LoadError` if the script fails to import.
+    """
+    path = Path(test.path).resolve()
+    # scripts import each other by name, e.g. `from ssb import ...`
+    if str(path.parent) not in sys.path:
+        sys.path.insert(0, str(path.parent))
+    module = sys.modules.get(path.stem)
+    if module is None or Path(getattr(module, '__file__', '') or '').resolve() != path:
+        spec = spec_from_file_location(path.stem, str(path))
+        module = module_from_spec(spec)
+        sys.modules[path.stem] = module
+        try:
+            spec.loader.exec_module(module)
+        except Exception as e:
+            del sys.modules[path.stem]
+            raise LoadError('failed to load {}: {!r}'.format(path, e)) from e
+    cls = getattr(module, test.name)
+    if params:
+        cls = type(cls.__name__, (cls,), dict(params, __module__=cls.__module__, __doc__=cls.__doc__))
+    return cls
+
+
+def kube_apis(config_file: Optional[str] = None, context: Optional[str] = None) -> Dict[str, object]:
+    """
+    API clients of the kube config, as keyword arguments of tests (see `fake.FakeCluster.apis`).
+    """
+    from kubernetes import client, config
+    config.load_kube_config(config_file=config_file, context=context)
+    return {'api_core_v1': client.CoreV1Api(), 'api_apps_v1': client.AppsV1Api(),
+            'api_net_v1': client.NetworkingV1Api()}
+
+
+def accepted(cls: type, kwargs: Dict[str, object]) -> Dict[str, object]:
+    """
+    Those of `kwargs` taken by `__init__` of any class of `cls` (e.g. `api_net_v1` by `NetworkingV1ApiMixin`).
+    """
+    names = set()
+    for c in cls.__mro__:
+        if '__init__' in c.__dict__:
+            names.update(inspect.signature(c.__dict__['__init__']).parameters)
+    return {k: v for (k, v) in kwargs.items() if k in names}
+
+
+def start(test: Type['Test'], apis: Optional[Dict[str, object]] = None, **kwargs):
+    """
+    Run `test` with API clients of the kube config if `apis` is not given, for `__main__` of scripts.
+    """
+    init_logger()
+    if apis is None:
+        apis = kube_apis()
+    test(**accepted(test, apis), **kwargs).start()
+
+
+def _list(args) -> int:
+    tests = discover(args.path)
+    if args.pattern:
+        tests = select(tests, args.pattern)
+    for t in sorted(tests, key=lambda i: (i.path, i.line)):
+        if not t.runnable and not args.all:
+            continue
+        doc = (t.doc or '').strip().split('\n')[0]
+        print('{}{}{}'.format(t.ref, '' if t.runnable else ' (abstract)', '  ' + doc if doc else ''))
+        if args.verbose:
+            for (name, value) in sorted(t.params.items()):
+                print('    {} = {!r}'.format(name, value))
+    return 0
+
+
+def _run(args) -> int:
+    params = parse_params(args.param)
+    tests = select(discover(args.path), args.pattern)
+    check_params(tests, params)
+    if args.dry_run:
+        for t in tests:
+            print('{} {}'.format(t.ref, dict(t.params, **params_of(t, params))))
+        return 0
+
+    init_logger(args.log_level.upper())
+    logger = get_logger('cli')
+    if args.fake:
+        from .fake import FakeCluster
+        apis = FakeCluster(pod_start_delay=0.1).apis()
+    else:
+        apis = kube_apis(args.kubeconfig, args.context)
+    classes = [load(t, params_of(t, params)) for t in tests]
+
+    if args.parallel > 1:
+        from .campaign import Campaign
+        campaign = Campaign(apis['api_core_v1'], apis['api_apps_v1'], max_parallel=args.parallel)
+        for cls in classes:
+            campaign.add(cls, **{k: v for (k, v) in accepted(cls, apis).items()
+                                 if k not in ('api_core_v1', 'api_apps_v1')})
+        return sum(1 for r in campaign.run() if not r.ok)
+
+    failed = 0
+    for cls in classes:
+        test = None
+        try:
+            test = cls(namespace=args.namespace, **accepted(cls, apis))
+            test.start()
+        except Exception:
+            logger.exception('%s failed', cls.__name__)
+            failed += 1
+        finally:
+            if test is not None:
+                # the test bed is destroyed even if closing chaos raises, not to leak the deployment
+                try:
+                    if test._chaos_manager is not None:
+                        test._chaos_manager.close()
+                finally:
+                    test.env_instance.destroy()
+    return failed
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    from . import DEFAULT_NAMESPACE
+
+    common = ArgumentParser(add_help=False)
+    common.add_argument('--path', action='append', help='script or directory of scripts to find tests in (default .)')
+    parser = ArgumentParser(prog='python -m test_template', description=__doc__.strip().split('\n')[0])
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('list', parents=[common], help='list tests')
+    p.add_argument('pattern', nargs='*', help='name, path:name or wildcards of them')
+    p.add_argument('-v', '--verbose', action='store_true', help='show parameters with their defaults')
+    p.add_argument('-a', '--all', action='store_true', help='also tests missing `env` or `test_actions`')
+    p.set_defaults(func=_list)
+
+    p = sub.add_parser('run', parents=[common],
+                       help='run tests one after another, or in parallel (each in a namespace of its own)')
+    p.add_argument('pattern', nargs='+', help='name, path:name or wildcards of them')
+    p.add_argument('-p', '--param', action='append', default=[], metavar='NAME=VALUE',
+                   help='override a parameter (class attribute) of the tests, VALUE is a Python literal or string')
+    p.add_argument('-n', '--namespace', default=DEFAULT_NAMESPACE)
+    p.add_argument('-j', '--parallel', type=int, default=1)
+    p.add_argument('--dry-run', action='store_true', help='check selection and parameters only')
+    p.add_argument('--fake', action='store_true', help='run on `fake.FakeCluster` instead of a cluster')
+    p.add_argument('--log-level', default='INFO', help='of console logs, e.g. DEBUG')
+    p.add_argument('--kubeconfig')
+    p.add_argument('--context')
+    p.set_defaults(func=_run)
+
+    args = parser.parse_args(argv)
+    args.path = args.path or ['.']
+    try:
+        return args.func(args)
+    except LoadError as e:
+        get_logger('cli').error(str(e), exc_info=e.__cause__)
+        return 1
+    except ValueError as e:
+        parser.error(str(e))
@@ -0,0 +1,553 @@
+"""
+In-memory stand-in of the Kubernetes APIs used by the framework, to run and time it without a cluster.
+
+Namespaces, pods, deployments, labels and NetworkPolicies are kept in a `FakeCluster`; API calls can be slowed down
+or failed on purpose, and exec runs a simulated shell (see `FakeCluster.exec_handlers`), which evaluates connectivity
+probes against the NetworkPolicies.
+"""
+import re
+from collections import deque
+from copy import deepcopy
+from itertools import count
+from random import Random
+from threading import Lock, Condition, Timer
+from time import sleep, monotonic, strftime, gmtime
+from typing import Dict, Tuple, List, Optional, Callable, Union, Iterator, Pattern, Deque
+
+from kubernetes.client import V1Pod, V1ObjectMeta, V1PodStatus, V1PodList, V1ListMeta
+from kubernetes.client.rest import ApiException
+
+from .session import FRAME
+
+ExecHandler = Callable[['FakeCluster', V1Pod, 're.Match'], Tuple[int, str, str]]
+
+
+def _frame_re() -> Pattern:
+    pattern = ''
+    for part in re.split(r'({cmd}|{marker})', FRAME):
+        if part == '{cmd}':
+            pattern += '(?P<cmd>.*?)'
+        elif part == '{marker}':
+            pattern += '(?P=marker)' if '(?P<marker>' in pattern else '(?P<marker>\\S+)'
+        else:
+            pattern += re.escape(part)
+    return re.compile(pattern, re.S)
+
+
+_FRAME_RE = _frame_re()
+
+
+def _parse_selector(selector: Optional[str]) -> Dict[str, str]:
+    if not selector:
+        return {}
+    return dict(i.split('=', 1) for i in selector.split(','))
+
+
+def _matches(labels: Optional[Dict[str, str]], match_labels: Optional[Dict[str, str]]) -> bool:
+    labels = labels or {}
+    return all(labels.get(k) == v for (k, v) in (match_labels or {}).items())
+
+
+def _tcp_probe(cluster: 'FakeCluster', pod: V1Pod, m) -> Tuple[int, str, str]:
+    return (0, '', '') if cluster.reachable(pod, m.group('ip')) else (1, '', 'Connection timed out')
+
+
+def _metrics(cluster: 'FakeCluster', pod: V1Pod, m) -> Tuple[int, str, str]:
+    if not cluster.reachable(pod, m.group('ip')):
+        return 4, '', 'wget: download timed out'
+    with cluster._lock:
+        n = cluster.scrapes[m.group('ip')] = cluster.scrapes.get(m.group('ip'), 0) + 1
+    return 0, '# TYPE fake_scrapes_total counter\nfake_scrapes_total{{port="{}"}} {}\n'.format(m.group('port'), n), ''
+
+
+def _tmux(cluster: 'FakeCluster', pod: V1Pod, m) -> Tuple[int, str, str]:
+    with cluster._lock:
+        cluster.processes.setdefault(pod.metadata.name, []).append(m.group(0))
+    for log_file in re.findall(r'--log-file=([^\s\'"]+)', m.group(0)):
+        cluster.write_log(pod.metadata.name, log_file, 'started')
+    return 0, '', ''
+
+
+def _kill_tmux(cluster: 'FakeCluster', pod: V1Pod, m) -> Tuple[int, str, str]:
+    with cluster._lock:
+        cluster.processes.pop(pod.metadata.name, None)
+        for key in [k for k in cluster.logs if k[0] == pod.metadata.name]:
+            del cluster.logs[key]
+    return 0, '', ''
+
+
+def _tc(cluster: 'FakeCluster', pod: V1Pod, m) -> Tuple[int, str, str]:
+    key = (pod.metadata.name, m.group('dev'))
+    with cluster._lock:
+        if m.group('op') == 'replace':
+            cluster.qdiscs[key] = m.group('qdisc')
+        elif m.group('op') == 'del':
+            if cluster.qdiscs.pop(key, None) is None:
+                return 2, '', 'RTNETLINK answers: No such file or directory'
+        else:
+            shown = 'qdisc {} 8001: root refcnt 2 {}'.format(*cluster.qdiscs[key].split(' ', 1)) \
+                if key in cluster.qdiscs else 'qdisc noqueue 0: root refcnt 2'
+            if m.group('grep') is not None:
+                return (0 if m.group('grep') in shown else 1), '', ''
+            return 0, shown + '\n', ''
+    return 0, '', ''
+
+
+def _iptables(cluster: 'FakeCluster', pod: V1Pod, m) -> Tuple[int, str, str]:
+    rules = [(m.group('chain'), ip) for ip in m.group('ips').split(',')]
+    with cluster._lock:
+        drops = cluster.drops.setdefault(pod.metadata.name, [])
+        if m.group('op') == 'I':
+            drops[:0] = rules
+        elif any(r not in drops for r in rules):
+            return 1, '', 'iptables: Bad rule (does a matching rule exist in that chain?).'
+        elif m.group('op') == 'D':
+            for r in rules:
+                drops.remove(r)
+    return 0, '', ''
+
+
+def _read_log(cluster: 'FakeCluster', pod: V1Pod, m) -> Tuple[int, str, str]:
+    with cluster._lock:
+        data = cluster.logs.get((pod.metadata.name, m.group('file')), b'')
+    start = int(m.group('start')) - 1
+    chunk = data[start:start + int(m.group('n'))]
+    return 0, '{}\n{}'.format(len(data), chunk.decode(errors='replace')), ''
+
+
+class FakeCluster:
+    """
+    :param latency: seconds added to every API call, or by call name (method name of the API, `exec` for commands)
+        with 'default' for the rest
+    :param failure_rate: probability of an API call to fail with 500, as a number or by call name as `latency`
+    :param pod_start_delay: seconds for a created pod to turn from Pending to Running
+    :param max_events: pod watch events kept, watches from an older resource version fail with 410 Gone
+    """
+
+    def __init__(self, latency: Union[float, Dict[str, float]] = 0,
+                 failure_rate: Union[float, Dict[str, float]] = 0,
+                 pod_start_delay: float = 0, seed: Optional[int] = None, max_events: int = 4096) -> None:
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.pod_start_delay = pod_start_delay
+        self.random = Random(seed)
+
+        self._lock = Lock()
+        self._changed = Condition(self._lock)
+        self._version = count(1)
+        self._ip = count(1)
+
+        self.namespaces = {'default'}
+        self.pods: Dict[Tuple[str, str], V1Pod] = {}
+        self.deployments: Dict[Tuple[str, str], dict] = {}
+        self.network_policies: Dict[Tuple[str, str], dict] = {}
+        # latest pod watch events: (resource version, type, pod), versions are consecutive
+        self.events: Deque[Tuple[int, str, V1Pod]] = deque(maxlen=max_events)
+        self.resource_version = 0
+        self.calls: Dict[str, int] = {}
+        # commands started in background by pod name
+        self.processes: Dict[str, List[str]] = {}
+        # scrapes of `/metrics` by pod IP
+        self.scrapes: Dict[str, int] = {}
+        # content of log files by (pod name, path)
+        self.logs: Dict[Tuple[str, str], bytes] = {}
+        # root qdisc (as given to `tc`) by (pod name, interface), and iptables DROP rules by pod name: (chain, peer IP)
+        self.qdiscs: Dict[Tuple[str, str], str] = {}
+        self.drops: Dict[str, List[Tuple[str, str]]] = {}
+        # first matched handler runs the command, otherwise it succeeds without output
+        self.exec_handlers: List[Tuple[Pattern, ExecHandler]] = [
+            (re.compile(r'/dev/tcp/(?P<ip>[\d.]+)/(?P<port>\d+)'), _tcp_probe),
+            (re.compile(r'tmux new-session .*'), _tmux),
+            (re.compile(r'tmux kill-server'), _kill_tmux),
+            (re.compile(r'wget .*http://(?P<ip>[\d.]+):(?P<port>\d+)/metrics'), _metrics),
+            (re.compile(r'f=(?P<file>\S+); stat -c %s .* tail -c \+(?P<start>\d+) .* head -c (?P<n>\d+)'), _read_log),
+            (re.compile(r'tc qdisc (?P<op>replace|del|show) dev (?P<dev>\S+)(?: root ?(?P<qdisc>.*?))?'
+                        r'(?: \| grep -q "(?P<grep>[^"]*)")?$'), _tc),
+            (re.compile(r'iptables -(?P<op>[IDC]) (?P<chain>INPUT|OUTPUT) -[sd] (?P<ips>[\d.,]+) -j DROP'), _iptables),
+        ]
+
+    def _by_name(self, v: Union[float, Dict[str, float]], name: str) -> float:
+        return v.get(name, v.get('default', 0)) if isinstance(v, dict) else v
+
+    def call(self, name: str):
+        """
+        Account, delay and maybe fail an API call.
+        """
+        with self._lock:
+            self.calls[name] = self.calls.get(name, 0) + 1
+        latency = self._by_name(self.latency, name)
+        if latency:
+            sleep(latency)
+        if self.random.random() < self._by_name(self.failure_rate, name):
+            raise ApiException(status=500, reason='injected failure of {}'.format(name))
+
+    def apis(self) -> Dict[str, object]:
+        """
+        Keyword arguments of API clients for `Test` and operators, with the watch and exec stream factories of
+        `TestBed`.
+        """
+        return {'api_core_v1': FakeCoreV1Api(self), 'api_apps_v1': FakeAppsV1Api(self),
+                'api_net_v1': FakeNetworkingV1Api(self), 'new_watch': self.new_watch,
+                'exec_stream': self.exec_stream}
+
+    def new_watch(self) -> 'FakeWatch':
+        return FakeWatch(self)
+
+    def exec_stream(self, api_core_v1, namespace: str, name: str, **kwargs) -> 'FakeShell':
+        self.call('connect_get_namespaced_pod_exec')
+        with self._lock:
+            self._pod(namespace, name)
+        return FakeShell(self, namespace, name)
+
+    def _emit(self, event_type: str, pod: V1Pod):
+        # with lock held
+        self.resource_version = next(self._version)
+        pod.metadata.resource_version = str(self.resource_version)
+        self.events.append((self.resource_version, event_type, deepcopy(pod)))
+        self._changed.notify_all()
+
+    def events_since(self, version: int) -> List[Tuple[int, str, V1Pod]]:
+        """
+        Events after resource `version` (with lock held), read from the latest back so a watch keeping up only pays
+        for what's new.
+        """
+        ret = []
+        for e in reversed(self.events):
+            if e[0] <= version:
+                break
+            ret.append(e)
+        if ret and ret[-1][0] > version + 1:
+            raise ApiException(status=410, reason='too old resource version: {}'.format(version))
+        ret.reverse()
+        return ret
+
+    def _namespace(self, namespace: str):
+        if namespace not in self.namespaces:
+            raise ApiException(status=404, reason='namespace {} not found'.format(namespace))
+
+    def delete_namespace(self, namespace: str):
+        with self._lock:
+            self._namespace(namespace)
+            self.namespaces.remove(namespace)
+            for key in [k for k in self.pods if k[0] == namespace]:
+                pod = self.pods.pop(key)
+                self.processes.pop(pod.metadata.name, None)
+                self._emit('DELETED', pod)
+            for objects in (self.deployments, self.network_policies):
+                for key in [k for k in objects if k[0] == namespace]:
+                    del objects[key]
+
+    def _pod(self, namespace: str, name: str) -> V1Pod:
+        try:
+            return self.pods[(namespace, name)]
+        except KeyError:
+            raise ApiException(status=404, reason='pod {}/{} not found'.format(namespace, name))
+
+    def list_pods(self, namespace: str, label_selector: Optional[str] = None) -> List[V1Pod]:
+        match = _parse_selector(label_selector)
+        with self._lock:
+            return [deepcopy(p) for ((ns, _), p) in self.pods.items()
+                    if ns == namespace and _matches(p.metadata.labels, match)]
+
+    def create_pods(self, namespace: str, prefix: str, labels: Dict[str, str], replicas: int) -> List[str]:
+        names = []
+        with self._lock:
+            for _ in range(replicas):
+                name = '{}-{:05x}'.format(prefix, self.random.getrandbits(20))
+                ip = next(self._ip)
+                pod = V1Pod(metadata=V1ObjectMeta(name=name, namespace=namespace, labels=dict(labels)),
+                            status=V1PodStatus(phase='Pending', pod_ip='10.{}.{}.{}'.format(
+                                ip >> 16 & 255, ip >> 8 & 255, ip & 255)))
+                self.pods[(namespace, name)] = pod
+                self._emit('ADDED', pod)
+                names.append(name)
+
+        def run():
+            with self._lock:
+                for n in names:
+                    if (namespace, n) in self.pods:
+                        self.pods[(namespace, n)].status.phase = 'Running'
+                        self._emit('MODIFIED', self.pods[(namespace, n)])
+
+        if self.pod_start_delay:
+            Timer(self.pod_start_delay, run).start()
+        else:
+            run()
+        return names
+
+    def delete_pods(self, namespace: str, labels: Dict[str, str]):
+        with self._lock:
+            for key in [k for (k, p) in self.pods.items() if k[0] == namespace and _matches(p.metadata.labels, labels)]:
+                pod = self.pods.pop(key)
+                self.processes.pop(pod.metadata.name, None)
+                self._emit('DELETED', pod)
+
+    def delete_pod(self, namespace: str, name: str):
+        """
+        Delete a pod, a deployment it belongs to creates another.
+        """
+        with self._lock:
+            pod = self._pod(namespace, name)
+            del self.pods[(namespace, name)]
+            self.processes.pop(name, None)
+            self._emit('DELETED', pod)
+            owner = next(((n, d) for ((ns, n), d) in self.deployments.items() if ns == namespace
+                          and _matches(pod.metadata.labels, d['spec']['selector']['matchLabels'])), None)
+        if owner is not None:
+            self.create_pods(namespace, owner[0], owner[1]['spec']['template']['metadata']['labels'], 1)
+
+    def patch_labels(self, namespace: str, name: str, body: Union[list, dict]):
+        with self._lock:
+            pod = self._pod(namespace, name)
+            labels = dict(pod.metadata.labels or {})
+            if isinstance(body, list):
+                # JSON patch on labels only
+                for op in body:
+                    key = op['path'][len('/metadata/labels/'):].replace('~1', '/').replace('~0', '~')
+                    if op['op'] in ('add', 'replace'):
+                        labels[key] = op['value']
+                    elif op['op'] == 'remove':
+                        if key not in labels:
+                            raise ApiException(status=422, reason='label {} not found'.format(key))
+                        labels.pop(key)
+            else:
+                version = body.get('metadata', {}).get('resourceVersion')
+                if version is not None and version != pod.metadata.resource_version:
+                    raise ApiException(status=409, reason='pod {} has changed since version {}'.format(name, version))
+                for (k, v) in body.get('metadata', {}).get('labels', {}).items():
+                    if v is None:
+                        labels.pop(k, None)
+                    else:
+                        labels[k] = v
+            pod.metadata.labels = labels
+            self._emit('MODIFIED', pod)
+            return deepcopy(pod)
+
+    def _allowed(self, pod: V1Pod, peer: V1Pod, direction: str) -> bool:
+        """
+        Whether NetworkPolicies selecting `pod` allow `direction` ('ingress' or 'egress') traffic with `peer`.
+        """
+        selecting = [p for ((ns, _), p) in self.network_policies.items()
+                     if ns == pod.metadata.namespace
+                     and _matches(pod.metadata.labels, p['spec'].get('podSelector', {}).get('matchLabels'))
+                     and direction.capitalize() in p['spec'].get('policyTypes', ['Ingress'])]
+        if not selecting:
+            return True
+        for policy in selecting:
+            for rule in policy['spec'].get(direction, None) or []:
+                for p in rule.get('from' if direction == 'ingress' else 'to', []):
+                    if 'ipBlock' in p and p['ipBlock']['cidr'] == '{}/32'.format(peer.status.pod_ip):
+                        return True
+                    if 'podSelector' in p and _matches(peer.metadata.labels, p['podSelector'].get('matchLabels')):
+                        return True
+        return False
+
+    def _not_dropped(self, pod: V1Pod, peer: V1Pod) -> bool:
+        # both ways, a connection needs replies
+        drops = self.drops.get(pod.metadata.name, ())
+        return ('OUTPUT', peer.status.pod_ip) not in drops and ('INPUT', peer.status.pod_ip) not in drops
+
+    def write_log(self, pod_name: str, path: str, message: str, level: str = 'INFO'):
+        """
+        Append a line to a log file in a pod, in the format of PD, TiKV and TiDB logs.
+        """
+        line = '[{}] [{}] {}\n'.format(strftime('%Y/%m/%d %H:%M:%S.000 +00:00', gmtime()), level, message)
+        with self._lock:
+            self.logs[(pod_name, path)] = self.logs.get((pod_name, path), b'') + line.encode()
+
+    def reachable(self, src: V1Pod, ip: str) -> bool:
+        with self._lock:
+            dst = next((p for p in self.pods.values() if p.status.pod_ip == ip), None)
+            if dst is None or dst.status.phase != 'Running':
+                return False
+            return self._allowed(src, dst, 'egress') and self._allowed(dst, src, 'ingress') \
+                and self._not_dropped(src, dst) and self._not_dropped(dst, src)
+
+    def run_command(self, namespace: str, name: str, cmd: str) -> Tuple[int, str, str]:
+        self.call('exec')
+        with self._lock:
+            pod = deepcopy(self._pod(namespace, name))
+        for (pattern, handler) in self.exec_handlers:
+            m = pattern.search(cmd)
+            if m is not None:
+                return handler(self, pod, m)
+        return 0, '', ''
+
+
+class FakeShell:
+    """
+    Simulated `bash` over exec, speaks the protocol of `ExecSession` (same interface as `WSClient`).
+    """
+
+    def __init__(self, cluster: FakeCluster, namespace: str, name: str) -> None:
+        self.cluster = cluster
+        self.namespace = namespace
+        self.name = name
+        self._open = True
+        self._stdin = ''
+        self._stdout = ''
+        self._stderr = ''
+
+    def is_open(self) -> bool:
+        return self._open
+
+    def close(self, **kwargs):
+        self._open = False
+
+    def write_stdin(self, data: str):
+        self._stdin += data
+        while True:
+            m = _FRAME_RE.match(self._stdin)
+            if m is None:
+                break
+            self._stdin = self._stdin[m.end():]
+            (rc, out, err) = self.cluster.run_command(self.namespace, self.name, m.group('cmd'))
+            self._stdout += '{}{} {}\n'.format(out, m.group('marker'), rc)
+            self._stderr += '{}{}\n'.format(err, m.group('marker'))
+
+    def update(self, timeout: float = 0):
+        pass
+
+    def peek_stdout(self, timeout: float = 0) -> str:
+        return self._stdout
+
+    def read_stdout(self, timeout: Optional[float] = None) -> str:
+        (ret, self._stdout) = (self._stdout, '')
+        return ret
+
+    def peek_stderr(self, timeout: float = 0) -> str:
+        return self._stderr
+
+    def read_stderr(self, timeout: Optional[float] = None) -> str:
+        (ret, self._stderr) = (self._stderr, '')
+        return ret
+
+
+class FakeWatch:
+    """
+    Same interface as `kubernetes.watch.Watch`, for pods of a `FakeCluster`.
+    """
+
+    def __init__(self, cluster: FakeCluster) -> None:
+        self.cluster = cluster
+        self._stopped = False
+
+    def stop(self):
+        self._stopped = True
+
+    def stream(self, func, namespace: str, label_selector: Optional[str] = None,
+               resource_version: Optional[str] = None, timeout_seconds: Optional[float] = None,
+               **kwargs) -> Iterator[dict]:
+        match = _parse_selector(label_selector)
+        deadline = None if timeout_seconds is None else monotonic() + timeout_seconds
+        cluster = self.cluster
+        if resource_version is None:
+            # as API servers do, start with the current pods then follow changes
+            with cluster._lock:
+                since = cluster.resource_version
+                pods = [deepcopy(p) for ((ns, _), p) in cluster.pods.items()
+                        if ns == namespace and _matches(p.metadata.labels, match)]
+            for pod in pods:
+                if self._stopped:
+                    return
+                yield {'type': 'ADDED', 'object': pod}
+        else:
+            since = int(resource_version)
+        while not self._stopped:
+            with cluster._changed:
+                pending = cluster.events_since(since)
+                if not pending:
+                    if deadline is not None and monotonic() >= deadline:
+                        return
+                    cluster._changed.wait(None if deadline is None else deadline - monotonic())
+                    continue
+            for (version, event_type, pod) in pending:
+                since = version
+                if pod.metadata.namespace == namespace and _matches(pod.metadata.labels, match):
+                    yield {'type': event_type, 'object': deepcopy(pod)}
+                if self._stopped:
+                    return
+
+
+class FakeCoreV1Api:
+    def __init__(self, cluster: FakeCluster) -> None:
+        self.cluster = cluster
+
+    def create_namespace(self, body: dict, **kwargs) -> dict:
+        self.cluster.call('create_namespace')
+        name = body['metadata']['name']
+        with self.cluster._lock:
+            if name in self.cluster.namespaces:
+                raise ApiException(status=409, reason='namespace {} exists'.format(name))
+            self.cluster.namespaces.add(name)
+        return body
+
+    def delete_namespace(self, name: str, **kwargs):
+        self.cluster.call('delete_namespace')
+        self.cluster.delete_namespace(name)
+
+    def list_namespaced_pod(self, namespace: str, label_selector: Optional[str] = None, **kwargs) -> V1PodList:
+        self.cluster.call('list_namespaced_pod')
+        with self.cluster._lock:
+            version = str(self.cluster.resource_version)
+        return V1PodList(items=self.cluster.list_pods(namespace, label_selector),
+                         metadata=V1ListMeta(resource_version=version))
+
+    def read_namespaced_pod(self, name: str, namespace: str, **kwargs) -> V1Pod:
+        self.cluster.call('read_namespaced_pod')
+        with self.cluster._lock:
+            return deepcopy(self.cluster._pod(namespace, name))
+
+    def patch_namespaced_pod(self, name: str, namespace: str, body: Union[list, dict], **kwargs) -> V1Pod:
+        self.cluster.call('patch_namespaced_pod')
+        return self.cluster.patch_labels(namespace, name, body)
+
+    def delete_namespaced_pod(self, name: str, namespace: str, **kwargs):
+        self.cluster.call('delete_namespaced_pod')
+        self.cluster.delete_pod(namespace, name)
+
+
+class FakeAppsV1Api:
+    def __init__(self, cluster: FakeCluster) -> None:
+        self.cluster = cluster
+
+    def create_namespaced_deployment(self, namespace: str, body: dict, **kwargs) -> dict:
+        self.cluster.call('create_namespaced_deployment')
+        name = body['metadata']['name']
+        with self.cluster._lock:
+            self.cluster._namespace(namespace)
+            if (namespace, name) in self.cluster.deployments:
+                raise ApiException(status=409, reason='deployment {} exists'.format(name))
+            self.cluster.deployments[(namespace, name)] = body
+        self.cluster.create_pods(namespace, name, body['spec']['template']['metadata']['labels'],
+                                 body['spec']['replicas'])
+        return body
+
+    def delete_namespaced_deployment(self, name: str, namespace: str, **kwargs):
+        self.cluster.call('delete_namespaced_deployment')
+        with self.cluster._lock:
+            body = self.cluster.deployments.pop((namespace, name), None)
+        if body is None:
+            raise ApiException(status=404, reason='deployment {} not found'.format(name))
+        self.cluster.delete_pods(namespace, body['spec']['selector']['matchLabels'])
+
+
+class FakeNetworkingV1Api:
+    def __init__(self, cluster: FakeCluster) -> None:
+        self.cluster = cluster
+
+    def create_namespaced_network_policy(self, namespace: str, body: dict, **kwargs) -> dict:
+        self.cluster.call('create_namespaced_network_policy')
+        name = body['metadata']['name']
+        with self.cluster._lock:
+            self.cluster._namespace(namespace)
+            if (namespace, name) in self.cluster.network_policies:
+                raise ApiException(status=409, reason='network policy {} exists'.format(name))
+            self.cluster.network_policies[(namespace, name)] = deepcopy(body)
+        return body
+
+    def delete_namespaced_network_policy(self, name: str, namespace: str, **kwargs):
+        self.cluster.call('delete_namespaced_network_policy')
+        with self.cluster._lock:
+            if self.cluster.network_policies.pop((namespace, name), None) is None:
+                raise ApiException(status=404, reason='network policy {} not found'.format(name))
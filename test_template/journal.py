@@ -0,0 +1,129 @@
+"""
+Journal of structured test events (actions, chaos transitions, node commands) as JSON Lines, written in background.
+"""
+import json
+import logging
+from queue import Queue, Full
+from random import Random
+from threading import Thread, Lock
+from time import time
+from typing import Dict, Optional, Iterable, Iterator, TYPE_CHECKING
+
+from .mixins import LoggerMixin
+from .results import _file_lock
+
+if TYPE_CHECKING:
+    from .chaos.timing import FaultTiming
+
+# least level of events journaled by category, others default to `logging.INFO`
+DEFAULT_LEVELS = {
+    'action': logging.INFO,
+    'chaos': logging.INFO,
+    # successful commands are DEBUG, failed ones WARNING
+    'exec': logging.WARNING,
+}
+
+
+class EventJournal(LoggerMixin):
+    """
+    Events recorded by `record` are queued and appended to `path` by a writer thread, one JSON object per line with
+    time (`t`), category (`cat`), `level`, `event`, and `fields` of the journal (e.g. the run id) and of the event.
+
+    Each category has a least level (`levels`) and a sample rate (`sample`, fraction of events kept) of its own;
+    events of WARNING and above are never sampled out. Recording never blocks: when `max_pending` events are waiting
+    for the writer, new ones are dropped and counted in `dropped`.
+    """
+
+    def __init__(self, path: str, levels: Optional[Dict[str, int]] = None, sample: Optional[Dict[str, float]] = None,
+                 fields: Optional[Dict[str, object]] = None, max_pending: int = 65536, seed: Optional[int] = None,
+                 **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.path = path
+        self.levels = dict(DEFAULT_LEVELS, **(levels or {}))
+        self.sample = dict(sample or {})
+        self.fields = dict(fields or {})
+        self.random = Random(seed)
+
+        self._queue: 'Queue[Optional[dict]]' = Queue(maxsize=max_pending)
+        self._writer: Optional[Thread] = None
+        self.written = 0
+        self.dropped = 0
+        # events are recorded from many threads
+        self._dropped_lock = Lock()
+
+    def enabled(self, category: str, level: int = logging.INFO) -> bool:
+        """
+        Whether an event would be journaled (before sampling), to skip building costly fields.
+        """
+        return level >= self.levels.get(category, logging.INFO)
+
+    def record(self, category: str, event: str, level: int = logging.INFO, **fields):
+        if not self.enabled(category, level):
+            return
+        rate = self.sample.get(category, 1.)
+        if level < logging.WARNING and rate < 1. and self.random.random() >= rate:
+            return
+        item = dict(self.fields, t=time(), cat=category, level=logging.getLevelName(level), event=event)
+        item.update(fields)
+        try:
+            self._queue.put_nowait(item)
+        except Full:
+            with self._dropped_lock:
+                self.dropped += 1
+
+    def attach(self, chaos_manager):
+        """
+        Journal transitions of `chaos_manager` (`chaos.ChaosManager` or `aio.chaos.AsyncChaosManager`).
+        """
+        chaos_manager.add_listener(self.on_transition)
+
+    def on_transition(self, op: str, timing: 'FaultTiming'):
+        self.record('chaos', timing.phase, op=op, issued_at=timing.issued_at, acked_at=timing.acked_at,
+                    effective_at=timing.effective_at)
+
+    def _write(self):
+        lock = _file_lock(self.path)
+        done = False
+        while not done:
+            # a batch of whatever is queued, written at once
+            batch = [self._queue.get()]
+            while not self._queue.empty() and len(batch) < 1024:
+                batch.append(self._queue.get_nowait())
+            if None in batch:
+                # closed, events recorded since are not written
+                batch = batch[:batch.index(None)]
+                done = True
+            lines = ''.join(json.dumps(e, default=str, separators=(',', ':')) + '\n' for e in batch)
+            with lock, open(self.path, 'a') as f:
+                f.write(lines)
+            self.written += len(batch)
+
+    def start(self) -> 'EventJournal':
+        assert self._writer is None
+        self._writer = Thread(target=self._write, daemon=True)
+        self._writer.start()
+        return self
+
+    def close(self):
+        """
+        Write all queued events and stop.
+        """
+        if self._writer is None:
+            return
+        self._queue.put(None)
+        self._writer.join()
+        self._writer = None
+        self.logger.info('journaled %d event(s) to %s, %d dropped', self.written, self.path, self.dropped)
+
+
+def read_journal(*paths: str, categories: Optional[Iterable[str]] = None) -> Iterator[dict]:
+    """
+    Events of journal files, of `categories` only if given.
+    """
+    categories = None if categories is None else set(categories)
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                event = json.loads(line)
+                if categories is None or event['cat'] in categories:
+                    yield event
@@ -0,0 +1,80 @@
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from typing import Dict, Iterable, List, Optional, Callable, TYPE_CHECKING
+
+from .mixins import LoggerMixin, CoreV1ApiMixin
+
+if TYPE_CHECKING:
+    from kubernetes.client import CoreV1Api
+    from . import Node
+
+LabelListener = Callable[['Node', Dict[str, str], List[str]], None]
+
+
+def _label_path(key: str) -> str:
+    # JSON pointer escaping, label keys may contain `/`
+    return '/metadata/labels/{}'.format(key.replace('~', '~0').replace('/', '~1'))
+
+
+class LabelManager(LoggerMixin, CoreV1ApiMixin):
+    """
+    Labels applied on pods by the framework.
+
+    Changes are sent as one JSON patch per pod without reading the pod first, patches for different pods run
+    concurrently. Only labels added by this manager are tracked (and can be removed).
+    """
+
+    def __init__(self, api_core_v1: 'CoreV1Api', namespace: str, max_workers: int = 16,
+                 listener: Optional[LabelListener] = None, **kwargs) -> None:
+        """
+        :param listener: called with node, labels added and keys removed after each patch, e.g. `Topology.update_labels`
+        """
+        super().__init__(api_core_v1=api_core_v1, **kwargs)
+        self.namespace = namespace
+        self.listener = listener
+        self._pool = ThreadPoolExecutor(max_workers=max_workers)
+        self._lock = Lock()
+        self._applied: Dict[str, Dict[str, str]] = {}
+
+    def applied(self, node: 'Node') -> Dict[str, str]:
+        with self._lock:
+            return dict(self._applied.get(node.pod_name, {}))
+
+    def _patch(self, node: 'Node', patch: List[dict]):
+        if patch:
+            self.api_core_v1.patch_namespaced_pod(name=node.pod_name, namespace=self.namespace, body=patch)
+
+    def add(self, nodes: Iterable['Node'], labels: Dict[str, str]):
+        def _add(n: 'Node'):
+            self._patch(n, [{'op': 'add', 'path': _label_path(k), 'value': v} for (k, v) in labels.items()])
+            with self._lock:
+                self._applied.setdefault(n.pod_name, {}).update(labels)
+            if self.listener is not None:
+                self.listener(n, labels, [])
+
+        nodes = list(nodes)
+        self.logger.debug('adding labels %s on %d pod(s)', labels, len(nodes))
+        for _ in self._pool.map(_add, nodes):
+            pass
+
+    def remove(self, nodes: Iterable['Node'], keys: Iterable[str]):
+        keys = list(keys)
+
+        def _remove(n: 'Node'):
+            with self._lock:
+                applied = self._applied.get(n.pod_name, {})
+                to_remove = [k for k in keys if k in applied]
+            self._patch(n, [{'op': 'remove', 'path': _label_path(k)} for k in to_remove])
+            with self._lock:
+                for k in to_remove:
+                    applied.pop(k, None)
+            if self.listener is not None and to_remove:
+                self.listener(n, {}, to_remove)
+
+        nodes = list(nodes)
+        self.logger.debug('removing labels %s from %d pod(s)', keys, len(nodes))
+        for _ in self._pool.map(_remove, nodes):
+            pass
+
+    def close(self):
+        self._pool.shutdown(wait=True)
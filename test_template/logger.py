@@ -1,22 +1,71 @@
 import logging
+from atexit import register
+from logging.handlers import QueueHandler, QueueListener
+from queue import SimpleQueue
+from typing import Optional, Union
 
+_listener: Optional[QueueListener] = None
+_handler: Optional[QueueHandler] = None
 
-def init_logger():
+
+class _DeferredQueueHandler(QueueHandler):
+    """
+    Enqueue records as they are, merging the message with its arguments is left to the listener thread too.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # containers passed as arguments may be changed by the logging thread before the listener gets to them
+        if isinstance(record.args, dict):
+            record.args = dict(record.args)
+        elif record.args:
+            record.args = tuple(_copy_arg(a) for a in record.args)
+        return record
+
+
+def _copy_arg(arg):
+    return arg.copy() if isinstance(arg, (list, dict, set)) else arg
+
+
+def init_logger(level: Union[int, str] = logging.INFO):
+    """
+    Log to stderr at `level`, called by entry points (scripts, `cli`) rather than on import of the package.
+
+    Records are only queued by threads logging them, a background thread formats and writes them, so console I/O
+    doesn't delay chaos transitions or workloads.
+    """
+    global _listener, _handler
     r = logging.getLogger()
+    r.setLevel(level)
+    if _listener is not None:
+        return
 
     ch = logging.StreamHandler()
-    ch.setLevel(logging.DEBUG)
 
     formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(name)s - %(message)s')
 
     ch.setFormatter(formatter)
-    r.addHandler(ch)
+    queue = SimpleQueue()
+    _handler = _DeferredQueueHandler(queue)
+    r.addHandler(_handler)
+    _listener = QueueListener(queue, ch)
+    _listener.start()
+    register(stop_logger)
+
+
+def stop_logger():
+    """
+    Write records still queued, and stop.
+    """
+    global _listener, _handler
+    if _listener is not None:
+        logging.getLogger().removeHandler(_handler)
+        _listener.stop()
+        _listener = None
+        _handler = None
 
 
 def get_logger(name='__main__'):
     if name == '__main__':
         name = 'main'
     from logging import getLogger
-    r = getLogger(name)
-    r.setLevel(logging.DEBUG)
-    return r
+    return getLogger(name)
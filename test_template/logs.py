@@ -0,0 +1,306 @@
+"""
+Logs of nodes collected while the test runs, stored compressed on the host with a time index.
+"""
+import gzip
+import json
+import os
+import re
+from calendar import timegm
+from heapq import merge
+from queue import Queue, Empty
+from threading import Thread, Event, Lock
+from time import time, strptime
+from typing import Dict, List, Optional, Iterable, Iterator, Tuple, NamedTuple, IO, TYPE_CHECKING
+
+from .mixins import LoggerMixin
+
+if TYPE_CHECKING:
+    from . import TestBed, Node
+
+INDEX = 'index.jsonl'
+
+# `[2006/01/02 15:04:05.000 +08:00] [INFO] ...` of PD, TiKV and TiDB, or the same without brackets and time zone of
+# older versions (taken as UTC)
+_TIME_RE = re.compile(r'^\[?(\d{4}/\d{2}/\d{2} \d{2}:\d{2}:\d{2})(\.\d+)?(?: ([+-])(\d{2}):(\d{2}))?')
+
+
+def parse_time(line: str) -> Optional[float]:
+    """
+    Unix time of a log line, None if it doesn't start with a time (e.g. continuation of a multi-line message).
+    """
+    m = _TIME_RE.match(line)
+    if m is None:
+        return None
+    (date, fraction, sign, hours, minutes) = m.groups()
+    try:
+        t = timegm(strptime(date, '%Y/%m/%d %H:%M:%S')) + (float(fraction) if fraction else 0.)
+    except ValueError:
+        return None
+    if sign is not None:
+        offset = int(hours) * 3600 + int(minutes) * 60
+        t -= offset if sign == '+' else -offset
+    return t
+
+
+def source_key(node: 'Node', log_file: str) -> str:
+    return '{}-{}/{}'.format(node.name, node.index_of_env, log_file)
+
+
+class LogBlock(NamedTuple):
+    source: str
+    # data file of the source, relative to the store directory
+    file: str
+    # of the compressed block in `file`
+    offset: int
+    length: int
+    lines: int
+    # times of the first and the last line with a time
+    first: float
+    last: float
+
+
+class _Chunk(NamedTuple):
+    source: str
+    lines: List[str]
+    polled_at: float
+
+
+class _Pending:
+    """
+    Lines of a source not yet written as a block.
+    """
+
+    def __init__(self) -> None:
+        self.lines: List[str] = []
+        self.size = 0
+        self.first: Optional[float] = None
+        self.last: Optional[float] = None
+        self.since: Optional[float] = None
+
+
+class LogCollector(LoggerMixin):
+    """
+    Follow `Node.log_files` of every node of `env` into `directory`, until `stop`.
+
+    Each file is read in chunks of at most `chunk_bytes` through `Node.session`, from where the last read
+    stopped (from the start again if the file shrinks, e.g. rotated). Chunks are queued to a single writer, which
+    appends them as gzip blocks of about `block_bytes` (or `block_seconds` old) to a file per source, and each block
+    with the time range of its lines to `index.jsonl` (see `LogStore`).
+
+    At most `max_pending` chunks are queued: when the writer falls behind, readers wait instead of reading ahead, and
+    the lines not yet read stay in the pod.
+    """
+
+    def __init__(self, env: 'TestBed', directory: str, interval: float = 1, chunk_bytes: int = 1 << 20,
+                 block_bytes: int = 1 << 18, block_seconds: float = 5, max_pending: int = 64, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.env = env
+        self.directory = directory
+        self.interval = interval
+        self.chunk_bytes = chunk_bytes
+        self.block_bytes = block_bytes
+        self.block_seconds = block_seconds
+
+        self._queue: 'Queue[Optional[_Chunk]]' = Queue(maxsize=max_pending)
+        self._stopped = Event()
+        self._readers: List[Thread] = []
+        self._writer: Optional[Thread] = None
+        self._pending: Dict[str, _Pending] = {}
+        self._files: Dict[str, IO[bytes]] = {}
+        self._index: Optional[IO[str]] = None
+        # bytes read by source
+        self.offsets: Dict[str, int] = {}
+
+    # reading
+
+    def _poll(self, node: 'Node', log_file: str, offset: int) -> Tuple[int, str]:
+        # size of the file first, to tell if it shrank or there's more to read
+        res = node.session.run('f={}; stat -c %s $f 2>/dev/null || echo 0; tail -c +{} $f 2>/dev/null | head -c {}'
+                               .format(log_file, offset + 1, self.chunk_bytes))
+        (size, _, data) = res.stdout.partition('\n')
+        return int(size.strip() or 0), data
+
+    def _read(self, node: 'Node', log_file: str):
+        source = source_key(node, log_file)
+        offset = 0
+        while True:
+            # read until drained once stopped, so nothing written before `stop` is lost
+            stopping = self._stopped.is_set()
+            try:
+                (size, data) = self._poll(node, log_file, offset)
+            except Exception as e:
+                self.logger.warning('failed to read %s: %s', source, e)
+                if stopping or self._stopped.wait(self.interval):
+                    break
+                continue
+            if size < offset:
+                self.logger.info('%s shrank from %s to %s bytes, reading from start', source, offset, size)
+                offset = 0
+                continue
+            # only complete lines, the rest is read again with the next chunk (or taken as is at last)
+            end = data.rfind('\n') + 1
+            if not end and data and (stopping or len(data.encode()) >= self.chunk_bytes):
+                end = len(data)
+            if end:
+                offset += len(data[:end].encode())
+                self.offsets[source] = offset
+                # blocks while the writer is behind
+                self._queue.put(_Chunk(source, data[:end].splitlines(), time()))
+                if size > offset:
+                    continue
+            if stopping:
+                break
+            self._stopped.wait(self.interval)
+
+    # writing
+
+    def _write_block(self, source: str, pending: _Pending):
+        if not pending.lines:
+            return
+        file = '{}.log.gz'.format(source.replace('/', '_'))
+        if source not in self._files:
+            self._files[source] = open(os.path.join(self.directory, file), 'ab')
+        f = self._files[source]
+        data = gzip.compress(('\n'.join(pending.lines) + '\n').encode())
+        offset = f.tell()
+        f.write(data)
+        f.flush()
+        block = LogBlock(source, file, offset, len(data), len(pending.lines), pending.first, pending.last)
+        self._index.write(json.dumps(block._asdict()) + '\n')
+        self._index.flush()
+        self._pending[source] = _Pending()
+        # lines of the next block without a time of their own continue this one
+        self._pending[source].first = self._pending[source].last = pending.last
+
+    def _add(self, chunk: _Chunk):
+        pending = self._pending.setdefault(chunk.source, _Pending())
+        if pending.since is None:
+            pending.since = chunk.polled_at
+        for line in chunk.lines:
+            t = parse_time(line)
+            if t is None:
+                # continuation of the previous line, or a file without times
+                t = chunk.polled_at if pending.last is None else pending.last
+            if not pending.lines:
+                pending.first = t
+            pending.last = t
+            pending.lines.append(line)
+            pending.size += len(line) + 1
+            if pending.size >= self.block_bytes:
+                self._write_block(chunk.source, pending)
+                pending = self._pending[chunk.source]
+                pending.since = chunk.polled_at
+
+    def _write(self):
+        while True:
+            try:
+                chunk = self._queue.get(timeout=self.block_seconds)
+            except Empty:
+                pass
+            else:
+                if chunk is None:
+                    break
+                self._add(chunk)
+            now = time()
+            for (source, pending) in list(self._pending.items()):
+                if pending.lines and now - pending.since >= self.block_seconds:
+                    self._write_block(source, pending)
+        for (source, pending) in list(self._pending.items()):
+            self._write_block(source, pending)
+        for f in self._files.values():
+            f.close()
+        self._index.close()
+
+    def start(self) -> 'LogCollector':
+        assert self._writer is None
+        os.makedirs(self.directory, exist_ok=True)
+        self._stopped.clear()
+        self._index = open(os.path.join(self.directory, INDEX), 'a')
+        self._writer = Thread(target=self._write, daemon=True)
+        self._writer.start()
+        for node in self.env.topology.nodes():
+            for log_file in node.log_files:
+                t = Thread(target=self._read, args=(node, log_file), daemon=True)
+                t.start()
+                self._readers.append(t)
+        self.logger.info('collecting %s log file(s) into %s', len(self._readers), self.directory)
+        return self
+
+    def stop(self):
+        """
+        Read what's left of every file, then write all pending lines.
+        """
+        if self._writer is None:
+            return
+        self._stopped.set()
+        for t in self._readers:
+            t.join()
+        self._queue.put(None)
+        self._writer.join()
+        self._readers = []
+        self._writer = None
+        self.logger.info('collected %s bytes of logs', sum(self.offsets.values()))
+
+
+class LogStore:
+    """
+    Logs collected by `LogCollector` in `directory`, read back block by block by time.
+    """
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        self._lock = Lock()
+        self._blocks: List[LogBlock] = []
+        self._index_offset = 0
+
+    def blocks(self) -> List[LogBlock]:
+        """
+        All blocks in the index, including those written since last call.
+        """
+        with self._lock, open(os.path.join(self.directory, INDEX)) as f:
+            f.seek(self._index_offset)
+            for line in f:
+                if not line.endswith('\n'):
+                    # being written
+                    break
+                self._blocks.append(LogBlock(**json.loads(line)))
+                self._index_offset += len(line.encode())
+            return list(self._blocks)
+
+    def sources(self) -> List[str]:
+        return sorted({b.source for b in self.blocks()})
+
+    def _read_block(self, block: LogBlock) -> Iterator[Tuple[float, str, str]]:
+        with open(os.path.join(self.directory, block.file), 'rb') as f:
+            f.seek(block.offset)
+            data = gzip.decompress(f.read(block.length)).decode()
+        t = block.first
+        for line in data.splitlines():
+            t = parse_time(line) or t
+            yield t, block.source, line
+
+    def lines(self, start: float, end: float, sources: Optional[Iterable[str]] = None) \
+            -> Iterator[Tuple[float, str, str]]:
+        """
+        (time, source, line) of lines in [start, end] ordered by time, only blocks overlapping the range are read.
+        """
+        sources = None if sources is None else set(sources)
+        by_source: Dict[str, List[LogBlock]] = {}
+        for b in self.blocks():
+            if b.last >= start and b.first <= end and (sources is None or b.source in sources):
+                by_source.setdefault(b.source, []).append(b)
+
+        def read(blocks: List[LogBlock]) -> Iterator[Tuple[float, str, str]]:
+            for b in blocks:
+                for item in self._read_block(b):
+                    if start <= item[0] <= end:
+                        yield item
+
+        return merge(*(read(blocks) for blocks in by_source.values()), key=lambda i: i[0])
+
+    def around(self, at: float, before: float = 30, after: float = 30, sources: Optional[Iterable[str]] = None) \
+            -> Iterator[Tuple[float, str, str]]:
+        """
+        Lines around time `at`, e.g. `issued_at` of a `chaos.timing.FaultTiming`.
+        """
+        return self.lines(at - before, at + after, sources)
@@ -0,0 +1,317 @@
+"""
+Background sampler of the Prometheus metrics exposed by nodes, with samples tagged by active chaos.
+"""
+import gzip
+import json
+import re
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from threading import Thread, Event, Lock
+from time import time, monotonic
+from typing import Dict, List, Optional, Iterable, Tuple, NamedTuple, Deque, TYPE_CHECKING
+
+from .mixins import LoggerMixin
+from .results import _file_lock
+
+if TYPE_CHECKING:
+    from . import TestBed, Node
+    from .chaos.timing import FaultTiming
+
+# metric names (or prefixes of them) sampled by default: query rate, region (leader) counts and latencies
+DEFAULT_METRICS = (
+    'tidb_server_query_total',
+    'tidb_server_handle_query_duration_seconds_sum',
+    'tidb_server_handle_query_duration_seconds_count',
+    'tidb_server_connections',
+    'tikv_raftstore_region_count',
+    'tikv_grpc_msg_duration_seconds_sum',
+    'tikv_grpc_msg_duration_seconds_count',
+    'pd_regions_status',
+    'pd_cluster_status',
+    'pd_scheduler_store_status',
+)
+
+# samples of counters are turned into rates when compared across fault windows
+_COUNTER_SUFFIXES = ('_total', '_sum', '_count')
+
+
+def parse_prometheus(text: str, include: Optional[Iterable[str]] = None) -> Dict[str, float]:
+    """
+    Values of a Prometheus text exposition by series (`name{labels}` as exposed), only of metrics whose name starts
+    with any of `include` if given.
+    """
+    include = None if include is None else tuple(include)
+    ret = {}
+    for line in text.splitlines():
+        if not line or line.startswith('#'):
+            continue
+        if include is not None and not line.startswith(include):
+            continue
+        end = line.rfind('}')
+        if end >= 0:
+            series, rest = line[:end + 1], line[end + 1:].split()
+        else:
+            (series, *rest) = line.split()
+        try:
+            ret[series] = float(rest[0])
+        except (IndexError, ValueError):
+            continue
+    return ret
+
+
+def node_key(node: 'Node') -> str:
+    return '{}-{}'.format(*node.ref)
+
+
+class ChaosEvent(NamedTuple):
+    # wall clock time the transition was issued
+    at: float
+    op: str
+    phase: str
+    effective_at: Optional[float]
+
+
+class MetricsSampler(LoggerMixin):
+    """
+    Scrape `Node.metrics_url` of every node of `env` each `interval` seconds, in background.
+
+    Each series (`<role>-<index>/<series>`, plus `<role>-<index>/up` telling if the scrape succeeded) keeps its last
+    `capacity` samples in memory. With `path`, all samples are also appended to a gzip file in batches of
+    `batch_size` scrapes (read back by `load_metrics`). Scrapes are tagged with the active chaos of the attached
+    `ChaosManager` (see `attach`), whose transitions are recorded as `events`.
+    """
+
+    def __init__(self, env: 'TestBed', interval: float = 5, capacity: int = 720, path: Optional[str] = None,
+                 include: Optional[Iterable[str]] = DEFAULT_METRICS, batch_size: int = 12, timeout: float = 3,
+                 **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.env = env
+        self.interval = interval
+        self.capacity = capacity
+        self.path = path
+        self.include = None if include is None else tuple(include)
+        self.batch_size = batch_size
+        self.timeout = timeout
+
+        self._lock = Lock()
+        self._flush_lock = Lock()
+        self._stopped = Event()
+        self._thread: Optional[Thread] = None
+        self._chaos_manager = None
+
+        # (time, chaos) of each scrape
+        self.scrapes: Deque[Tuple[float, str]] = deque(maxlen=capacity)
+        self.series: Dict[str, Deque[Tuple[float, float]]] = {}
+        self.events: List[ChaosEvent] = []
+        # not yet written to `path`, columns as in `load_metrics`
+        self._batch = self._new_batch()
+        self._batch_events: List[ChaosEvent] = []
+
+    @staticmethod
+    def _new_batch() -> dict:
+        return {'t': [], 'chaos': [], 'series': {}}
+
+    def attach(self, chaos_manager):
+        """
+        Tag scrapes with active chaos of `chaos_manager` (`chaos.ChaosManager` or `aio.chaos.AsyncChaosManager`) and
+        record its transitions.
+        """
+        self._chaos_manager = chaos_manager
+        chaos_manager.add_listener(self.on_transition)
+
+    def on_transition(self, op: str, timing: 'FaultTiming'):
+        event = ChaosEvent(timing.issued_at, op, timing.phase, timing.effective_at)
+        with self._lock:
+            self.events.append(event)
+            if self.path is not None:
+                self._batch_events.append(event)
+
+    def _chaos(self) -> str:
+        return '' if self._chaos_manager is None else self._chaos_manager.active_state()
+
+    # sampling
+
+    def scrape(self, node: 'Node') -> Optional[Dict[str, float]]:
+        """
+        Metrics of `node` fetched from inside its pod, None if it can't be scraped.
+        """
+        try:
+            res = node.session.run('wget -q -T {} -O - {}'.format(self.timeout, node.metrics_url),
+                                   timeout=self.timeout + 1)
+        except Exception as e:
+            self.logger.debug('failed to scrape %s: %s', node, e)
+            return None
+        if not res.ok:
+            return None
+        return parse_prometheus(res.stdout, self.include)
+
+    def sample(self, pool: Optional[ThreadPoolExecutor] = None):
+        """
+        Scrape all nodes once and record the samples.
+        """
+        nodes = [n for n in self.env.topology.nodes() if n.metrics_url is not None]
+        chaos = self._chaos()
+        at = time()
+        scraped = list(pool.map(self.scrape, nodes) if pool is not None else map(self.scrape, nodes))
+
+        values: Dict[str, float] = {}
+        for (node, metrics) in zip(nodes, scraped):
+            prefix = node_key(node) + '/'
+            values[prefix + 'up'] = 0. if metrics is None else 1.
+            for (series, v) in (metrics or {}).items():
+                values[prefix + series] = v
+
+        with self._lock:
+            self.scrapes.append((at, chaos))
+            for (series, v) in values.items():
+                if series not in self.series:
+                    self.series[series] = deque(maxlen=self.capacity)
+                self.series[series].append((at, v))
+            if self.path is None:
+                return
+            index = len(self._batch['t'])
+            self._batch['t'].append(at)
+            self._batch['chaos'].append(chaos)
+            for (series, v) in values.items():
+                column = self._batch['series'].setdefault(series, [])
+                column.extend([None] * (index - len(column)))
+                column.append(v)
+            full = len(self._batch['t']) >= self.batch_size
+        if full:
+            self.flush()
+
+    def flush(self):
+        # batches are swapped under `_lock` (not to block scrapes on writing), `_flush_lock` keeps them in order
+        with self._flush_lock:
+            with self._lock:
+                if self.path is None or not (self._batch['t'] or self._batch_events):
+                    return
+                (batch, self._batch) = (self._batch, self._new_batch())
+                (events, self._batch_events) = (self._batch_events, [])
+            batch['events'] = [e._asdict() for e in events]
+            line = json.dumps(batch, separators=(',', ':')) + '\n'
+            with _file_lock(self.path), gzip.open(self.path, 'at') as f:
+                f.write(line)
+
+    def _run(self):
+        self.logger.info('sampling metrics every %ss', self.interval)
+        with ThreadPoolExecutor(max_workers=max(1, len(self.env.topology))) as pool:
+            due = monotonic()
+            while not self._stopped.is_set():
+                try:
+                    self.sample(pool)
+                except Exception as e:
+                    self.logger.warning('failed to sample metrics: %s', e)
+                due += self.interval
+                # skip missed rounds rather than scraping back to back
+                while due < monotonic():
+                    due += self.interval
+                self._stopped.wait(due - monotonic())
+        self.flush()
+        self.logger.info('metrics sampling stopped')
+
+    def start(self) -> 'MetricsSampler':
+        assert self._thread is None
+        self._stopped.clear()
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stopped.set()
+        self._thread.join()
+        self._thread = None
+
+    # queries of samples in memory
+
+    def select(self, pattern: str) -> List[str]:
+        """
+        Series whose key matches regular expression `pattern`, e.g. `r'^kv-\\d+/tikv_raftstore_region_count'`.
+        """
+        p = re.compile(pattern)
+        with self._lock:
+            return sorted(s for s in self.series if p.search(s))
+
+    def values(self, series: str, start: Optional[float] = None, end: Optional[float] = None) \
+            -> List[Tuple[float, float]]:
+        with self._lock:
+            return [(t, v) for (t, v) in self.series.get(series, ())
+                    if (start is None or t >= start) and (end is None or t <= end)]
+
+    def fault_windows(self) -> List[Tuple[str, float, Optional[float]]]:
+        """
+        (operator, activated at, deactivated at or None if still active) of recorded transitions.
+        """
+        with self._lock:
+            events = sorted(self.events)
+        windows: List[Tuple[str, float, Optional[float]]] = []
+        opened: Dict[str, List[int]] = {}
+        for e in events:
+            if e.phase == 'activate':
+                opened.setdefault(e.op, []).append(len(windows))
+                windows.append((e.op, e.at, None))
+            elif opened.get(e.op):
+                i = opened[e.op].pop(0)
+                windows[i] = (e.op, windows[i][1], e.at)
+        return windows
+
+    def aggregate(self, pattern: str, start: Optional[float] = None, end: Optional[float] = None) -> Optional[float]:
+        """
+        Sum over series matching `pattern` in [start, end]: rate per second for counters (`_total`, `_sum`,
+        `_count`), mean for others. None if no series has enough samples.
+        """
+        ret = None
+        for series in self.select(pattern):
+            samples = self.values(series, start, end)
+            if series.endswith(_COUNTER_SUFFIXES):
+                if len(samples) < 2 or samples[-1][0] <= samples[0][0]:
+                    continue
+                # counters restart from 0 with the node
+                v = max(0., samples[-1][1] - samples[0][1]) / (samples[-1][0] - samples[0][0])
+            else:
+                if not samples:
+                    continue
+                v = sum(v for (_, v) in samples) / len(samples)
+            ret = v if ret is None else ret + v
+        return ret
+
+    def around_faults(self, pattern: str, margin: Optional[float] = None) -> List[dict]:
+        """
+        `aggregate` of `pattern` before, during and after each fault window, each side `margin` seconds (default to
+        the length of the window).
+        """
+        ret = []
+        now = time()
+        for (op, begin, end) in self.fault_windows():
+            until = now if end is None else end
+            m = until - begin if margin is None else margin
+            ret.append({'op': op, 'start': begin, 'end': end,
+                        'before': self.aggregate(pattern, begin - m, begin),
+                        'during': self.aggregate(pattern, begin, until),
+                        'after': None if end is None else self.aggregate(pattern, end, end + m)})
+        return ret
+
+
+def load_metrics(*paths: str) -> dict:
+    """
+    Samples of metric files as columns: `t` (scrape times), `chaos` (active chaos of each scrape), `series` (values
+    aligned with `t`, None where missing) and `events` (chaos transitions).
+    """
+    ret = {'t': [], 'chaos': [], 'series': {}, 'events': []}
+    for path in paths:
+        with gzip.open(path, 'rt') as f:
+            for line in f:
+                batch = json.loads(line)
+                offset = len(ret['t'])
+                ret['t'].extend(batch['t'])
+                ret['chaos'].extend(batch['chaos'])
+                for (series, values) in batch['series'].items():
+                    column = ret['series'].setdefault(series, [])
+                    column.extend([None] * (offset - len(column)))
+                    column.extend(values)
+                ret['events'].extend(ChaosEvent(**e) for e in batch['events'])
+    for column in ret['series'].values():
+        column.extend([None] * (len(ret['t']) - len(column)))
+    return ret
@@ -3,57 +3,87 @@ from . import Node
 
 
 class _TiNode(Node):
+    # including faults of `chaos.netem` left behind
+    reset_command = 'tmux kill-server 2>/dev/null; pkill -9 -x pd-server; pkill -9 -x tikv-server;' \
+                    ' pkill -9 -x tidb-server; rm -rf pd tikv[0-9]* pd.log tikv.log tidb.log;' \
+                    ' sudo -n tc qdisc del dev eth0 root 2>/dev/null; sudo -n iptables -F 2>/dev/null; true'
+
     def start(self):
-        _cmd = self.ti_cmd
-        get_logger(self.pod_name).debug('running `{}`'.format(_cmd))
+        _cmd = self.start_command
+        get_logger(self.pod_name).debug('running `%s`', _cmd)
         self.run_background_with_tmux(_cmd)
 
+    @property
+    def start_command(self) -> str:
+        return self.ti_cmd
+
     @property
     def ti_cmd(self) -> str:
         raise NotImplementedError()
 
+    @property
+    def ready_probe(self) -> str:
+        raise NotImplementedError()
+
 
 class PdNode(_TiNode):
     name = 'pd'
+    port = 2379
+    metrics_port = 2379
+    log_files = ('pd.log',)
 
     @property
     def ti_cmd(self) -> str:
-        len_pd = len(self.same_type_nodes)
         # starting from 1
         idx = self.index_of_env + 1
         pd_cmd = 'pd-server --name=pd{idx} --data-dir=pd' \
                  ' --client-urls=http://{pd_ip}:2379' \
                  ' --peer-urls=http://{pd_ip}:2380' \
                  ' --log-file=pd.log'.format(idx=idx, pd_ip=self.pod_ip)
-        pd_cmd += ' --initial-cluster="{}"'.format(','.join(
-            'pd{}=http://{}:2380'.format(i + 1, self.same_type_nodes[i].pod_ip)
-            for i in range(len_pd)
-        ))
+        pd_cmd += ' --initial-cluster="{}"'.format(self.env.topology.peers(PdNode, 'pd{number}=http://{ip}:2380'))
         pd_cmd += ' -L "info"'
         return pd_cmd
 
+    @property
+    def ready_probe(self) -> str:
+        # leader is only available after PD cluster reaches quorum
+        return 'wget -q -O - http://{}:2379/pd/api/v1/leader'.format(self.pod_ip)
+
 
 class KvNode(_TiNode):
     name = 'kv'
+    port = 20160
+    metrics_port = 20180
+    log_files = ('tikv.log',)
 
     @property
     def ti_cmd(self) -> str:
-        pd_ips = [i.pod_ip for i in self.env.node_instances[PdNode]]
         kv_cmd = 'tikv-server --pd="{pds}"' \
                  ' --addr="{kv_ip}:20160" --status-addr="{kv_ip}:20180"' \
                  ' --data-dir=tikv{idx}' \
-                 ' --log-file=tikv.log'.format(pds=','.join('{}:2379'.format(i) for i in pd_ips),
+                 ' --log-file=tikv.log'.format(pds=self.env.topology.peers(PdNode, '{ip}:2379'),
                                                kv_ip=self.pod_ip, idx=self.index_of_env)
         return kv_cmd
 
+    @property
+    def ready_probe(self) -> str:
+        return 'wget -q -O - http://{}:20180/metrics'.format(self.pod_ip)
+
 
 class DbNode(_TiNode):
     name = 'db'
+    port = 4000
+    # default status port of tidb-server
+    metrics_port = 10080
+    log_files = ('tidb.log',)
 
     @property
     def ti_cmd(self) -> str:
-        pd_ips = [i.pod_ip for i in self.env.node_instances[PdNode]]
         db_cmd = 'tidb-server --store=tikv' \
                  ' --path="{}"' \
-                 ' --log-file=tidb.log'.format(','.join('{}:2379'.format(i) for i in pd_ips))
+                 ' --log-file=tidb.log'.format(self.env.topology.peers(PdNode, '{ip}:2379'))
         return db_cmd
+
+    @property
+    def ready_probe(self) -> str:
+        return 'mysql -h {} -P 4000 -uroot -e "select tidb_version();"'.format(self.pod_ip)
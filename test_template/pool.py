@@ -0,0 +1,146 @@
+"""
+Pool of idle pods shared by test beds, to skip creating pods (and pulling the image) for every test.
+"""
+from time import monotonic, sleep
+from typing import List, Iterable, Dict, Optional, Tuple
+from uuid import uuid4
+
+from kubernetes.client import CoreV1Api, AppsV1Api, V1Pod
+from kubernetes.client.rest import ApiException
+
+from . import DEFAULT_NAMESPACE, label_selector, deployment_template
+from .mixins import LoggerMixin, CoreV1ApiMixin, AppsV1ApiMixin
+
+POOL_LABEL = 'chaos-pool'
+# deployment which created the pod, part of its selector
+BATCH_LABEL = 'chaos-pool-batch'
+# id of the test bed holding the pod, or `FREE`
+CLAIM_LABEL = 'chaos-pool-claim'
+FREE = 'free'
+
+
+class PodPool(LoggerMixin, CoreV1ApiMixin, AppsV1ApiMixin):
+    """
+    Pods labeled `chaos-pool=<name>` in `namespace`, each either free or claimed by a test bed (`chaos-pool-claim`).
+
+    Pods are claimed by patching their claim label on the resource version they were listed at, so of concurrent
+    claimers (threads, or processes sharing the pool) only one gets each pod. When there are not enough free pods,
+    the claimer creates a Deployment of the shortfall. Released pods are reset by the test bed and free again; pods
+    which fail to reset are deleted, and replaced by their Deployment.
+    """
+
+    def __init__(self, api_core_v1: CoreV1Api, api_apps_v1: AppsV1Api, name: str = 'default',
+                 namespace: str = DEFAULT_NAMESPACE, poll_interval: float = 0.5, **kwargs) -> None:
+        super().__init__(api_core_v1=api_core_v1, api_apps_v1=api_apps_v1, **kwargs)
+        self.name = name
+        self.namespace = namespace
+        self.poll_interval = poll_interval
+        # created by this pool object, deleted by `close`
+        self.deployments: List[str] = []
+
+    @property
+    def label(self) -> Dict[str, str]:
+        return {POOL_LABEL: self.name}
+
+    def claim_label(self, claim: str) -> Dict[str, str]:
+        return {POOL_LABEL: self.name, CLAIM_LABEL: claim}
+
+    def _pods(self, claim: str) -> List[V1Pod]:
+        return self.api_core_v1.list_namespaced_pod(
+            namespace=self.namespace, label_selector=label_selector(self.claim_label(claim))).items
+
+    def free_pods(self) -> List[V1Pod]:
+        return [p for p in self._pods(FREE) if p.status.phase == 'Running' and p.metadata.deletion_timestamp is None]
+
+    def _try_claim(self, pod: V1Pod, claim: str) -> Optional[V1Pod]:
+        body = {'metadata': {'resourceVersion': pod.metadata.resource_version, 'labels': {CLAIM_LABEL: claim}}}
+        try:
+            return self.api_core_v1.patch_namespaced_pod(name=pod.metadata.name, namespace=self.namespace, body=body)
+        except ApiException as e:
+            # changed since listed, e.g. claimed by another
+            if e.status in (404, 409):
+                return None
+            raise
+
+    def grow(self, count: int) -> str:
+        """
+        Add `count` free pods to the pool by a Deployment of them, returns its name.
+        """
+        batch = uuid4().hex[:8]
+        name = 'pool-{}-{}'.format(self.name, batch)
+        label = dict(self.label, **{BATCH_LABEL: batch})
+        body = deployment_template(name, count, label)
+        body['spec']['template']['metadata']['labels'] = dict(label, **{CLAIM_LABEL: FREE})
+        self.logger.info('creating %s pod(s) by deployment %s', count, name)
+        self.api_apps_v1.create_namespaced_deployment(namespace=self.namespace, body=body)
+        self.deployments.append(name)
+        return batch
+
+    def claim(self, count: int, wait_seconds: float = 300) -> Tuple[str, List[V1Pod]]:
+        """
+        Claim `count` running pods, creating pods the pool runs short of. Returns the claim id and claimed pods.
+        """
+        claim = uuid4().hex[:8]
+        deadline = monotonic() + wait_seconds
+        claimed: List[V1Pod] = []
+        batches: List[str] = []
+        while True:
+            for pod in self.free_pods():
+                if len(claimed) == count:
+                    break
+                pod = self._try_claim(pod, claim)
+                if pod is not None:
+                    claimed.append(pod)
+            if len(claimed) == count:
+                break
+
+            # pods created for this claim but not running yet, which may still be taken by others
+            pending = sum(1 for p in self._pods(FREE) if p.metadata.labels.get(BATCH_LABEL) in batches
+                          and p.status.phase != 'Running')
+            if pending < count - len(claimed):
+                batches.append(self.grow(count - len(claimed) - pending))
+            if monotonic() > deadline:
+                self.release([p.metadata.name for p in claimed])
+                raise TimeoutError('claimed only {} of {} pods in {} seconds'.format(
+                    len(claimed), count, wait_seconds))
+            sleep(self.poll_interval)
+
+        self.logger.info('claimed %s pod(s) as %s%s', count, claim,
+                         '' if not batches else ', created {} deployment(s)'.format(len(batches)))
+        return claim, claimed
+
+    def release(self, pod_names: Iterable[str]):
+        """
+        Free claimed pods, which must have been reset; labels other than those of the pool are removed.
+        """
+        for name in pod_names:
+            pod = self.api_core_v1.read_namespaced_pod(name=name, namespace=self.namespace)
+            labels = {k: None for k in (pod.metadata.labels or {})
+                      if k not in (POOL_LABEL, BATCH_LABEL, CLAIM_LABEL, 'pod-template-hash')}
+            labels[CLAIM_LABEL] = FREE
+            self.api_core_v1.patch_namespaced_pod(name=name, namespace=self.namespace,
+                                                  body={'metadata': {'labels': labels}})
+
+    def discard(self, pod_name: str):
+        """
+        Delete a pod which can't be reused, its Deployment creates a free one instead.
+        """
+        self.logger.info('discarding pod %s', pod_name)
+        try:
+            self.api_core_v1.delete_namespaced_pod(name=pod_name, namespace=self.namespace)
+        except ApiException as e:
+            if e.status != 404:
+                raise
+
+    def close(self):
+        """
+        Delete Deployments (and so pods) created by this pool object, whether claimed or not.
+        """
+        for name in self.deployments:
+            self.logger.info('deleting deployment %s', name)
+            try:
+                self.api_apps_v1.delete_namespaced_deployment(namespace=self.namespace, name=name)
+            except ApiException as e:
+                if e.status != 404:
+                    raise
+        self.deployments = []
@@ -0,0 +1,89 @@
+import gzip
+import json
+import os
+from atexit import register
+from threading import Lock
+from time import strftime
+from typing import Dict, List, Optional, Iterable, Tuple
+
+from .stats import Histogram
+
+COLUMNS = ('run', 'step', 'name', 'start', 'end', 'rows', 'error', 'chaos')
+
+# writers of the same file (e.g. tests run by a campaign) must not interleave their gzip members
+_file_locks: Dict[str, Lock] = {}
+_file_locks_lock = Lock()
+
+
+def _file_lock(path: str) -> Lock:
+    with _file_locks_lock:
+        return _file_locks.setdefault(os.path.abspath(path), Lock())
+
+
+class ResultWriter:
+    """
+    Append-only result file of workload steps.
+
+    Records are buffered and written in batches, each batch is one JSON line keyed by column and compressed as its
+    own gzip member, so the file can be appended by many runs and read back with plain `gzip.open`.
+    """
+
+    def __init__(self, path: str, run_id: Optional[str] = None, batch_size: int = 256) -> None:
+        self.path = path
+        self.run_id = strftime('%Y%m%d-%H%M%S') if run_id is None else run_id
+        self.batch_size = batch_size
+        self._lock = Lock()
+        self._file_lock = _file_lock(path)
+        self._batch: Dict[str, list] = {c: [] for c in COLUMNS}
+        register(self.flush)
+
+    def record(self, step: str, name: str, start: float, end: float,
+               rows: Optional[int] = None, error: Optional[str] = None, chaos: str = ''):
+        with self._lock:
+            for (c, v) in zip(COLUMNS, (self.run_id, step, name, start, end, rows, error, chaos)):
+                self._batch[c].append(v)
+            full = len(self._batch['run']) >= self.batch_size
+        if full:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            if not self._batch['run']:
+                return
+            batch, self._batch = self._batch, {c: [] for c in COLUMNS}
+            with self._file_lock, gzip.open(self.path, 'at') as f:
+                f.write(json.dumps(batch, separators=(',', ':')) + '\n')
+
+
+def load_results(*paths: str) -> Dict[str, list]:
+    """
+    Load result files into columns, records of all files and runs are concatenated.
+    """
+    columns: Dict[str, list] = {c: [] for c in COLUMNS}
+    for path in paths:
+        with gzip.open(path, 'rt') as f:
+            for line in f:
+                batch = json.loads(line)
+                for c in COLUMNS:
+                    columns[c].extend(batch[c])
+    return columns
+
+
+def summarize(columns: Dict[str, list], by: Iterable[str] = ('run', 'name')) -> Dict[Tuple, dict]:
+    """
+    Latency and row statistics of loaded results grouped by `by` columns, e.g. to compare runs query by query.
+    """
+    by = tuple(by)
+    groups: Dict[Tuple, Tuple[Histogram, List[int], List[int]]] = {}
+    for i in range(len(columns['run'])):
+        key = tuple(columns[c][i] for c in by)
+        h, rows, errors = groups.setdefault(key, (Histogram(), [], []))
+        h.record(columns['end'][i] - columns['start'][i])
+        if columns['rows'][i] is not None:
+            rows.append(columns['rows'][i])
+        if columns['error'][i] is not None:
+            errors.append(i)
+
+    return {key: {'count': h.count, 'errors': len(errors), 'rows': sum(rows),
+                  'mean': h.mean, 'p50': h.percentile(50), 'p99': h.percentile(99), 'max': h.max}
+            for (key, (h, rows, errors)) in groups.items()}
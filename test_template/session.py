@@ -0,0 +1,186 @@
+from threading import Lock, Condition
+from time import monotonic
+from typing import NamedTuple, Optional, List, Callable, Tuple, TYPE_CHECKING
+from uuid import uuid4
+
+from .mixins import LoggerMixin, CoreV1ApiMixin
+
+if TYPE_CHECKING:
+    from kubernetes.client import CoreV1Api
+    from kubernetes.stream.ws_client import WSClient
+
+# command runs in a subshell without stdin (so it can neither change shell state nor eat following commands),
+# then markers with exit code are printed to both stdout and stderr to delimit its output.
+FRAME = '( {cmd}\n) < /dev/null; __rc=$?; echo "{marker} $__rc"; echo "{marker}" >&2\n'
+
+
+# opens an exec stream (a `WSClient`), called with the API client and arguments of `connect_get_namespaced_pod_exec`
+ExecStream = Callable[..., 'WSClient']
+
+
+def kube_exec_stream(api_core_v1: 'CoreV1Api', **kwargs) -> 'WSClient':
+    from kubernetes.stream import stream
+    return stream(api_core_v1.connect_get_namespaced_pod_exec, **kwargs)
+
+
+class ExecResult(NamedTuple):
+    exit_code: int
+    stdout: str
+    stderr: str
+    seconds: float
+
+    @property
+    def ok(self) -> bool:
+        return self.exit_code == 0
+
+
+class MarkedOutput:
+    """
+    Output of a stream up to `marker` (and on stdout the exit code following it), fed chunk by chunk.
+
+    Only a short tail of what was fed is searched for the marker, chunks are joined once it's found.
+    """
+
+    def __init__(self, marker: str, with_exit_code: bool) -> None:
+        self.marker = marker
+        self.with_exit_code = with_exit_code
+        self.done = False
+        self.exit_code: Optional[int] = None
+        self.text = ''
+        self._chunks: List[str] = []
+        self._tail = ''
+
+    def feed(self, data: str) -> bool:
+        """
+        Add a chunk, returns whether the marker (with the line of exit code if expected) has been read.
+        """
+        self._chunks.append(data)
+        window = self._tail + data
+        idx = window.find(self.marker)
+        if idx < 0 or (self.with_exit_code and '\n' not in window[idx + len(self.marker):]):
+            # long enough for a marker split across chunks, with the exit code after it
+            self._tail = window[-(len(self.marker) + 16):]
+            return False
+        buf = ''.join(self._chunks)
+        idx += len(buf) - len(window)
+        if self.with_exit_code:
+            self.exit_code = int(buf[idx + len(self.marker):].split('\n', 1)[0])
+        self.text = buf[:idx]
+        self._chunks = []
+        self.done = True
+        return True
+
+
+class ExecSession(LoggerMixin, CoreV1ApiMixin):
+    """
+    One long-lived `bash` inside a pod, commands are written to its stdin and run one at a time: concurrent callers
+    wait for each other, use a `SessionPool` (as `Node.session`) to run commands concurrently.
+    """
+
+    def __init__(self, api_core_v1: 'CoreV1Api', namespace: str, pod_name: str,
+                 exec_stream: Optional[ExecStream] = None, **kwargs) -> None:
+        """
+        :param exec_stream: opens the stream, `kube_exec_stream` by default
+        """
+        super().__init__(api_core_v1=api_core_v1, **kwargs)
+        self.namespace = namespace
+        self.pod_name = pod_name
+        self.exec_stream = kube_exec_stream if exec_stream is None else exec_stream
+        self._lock = Lock()
+        self._ws = None
+
+    def __repr__(self) -> str:
+        return '<ExecSession on {}>'.format(self.pod_name)
+
+    def _connect(self):
+        self.logger.debug('opening shell on %s', self.pod_name)
+        kwargs = dict(namespace=self.namespace, name=self.pod_name, command=['bash'],
+                      stderr=True, stdin=True,
+                      stdout=True, tty=False,
+                      _preload_content=False)
+        self._ws = self.exec_stream(self.api_core_v1, **kwargs)
+
+    def close(self):
+        if self._ws is not None:
+            self._ws.close()
+            self._ws = None
+
+    def run(self, cmd: str, timeout: Optional[float] = None) -> ExecResult:
+        with self._lock:
+            if self._ws is None or not self._ws.is_open():
+                self._connect()
+
+            marker = '__exec_{}__'.format(uuid4().hex)
+            begin = monotonic()
+            self._ws.write_stdin(FRAME.format(cmd=cmd, marker=marker))
+
+            out = MarkedOutput(marker, with_exit_code=True)
+            err = MarkedOutput(marker, with_exit_code=False)
+            while not out.done or not err.done:
+                if timeout is not None and monotonic() - begin > timeout:
+                    # the shell is still busy with the command, drop it
+                    self.close()
+                    raise TimeoutError('`{}` on {} timed out after {} seconds'.format(cmd, self.pod_name, timeout))
+                if not self._ws.is_open():
+                    self._ws = None
+                    raise ConnectionError('shell on {} closed while running `{}`'.format(self.pod_name, cmd))
+
+                self._ws.update(timeout=1)
+                if not out.done and self._ws.peek_stdout():
+                    out.feed(self._ws.read_stdout())
+                if not err.done and self._ws.peek_stderr():
+                    err.feed(self._ws.read_stderr())
+
+            return ExecResult(out.exit_code, out.text, err.text, monotonic() - begin)
+
+
+class SessionPool:
+    """
+    Exec sessions of one pod, each command runs in a session of its own taken from the pool: an idle one, or a new
+    one while fewer than `max_sessions` are open (callers wait for one to be returned otherwise).
+
+    `close` closes idle sessions, and those in use once their command is done; the pool opens new ones if used again.
+    """
+
+    def __init__(self, new_session: Callable[[], ExecSession], max_sessions: int = 8) -> None:
+        self.new_session = new_session
+        self.max_sessions = max_sessions
+        self._cond = Condition()
+        # (session, epoch it was opened in), sessions of an earlier epoch are closed when returned
+        self._idle: List[Tuple[ExecSession, int]] = []
+        self._open = 0
+        self._epoch = 0
+
+    def _take(self) -> Tuple[ExecSession, int]:
+        with self._cond:
+            while not self._idle and self._open >= self.max_sessions:
+                self._cond.wait()
+            if self._idle:
+                return self._idle.pop()
+            self._open += 1
+            return self.new_session(), self._epoch
+
+    def _put(self, session: ExecSession, epoch: int):
+        with self._cond:
+            self._cond.notify()
+            if epoch == self._epoch:
+                self._idle.append((session, epoch))
+                return
+            self._open -= 1
+        session.close()
+
+    def run(self, cmd: str, timeout: Optional[float] = None) -> ExecResult:
+        (session, epoch) = self._take()
+        try:
+            return session.run(cmd, timeout)
+        finally:
+            self._put(session, epoch)
+
+    def close(self):
+        with self._cond:
+            (idle, self._idle) = (self._idle, [])
+            self._open -= len(idle)
+            self._epoch += 1
+            self._cond.notify_all()
+        for (session, _) in idle:
+            session.close()
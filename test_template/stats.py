@@ -0,0 +1,74 @@
+from math import log, ceil
+from typing import Dict, Optional
+
+
+class Histogram:
+    """
+    Log-bucketed histogram for latencies (in seconds), relative error of each recorded value is within `precision`.
+    """
+
+    def __init__(self, precision: float = 0.01, lowest: float = 1e-6) -> None:
+        self.precision = precision
+        self.lowest = lowest
+        self._base = log(1 + precision)
+        self.buckets: Dict[int, int] = {}
+        self.count = 0
+        self.total = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+
+    def _bucket(self, value: float) -> int:
+        if value <= self.lowest:
+            return 0
+        return int(ceil(log(value / self.lowest) / self._base))
+
+    def _value(self, bucket: int) -> float:
+        return self.lowest * (1 + self.precision) ** bucket
+
+    def record(self, value: float, count: int = 1):
+        b = self._bucket(value)
+        self.buckets[b] = self.buckets.get(b, 0) + count
+        self.count += count
+        self.total += value * count
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other: 'Histogram'):
+        assert (self.precision, self.lowest) == (other.precision, other.lowest)
+        for (b, c) in other.buckets.items():
+            self.buckets[b] = self.buckets.get(b, 0) + c
+        self.count += other.count
+        self.total += other.total
+        for v in (other.min, other.max):
+            if v is not None:
+                self.min = v if self.min is None else min(self.min, v)
+                self.max = v if self.max is None else max(self.max, v)
+
+    def percentile(self, p: float) -> Optional[float]:
+        if not self.count:
+            return None
+        rank = p / 100 * self.count
+        seen = 0
+        for b in sorted(self.buckets):
+            seen += self.buckets[b]
+            if seen >= rank:
+                return min(self._value(b), self.max)
+        return self.max
+
+    @property
+    def mean(self) -> Optional[float]:
+        return self.total / self.count if self.count else None
+
+    def to_dict(self) -> dict:
+        return {
+            'count': self.count,
+            'min': self.min,
+            'max': self.max,
+            'mean': self.mean,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+            'precision': self.precision,
+            'lowest': self.lowest,
+            'buckets': {str(b): c for (b, c) in sorted(self.buckets.items())},
+        }
@@ -0,0 +1,250 @@
+import json
+from random import Random
+from threading import RLock
+from typing import Dict, List, Optional, Type, Tuple, Iterable, Set, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from kubernetes.client import V1Pod
+    from . import Node, NodeType
+
+
+def _role(role: 'NodeType') -> str:
+    return role if isinstance(role, str) else role.name
+
+
+class _IndexedSet:
+    """
+    Insertion, removal and random pick in O(1), by swapping removed items with the last one.
+    """
+
+    def __init__(self) -> None:
+        self.items: List['Node'] = []
+        self._pos: Dict[str, int] = {}
+
+    def __contains__(self, node: 'Node') -> bool:
+        return node.pod_name in self._pos
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def add(self, node: 'Node'):
+        if node.pod_name not in self._pos:
+            self._pos[node.pod_name] = len(self.items)
+            self.items.append(node)
+
+    def discard(self, node: 'Node'):
+        pos = self._pos.pop(node.pod_name, None)
+        if pos is None:
+            return
+        last = self.items.pop()
+        if pos < len(self.items):
+            self.items[pos] = last
+            self._pos[last.pod_name] = pos
+
+
+class Topology:
+    """
+    Nodes of a test bed indexed by role, index in role, pod name, IP and label, with health of each node.
+
+    A node is healthy while its pod is running and it's not marked otherwise (e.g. taken offline by a chaos operator).
+    Kept up to date by `update_pod` (see `TestBed.watch_topology`) and `update_labels` (see `labels.LabelManager`).
+    """
+
+    def __init__(self, node_instances: Dict[Type['Node'], List['Node']]) -> None:
+        self._lock = RLock()
+        self._roles: Dict[str, List['Node']] = {t.name: list(l) for (t, l) in node_instances.items()}
+        self._all: List['Node'] = [n for l in self._roles.values() for n in l]
+        # pod name -> (role, index)
+        self._refs: Dict[str, Tuple[str, int]] = {n.pod_name: (r, i) for (r, l) in self._roles.items()
+                                                  for (i, n) in enumerate(l)}
+        self._by_name: Dict[str, 'Node'] = {n.pod_name: n for n in self._all}
+        self._by_ip: Dict[str, 'Node'] = {}
+        self._labels: Dict[str, Dict[str, str]] = {}
+        self._by_label: Dict[Tuple[str, str], Set[str]] = {}
+        self._unhealthy: Dict[str, Set[str]] = {}
+        self._healthy: Dict[str, _IndexedSet] = {r: _IndexedSet() for r in self._roles}
+        # derived strings of role peers (e.g. PD endpoints in node commands), cleared when IPs change
+        self._peers: Dict[Tuple[str, str], str] = {}
+        for n in self._all:
+            self._index_ip(n, n.pod_ip)
+            self._index_labels(n, n._pod.metadata.labels or {})
+            self._running(n, n._pod.status.phase == 'Running')
+
+    def __len__(self) -> int:
+        return len(self._all)
+
+    def nodes(self) -> List['Node']:
+        return self._all
+
+    def roles(self) -> List[str]:
+        return list(self._roles)
+
+    def role(self, role: 'NodeType') -> List['Node']:
+        return self._roles.get(_role(role), [])
+
+    def at(self, role: 'NodeType', index: int) -> 'Node':
+        try:
+            return self._roles[_role(role)][index]
+        except KeyError:
+            raise KeyError('no nodes of type {}'.format(_role(role)))
+
+    def index_of(self, node: 'Node') -> int:
+        return self._refs[node.pod_name][1]
+
+    def by_name(self, pod_name: str) -> Optional['Node']:
+        return self._by_name.get(pod_name)
+
+    def by_ip(self, ip: str) -> Optional['Node']:
+        with self._lock:
+            return self._by_ip.get(ip)
+
+    def with_label(self, key: str, value: str) -> List['Node']:
+        with self._lock:
+            return [self._by_name[i] for i in self._by_label.get((key, value), ())]
+
+    def peers(self, role: 'NodeType', fmt: str) -> str:
+        """
+        `fmt` formatted with `index`, `number` (index + 1) and `ip` of each node of `role`, joined by comma.
+        """
+        key = (_role(role), fmt)
+        with self._lock:
+            if key not in self._peers:
+                self._peers[key] = ','.join(fmt.format(index=i, number=i + 1, ip=n.pod_ip)
+                                            for (i, n) in enumerate(self.role(role)))
+            return self._peers[key]
+
+    # health
+
+    def is_healthy(self, node: 'Node') -> bool:
+        with self._lock:
+            return not self._unhealthy.get(node.pod_name)
+
+    def _update_health(self, node: 'Node'):
+        healthy = self._healthy[self._refs[node.pod_name][0]]
+        if self._unhealthy.get(node.pod_name):
+            healthy.discard(node)
+        else:
+            healthy.add(node)
+
+    def _running(self, node: 'Node', running: bool):
+        self.set_healthy(node, running, reason='pod')
+
+    def set_healthy(self, node: 'Node', healthy: bool, reason: str = 'chaos'):
+        """
+        A node is unhealthy as long as it's marked unhealthy for any `reason`.
+        """
+        with self._lock:
+            reasons = self._unhealthy.setdefault(node.pod_name, set())
+            if healthy:
+                reasons.discard(reason)
+            else:
+                reasons.add(reason)
+            self._update_health(node)
+
+    def healthy(self, role: 'NodeType') -> List['Node']:
+        with self._lock:
+            return list(self._healthy.get(_role(role), _IndexedSet()).items)
+
+    # selectors
+
+    def _candidates(self, role: 'NodeType', healthy: bool) -> List['Node']:
+        if healthy:
+            return self._healthy[_role(role)].items if _role(role) in self._healthy else []
+        return self.role(role)
+
+    def random(self, role: 'NodeType', rng: Random, healthy: bool = True) -> Optional['Node']:
+        """
+        A random (healthy) node of `role`, None if there's none.
+        """
+        with self._lock:
+            candidates = self._candidates(role, healthy)
+            if not candidates:
+                return None
+            return candidates[rng.randrange(len(candidates))]
+
+    def take_random(self, role: 'NodeType', rng: Random, reason: str = 'chaos') -> Optional['Node']:
+        """
+        A random healthy node of `role` marked unhealthy for `reason` at once, so concurrent callers get different
+        nodes. None if there's none.
+        """
+        with self._lock:
+            node = self.random(role, rng)
+            if node is not None:
+                self.set_healthy(node, False, reason)
+            return node
+
+    def sample(self, role: 'NodeType', k: int, rng: Random, healthy: bool = True) -> List['Node']:
+        """
+        `k` distinct random (healthy) nodes of `role`, or all of them if there're fewer.
+        """
+        with self._lock:
+            candidates = self._candidates(role, healthy)
+            return rng.sample(candidates, min(k, len(candidates)))
+
+    def pd_leader(self, rng: Optional[Random] = None) -> Optional['Node']:
+        """
+        PD leader as told by a healthy PD node, None if no healthy PD knows the leader.
+        """
+        from .nodes import PdNode
+
+        pds = self.healthy(PdNode)
+        if rng is not None:
+            rng.shuffle(pds)
+        for pd in pds:
+            res = pd.run(pd.ready_probe)
+            if res.ok:
+                return self.leader_of(res.stdout)
+        return None
+
+    def leader_of(self, leader_response: str) -> Optional['Node']:
+        """
+        Node of the PD leader in the response of `/pd/api/v1/leader`.
+        """
+        try:
+            urls = json.loads(leader_response).get('client_urls') or []
+        except ValueError:
+            return None
+        for url in urls:
+            node = self.by_ip(url.split('://', 1)[-1].rsplit(':', 1)[0])
+            if node is not None:
+                return node
+        return None
+
+    # updates
+
+    def _index_ip(self, node: 'Node', ip: Optional[str]):
+        if ip is not None:
+            self._by_ip[ip] = node
+
+    def _index_labels(self, node: 'Node', labels: Dict[str, str]):
+        for kv in self._labels.get(node.pod_name, {}).items():
+            self._by_label.get(kv, set()).discard(node.pod_name)
+        self._labels[node.pod_name] = dict(labels)
+        for kv in labels.items():
+            self._by_label.setdefault(kv, set()).add(node.pod_name)
+
+    def update_labels(self, node: 'Node', added: Dict[str, str], removed: Iterable[str] = ()):
+        with self._lock:
+            labels = dict(self._labels.get(node.pod_name, {}))
+            labels.update(added)
+            for k in removed:
+                labels.pop(k, None)
+            self._index_labels(node, labels)
+
+    def update_pod(self, pod: 'V1Pod', deleted: bool = False):
+        """
+        Apply a change of a pod (IP, labels or phase) of this test bed, others are ignored.
+        """
+        with self._lock:
+            node = self._by_name.get(pod.metadata.name)
+            if node is None:
+                return
+            old_ip = node.pod_ip
+            node._pod = pod
+            if pod.status.pod_ip != old_ip:
+                self._by_ip.pop(old_ip, None)
+                self._index_ip(node, pod.status.pod_ip)
+                self._peers.clear()
+            self._index_labels(node, pod.metadata.labels or {})
+            self._running(node, not deleted and pod.status.phase == 'Running')
+
@@ -0,0 +1,328 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from itertools import cycle, count
+from queue import Queue, Empty
+from threading import Lock, Thread, Event
+from time import time, sleep, monotonic
+from typing import List, Dict, Optional, Callable, Iterator, Tuple, NamedTuple
+
+from .mixins import LoggerMixin
+from .results import ResultWriter
+from .stats import Histogram
+
+
+class MySqlPool(LoggerMixin):
+    """
+    MySQL protocol connections to a set of servers (e.g. all `DbNode`s), handed out round robin over servers.
+
+    Requires `pymysql`.
+    """
+
+    def __init__(self, hosts: List[str], size_per_host: int = 4, port: int = 4000, user: str = 'root',
+                 database: Optional[str] = None, **kwargs) -> None:
+        super().__init__(**kwargs)
+        assert hosts
+        self.hosts = hosts
+        self.size_per_host = size_per_host
+        self.port = port
+        self.user = user
+        self.database = database
+        self._idle: Dict[str, Queue] = {h: Queue() for h in hosts}
+        self._created: Dict[str, int] = {h: 0 for h in hosts}
+        self._lock = Lock()
+        self._next_host = cycle(hosts)
+
+    def _connect(self, host: str):
+        try:
+            import pymysql
+        except ImportError:
+            raise ImportError('`pymysql` is required to run workload in process, try `pip install pymysql`')
+        return pymysql.connect(host=host, port=self.port, user=self.user, database=self.database, autocommit=True)
+
+    def _acquire(self) -> Tuple[str, object]:
+        while True:
+            with self._lock:
+                host = next(self._next_host)
+                try:
+                    return host, self._idle[host].get_nowait()
+                except Empty:
+                    pass
+                create = self._created[host] < self.size_per_host
+                if create:
+                    self._created[host] += 1
+            if create:
+                try:
+                    return host, self._connect(host)
+                except Exception:
+                    with self._lock:
+                        self._created[host] -= 1
+                    raise
+            try:
+                return host, self._idle[host].get(timeout=1)
+            except Empty:
+                # connections of this host may have been dropped, try again
+                continue
+
+    @contextmanager
+    def connection(self) -> Iterator[object]:
+        host, conn = self._acquire()
+        try:
+            yield conn
+        except Exception:
+            # connection may be broken, drop it
+            with self._lock:
+                self._created[host] -= 1
+            conn.close()
+            raise
+        else:
+            self._idle[host].put(conn)
+
+    def close(self):
+        for q in self._idle.values():
+            while not q.empty():
+                q.get_nowait().close()
+
+
+class QueryDriver(LoggerMixin):
+    """
+    Run a named set of queries through a `MySqlPool` and record every execution to a `ResultWriter`.
+    """
+
+    def __init__(self, pool: MySqlPool, queries: Dict[str, str], results: ResultWriter,
+                 chaos_state: Callable[[], str] = lambda: '', step: str = 'query', **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.pool = pool
+        self.queries = queries
+        self.results = results
+        self.chaos_state = chaos_state
+        self.step = step
+
+    def execute(self, name: str, due: Optional[float] = None) -> bool:
+        """
+        Run query `name` and record it, as started at `due` (wall clock) if given, so that time spent waiting to be
+        run counts in its latency.
+        """
+        chaos = self.chaos_state()
+        start = time() if due is None else due
+        rows, error = None, None
+        try:
+            with self.pool.connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute(self.queries[name])
+                    rows = len(cursor.fetchall())
+        except Exception as e:
+            error = '{}: {}'.format(e.__class__.__name__, e)
+            self.logger.debug('%s failed: %s', name, error)
+        self.results.record(self.step, name, start, time(), rows=rows, error=error, chaos=chaos)
+        return error is None
+
+    def run(self, concurrency: int = 1, repeat: int = 1, qps: Optional[float] = None,
+            duration: Optional[float] = None) -> Tuple[int, int]:
+        """
+        Run the query set `repeat` times on `concurrency` workers, returns (succeeded, failed) count.
+
+        Without `qps`, workers run queries back to back. With `qps`, queries are issued at that fixed rate (cycling
+        the query set) for `duration` seconds, or until the query set is issued `repeat` times if not given; their
+        latency counts from when they were due as in `BackgroundWorkload`, not from when a worker got to them.
+        """
+        names = list(self.queries)
+        begin = monotonic()
+        begin_wall = time()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            if qps is None:
+                futures = [pool.submit(self.execute, n) for _ in range(repeat) for n in names]
+            else:
+                futures = []
+                total = None if duration is not None else repeat * len(names)
+                for (i, n) in enumerate(cycle(names)):
+                    due = begin + i / qps
+                    if (total is not None and i >= total) or (duration is not None and due - begin >= duration):
+                        break
+                    delay = due - monotonic()
+                    if delay > 0:
+                        sleep(delay)
+                    futures.append(pool.submit(self.execute, n, begin_wall + i / qps))
+            succeeded = sum(1 for f in futures if f.result())
+
+        failed = len(futures) - succeeded
+        self.logger.info('%s queries in %.2fs, %s failed', len(futures), monotonic() - begin, failed)
+        return succeeded, failed
+
+    def background(self, concurrency: int = 1, qps: Optional[float] = None, interval: float = 1,
+                   close: Optional[Callable[[], None]] = None) -> 'BackgroundWorkload':
+        """
+        Workload cycling the query set until stopped, see `BackgroundWorkload`.
+        """
+        names = cycle(self.queries)
+        lock = Lock()
+
+        def operation() -> bool:
+            with lock:
+                name = next(names)
+            return self.execute(name)
+
+        return BackgroundWorkload(operation, concurrency=concurrency, qps=qps, interval=interval,
+                                  chaos_state=self.chaos_state, close=close)
+
+
+class IntervalStats(NamedTuple):
+    # wall clock
+    start: float
+    seconds: float
+    succeeded: int
+    failed: int
+    latency: Histogram
+    # active chaos when the interval started
+    chaos: str
+
+    @property
+    def throughput(self) -> float:
+        return self.succeeded / self.seconds if self.seconds else 0.
+
+    def to_dict(self) -> dict:
+        return {'start': self.start, 'seconds': self.seconds, 'succeeded': self.succeeded, 'failed': self.failed,
+                'throughput': self.throughput, 'p50': self.latency.percentile(50),
+                'p99': self.latency.percentile(99), 'max': self.latency.max, 'chaos': self.chaos}
+
+
+class BackgroundWorkload(LoggerMixin):
+    """
+    Run `operation` (returning if it succeeded) on `concurrency` threads in background until `stop`, with latency
+    histograms and throughput per `interval` seconds readable while it runs.
+
+    Without `qps`, each thread runs operations back to back. With `qps`, operations are due at that fixed rate and
+    their latency counts from when they were due, so a stall shows up in the latency of all operations it delays
+    instead of only the one it hits.
+    """
+
+    def __init__(self, operation: Callable[[], bool], concurrency: int = 1, qps: Optional[float] = None,
+                 interval: float = 1, chaos_state: Callable[[], str] = lambda: '',
+                 close: Optional[Callable[[], None]] = None, **kwargs) -> None:
+        """
+        :param close: called once stopped, e.g. to close connections used by `operation`
+        """
+        super().__init__(**kwargs)
+        self.operation = operation
+        self.concurrency = concurrency
+        self.qps = qps
+        self.interval = interval
+        self.chaos_state = chaos_state
+        self.close = close
+
+        self._lock = Lock()
+        self._stopped = Event()
+        self._threads: List[Thread] = []
+        self._slots = count()
+        self._begin = 0.
+        # completed intervals
+        self.intervals: List[IntervalStats] = []
+        self._interval_begin = 0.
+        self._interval_start = 0.
+        self._current: Tuple[Histogram, List[int], str] = (Histogram(), [0, 0], '')
+
+    @property
+    def running(self) -> bool:
+        return bool(self._threads)
+
+    def _roll(self, now: float):
+        # with lock held, closes intervals ended before `now`
+        while now >= self._interval_begin + self.interval:
+            (h, (succeeded, failed), chaos) = self._current
+            self.intervals.append(IntervalStats(self._interval_start, self.interval, succeeded, failed, h, chaos))
+            self._interval_begin += self.interval
+            self._interval_start += self.interval
+            self._current = (Histogram(), [0, 0], self.chaos_state())
+
+    def _record(self, ok: bool, latency: float, now: float):
+        with self._lock:
+            self._roll(now)
+            (h, counts, _) = self._current
+            h.record(latency)
+            counts[0 if ok else 1] += 1
+
+    def _worker(self):
+        while not self._stopped.is_set():
+            if self.qps is None:
+                due = monotonic()
+            else:
+                due = self._begin + next(self._slots) / self.qps
+                if self._stopped.wait(max(0., due - monotonic())):
+                    break
+            try:
+                ok = self.operation()
+            except Exception as e:
+                self.logger.debug('operation failed: %s', e)
+                ok = False
+            now = monotonic()
+            self._record(ok, now - due, now)
+
+    def start(self) -> 'BackgroundWorkload':
+        assert not self.running
+        self._stopped.clear()
+        self._begin = self._interval_begin = monotonic()
+        self._interval_start = time()
+        self._current = (Histogram(), [0, 0], self.chaos_state())
+        self._slots = count()
+        self._threads = [Thread(target=self._worker, daemon=True) for _ in range(self.concurrency)]
+        for t in self._threads:
+            t.start()
+        self.logger.info('started on %s thread(s)%s', self.concurrency,
+                         '' if self.qps is None else ' at {} ops/s'.format(self.qps))
+        return self
+
+    def stop(self) -> Tuple[int, int]:
+        """
+        Stop after operations in flight, returns (succeeded, failed) count of all intervals.
+        """
+        self._stopped.set()
+        for t in self._threads:
+            t.join()
+        self._threads = []
+        with self._lock:
+            now = monotonic()
+            self._roll(now)
+            # partial last interval, merged into the previous one if too short for a meaningful rate
+            (h, (succeeded, failed), chaos) = self._current
+            seconds = now - self._interval_begin
+            if (succeeded or failed) and seconds < self.interval / 2 and self.intervals:
+                last = self.intervals.pop()
+                last.latency.merge(h)
+                self.intervals.append(last._replace(seconds=last.seconds + seconds,
+                                                    succeeded=last.succeeded + succeeded, failed=last.failed + failed))
+            elif succeeded or failed:
+                self.intervals.append(IntervalStats(self._interval_start, seconds, succeeded, failed, h, chaos))
+            self._current = (Histogram(), [0, 0], '')
+        if self.close is not None:
+            self.close()
+        succeeded = sum(i.succeeded for i in self.intervals)
+        failed = sum(i.failed for i in self.intervals)
+        self.logger.info('stopped, %s succeeded and %s failed', succeeded, failed)
+        return succeeded, failed
+
+    def recent(self, intervals: int = 1) -> List[IntervalStats]:
+        """
+        Last `intervals` completed intervals.
+        """
+        with self._lock:
+            if self.running:
+                self._roll(monotonic())
+            return self.intervals[-intervals:]
+
+    def throughput(self, intervals: int = 1) -> float:
+        """
+        Succeeded operations per second of the last `intervals` completed intervals.
+        """
+        recent = self.recent(intervals)
+        seconds = sum(i.seconds for i in recent)
+        return sum(i.succeeded for i in recent) / seconds if seconds else 0.
+
+    def latency(self, intervals: Optional[int] = None) -> Histogram:
+        """
+        Merged latency histogram of the last `intervals` completed intervals, or all of them.
+        """
+        with self._lock:
+            selected = self.intervals if intervals is None else self.intervals[-intervals:]
+            ret = Histogram()
+            for i in selected:
+                ret.merge(i.latency)
+            return ret
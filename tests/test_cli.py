@@ -0,0 +1,120 @@
+import pytest
+
+from test_template.cli import discover, select, parse_params, check_params, params_of
+
+BASE = '''
+from test_template import Test
+
+
+class Base(Test):
+    """
+    A test.
+    """
+    rounds = 3
+    labels = {'a': 1}
+    _private = 1
+
+    def env(self):
+        pass
+
+    def test_actions(self):
+        return []
+
+
+class Incomplete(Test):
+    def env(self):
+        pass
+
+
+class NotATest:
+    rounds = 1
+'''
+
+DERIVED = '''
+import base
+
+
+class Derived(base.Base):
+    rounds = 5
+    timeout: float = 2 * 60
+
+
+class Mixed(Derived, base.Incomplete):
+    pass
+'''
+
+
+@pytest.fixture
+def scripts(tmp_path):
+    (tmp_path / 'base.py').write_text(BASE)
+    (tmp_path / 'derived.py').write_text(DERIVED)
+    (tmp_path / 'broken.py').write_text('class Broken(Test):\n    def (')
+    (tmp_path / 'notes.txt').write_text('class Hidden(Test): pass\n')
+    return tmp_path
+
+
+def by_name(tests):
+    return {t.name: t for t in tests}
+
+
+def test_discover(scripts):
+    tests = by_name(discover([str(scripts)]))
+    assert set(tests) == {'Base', 'Incomplete', 'Derived', 'Mixed'}
+
+    base = tests['Base']
+    assert base.runnable
+    assert base.doc == 'A test.'
+    assert base.path == str(scripts / 'base.py')
+    assert base.line == 5
+    assert base.ref == '{}:Base'.format(scripts / 'base.py')
+    assert base.params['rounds'] == 3
+    assert base.params['labels'] == {'a': 1}
+    assert '_private' not in base.params
+    # parameters of `Test` itself
+    assert 'result_path' in base.params
+
+    assert not tests['Incomplete'].runnable
+    derived = tests['Derived']
+    assert derived.runnable
+    assert derived.params['rounds'] == 5
+    # not a literal, kept as source
+    assert derived.params['timeout'] == '2 * 60'
+    assert tests['Mixed'].runnable
+    assert tests['Mixed'].params['rounds'] == 5
+
+
+def test_discover_files(scripts):
+    # a script alone doesn't know tests of others it extends
+    assert set(by_name(discover([str(scripts / 'derived.py')]))) == set()
+    assert set(by_name(discover([str(scripts / 'base.py')]))) == {'Base', 'Incomplete'}
+
+
+def test_select(scripts):
+    tests = discover([str(scripts)])
+    assert [t.name for t in select(tests, ['Base'])] == ['Base']
+    assert [t.name for t in select(tests, ['D*', '*derived.py:*'])] == ['Derived', 'Mixed']
+    with pytest.raises(ValueError):
+        select(tests, ['Incomplete'])
+    with pytest.raises(ValueError):
+        select(tests, ['Nope'])
+
+
+def test_parse_params():
+    assert parse_params(['a=1', 'b=x', 'c=[1, 2]', 'd=', 'e=a=b', "f='1'"]) == \
+        {'a': 1, 'b': 'x', 'c': [1, 2], 'd': '', 'e': 'a=b', 'f': '1'}
+    with pytest.raises(ValueError):
+        parse_params(['a'])
+
+
+def test_check_params(scripts):
+    tests = by_name(discover([str(scripts)]))
+    (base, derived) = (tests['Base'], tests['Derived'])
+    check_params([base, derived], {'rounds': 1, 'timeout': 5})
+    with pytest.raises(ValueError, match='timeout'):
+        check_params([base], {'rounds': 1, 'timeout': 5})
+    with pytest.raises(ValueError, match='nope'):
+        check_params([base, derived], {'nope': 1})
+
+    params = {'rounds': 1, 'timeout': 5}
+    assert params_of(base, params) == {'rounds': 1}
+    assert params_of(derived, params) == params
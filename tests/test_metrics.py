@@ -0,0 +1,93 @@
+from types import SimpleNamespace
+
+from test_template.chaos.timing import FaultTiming
+from test_template.metrics import parse_prometheus, load_metrics, MetricsSampler, ChaosEvent
+
+EXPOSITION = '''# HELP tidb_server_query_total Counter of queries.
+# TYPE tidb_server_query_total counter
+tidb_server_query_total{result="OK",type="Select"} 1234
+tidb_server_query_total{result="Error",type="Select"} 5
+tidb_server_connections 12
+
+tikv_raftstore_region_count{type="leader"} 3.5e+01
+go_goroutines 100
+label_with_brace{path="/a}b"} 7
+broken_line
+not_a_number NaNish
+'''
+
+
+def test_parse_prometheus():
+    values = parse_prometheus(EXPOSITION)
+    assert values['tidb_server_query_total{result="OK",type="Select"}'] == 1234
+    assert values['tidb_server_query_total{result="Error",type="Select"}'] == 5
+    assert values['tidb_server_connections'] == 12
+    assert values['tikv_raftstore_region_count{type="leader"}'] == 35
+    assert values['label_with_brace{path="/a}b"}'] == 7
+    assert 'broken_line' not in values
+    assert 'not_a_number' not in values
+    assert not any(s.startswith('#') for s in values)
+
+
+def test_parse_prometheus_include():
+    values = parse_prometheus(EXPOSITION, include=['tidb_server_', 'tikv_raftstore_region_count'])
+    assert sorted(values) == ['tidb_server_connections', 'tidb_server_query_total{result="Error",type="Select"}',
+                              'tidb_server_query_total{result="OK",type="Select"}',
+                              'tikv_raftstore_region_count{type="leader"}']
+    assert parse_prometheus(EXPOSITION, include=()) == {}
+
+
+def test_parse_prometheus_timestamp():
+    assert parse_prometheus('up{job="pd"} 1 1700000000000\nup 0 1700000000000\n') == {'up{job="pd"}': 1, 'up': 0}
+
+
+def sampler(path, scrapes):
+    """
+    Sampler of two nodes, `scrapes` gives what each of them returns per node key (None if it can't be scraped).
+    """
+    nodes = [SimpleNamespace(ref=('pd', 0), metrics_url='http://pd'), SimpleNamespace(ref=('kv', 0), metrics_url='x'),
+             SimpleNamespace(ref=('db', 0), metrics_url=None)]
+    env = SimpleNamespace(topology=SimpleNamespace(nodes=lambda: nodes))
+    s = MetricsSampler(env, path=path, batch_size=2)
+    s.scrape = lambda node: scrapes['{}-{}'.format(*node.ref)]
+    return s
+
+
+def test_load_metrics_round_trip(tmp_path):
+    path = str(tmp_path / 'metrics.gz')
+    scrapes = {'pd-0': {'a': 1.0}, 'kv-0': None}
+    s = sampler(path, scrapes)
+    s.sample()
+    s.on_transition('NodeOffline:kv', FaultTiming('NodeOffline:kv', 'activate', 10.0, 10.5, 11.0))
+    scrapes.update({'pd-0': {'a': 2.0, 'b': 5.0}, 'kv-0': {'c': 3.0}})
+    s.sample()
+    scrapes.update({'pd-0': None})
+    s.sample()
+    s.flush()
+
+    m = load_metrics(path)
+    assert len(m['t']) == 3
+    assert m['t'] == [t for (t, _) in s.scrapes]
+    assert m['chaos'] == ['', '', '']
+    assert m['series'] == {
+        'pd-0/up': [1.0, 1.0, 0.0],
+        'pd-0/a': [1.0, 2.0, None],
+        'pd-0/b': [None, 5.0, None],
+        'kv-0/up': [0.0, 1.0, 1.0],
+        'kv-0/c': [None, 3.0, 3.0],
+    }
+    assert m['events'] == [ChaosEvent(10.0, 'NodeOffline:kv', 'activate', 11.0)]
+
+
+def test_load_metrics_files(tmp_path):
+    # series missing from one file are aligned across files
+    paths = [str(tmp_path / 'a.gz'), str(tmp_path / 'b.gz')]
+    for (path, series) in zip(paths, ('a', 'b')):
+        s = sampler(path, {'pd-0': {series: 1.0}, 'kv-0': None})
+        s.sample()
+        s.flush()
+    m = load_metrics(*paths)
+    assert m['series']['pd-0/a'] == [1.0, None]
+    assert m['series']['pd-0/b'] == [None, 1.0]
+    assert m['series']['kv-0/up'] == [0.0, 0.0]
+    assert m['events'] == []
@@ -0,0 +1,56 @@
+import gzip
+
+import pytest
+
+from test_template.results import ResultWriter, load_results, summarize, COLUMNS
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / 'results.gz')
+    w = ResultWriter(path, run_id='r1', batch_size=2)
+    w.record('load', 'lineorder', 1.0, 3.0, rows=100)
+    w.record('query', 'q1.1', 3.0, 3.5, rows=1, chaos='NodeOffline:kv')
+    w.record('query', 'q1.2', 4.0, 4.25, error='timeout')
+    w.flush()
+
+    columns = load_results(path)
+    assert set(columns) == set(COLUMNS)
+    assert columns['run'] == ['r1'] * 3
+    assert columns['step'] == ['load', 'query', 'query']
+    assert columns['name'] == ['lineorder', 'q1.1', 'q1.2']
+    assert columns['rows'] == [100, 1, None]
+    assert columns['error'] == [None, None, 'timeout']
+    assert columns['chaos'] == ['', 'NodeOffline:kv', '']
+    # a full batch and the rest flushed explicitly, each as its own gzip member
+    with gzip.open(path, 'rt') as f:
+        assert len(f.readlines()) == 2
+
+
+def test_flush_empty(tmp_path):
+    path = tmp_path / 'results.gz'
+    ResultWriter(str(path)).flush()
+    assert not path.exists()
+
+
+def test_runs_appended(tmp_path):
+    path = str(tmp_path / 'results.gz')
+    for run in ('a', 'b'):
+        w = ResultWriter(path, run_id=run)
+        for i in range(3):
+            w.record('query', 'q1.1', i, i + (0.1 if run == 'a' else 0.2))
+        w.flush()
+    other = str(tmp_path / 'other.gz')
+    w = ResultWriter(other, run_id='c')
+    w.record('query', 'q1.1', 0, 1, error='failed')
+    w.flush()
+
+    columns = load_results(path, other)
+    assert columns['run'] == ['a'] * 3 + ['b'] * 3 + ['c']
+
+    summary = summarize(columns)
+    assert set(summary) == {('a', 'q1.1'), ('b', 'q1.1'), ('c', 'q1.1')}
+    assert summary[('a', 'q1.1')]['count'] == 3
+    assert summary[('a', 'q1.1')]['mean'] == pytest.approx(0.1)
+    assert summary[('b', 'q1.1')]['p99'] == pytest.approx(0.2, rel=0.01)
+    assert summary[('c', 'q1.1')]['errors'] == 1
+    assert summarize(columns, by=('name',))[('q1.1',)]['count'] == 7
@@ -0,0 +1,52 @@
+from types import SimpleNamespace
+
+from test_template.chaos.rules import PdMajorityRule
+from test_template.nodes import PdNode, KvNode
+
+
+class Manager:
+    """
+    What rules see of a chaos manager: the roles of the test bed and the active operators.
+    """
+
+    def __init__(self, pd_count: int, active=()) -> None:
+        roles = {PdNode: [object()] * pd_count}
+        self.env = SimpleNamespace(topology=SimpleNamespace(role=lambda t: roles.get(t, [])))
+        self.active = list(active)
+
+    def active_operators(self):
+        return self.active
+
+
+def offline(type_name: str):
+    return SimpleNamespace(type_name=type_name)
+
+
+def test_keeps_quorum():
+    rule = PdMajorityRule()
+    op = offline(PdNode.name)
+    assert rule.allows(Manager(3), op)
+    assert not rule.allows(Manager(3, [offline(PdNode.name)]), op)
+    assert rule.allows(Manager(5, [offline(PdNode.name)]), op)
+    assert not rule.allows(Manager(5, [offline(PdNode.name)] * 2), op)
+    assert not rule.allows(Manager(1), op)
+
+
+def test_op_itself_not_counted_twice():
+    # an operator being activated is already among active ones
+    op = offline(PdNode.name)
+    assert PdMajorityRule().allows(Manager(3, [op]), op)
+
+
+def test_other_operators():
+    rule = PdMajorityRule()
+    mgr = Manager(3, [offline(PdNode.name), offline(KvNode.name)])
+    assert rule.allows(mgr, offline(KvNode.name))
+    # e.g. network partitions, which have no `type_name`
+    assert rule.allows(mgr, SimpleNamespace())
+    assert rule.allows(Manager(3, [offline(KvNode.name)] * 3), offline(PdNode.name))
+
+
+def test_allow_majority_loss():
+    assert PdMajorityRule(allow_majority_loss=True).allows(Manager(3, [offline(PdNode.name)]),
+                                                           offline(PdNode.name))
@@ -0,0 +1,50 @@
+from itertools import count
+from random import Random
+
+import pytest
+
+from test_template.chaos import OperatorSchedule
+from test_template.chaos.schedule import Fixed, Poisson, Burst, Randoms
+
+
+def delays(arrival, n, rng=None):
+    rng = Random(0) if rng is None else rng
+    return [arrival.next_delay(rng, i) for i in range(n)]
+
+
+def test_fixed():
+    assert delays(Fixed(2.5), 4) == [2.5] * 4
+
+
+def test_poisson():
+    d = delays(Poisson(rate=4), 20000)
+    assert all(x > 0 for x in d)
+    assert sum(d) / len(d) == pytest.approx(0.25, rel=0.05)
+    assert delays(Poisson(4), 10, Random(1)) == delays(Poisson(4), 10, Random(1))
+
+
+def test_burst():
+    assert delays(Burst(count=3, interval=1, gap=10), 7) == [1, 1, 1, 10, 1, 1, 10]
+    assert delays(Burst(count=1, interval=1, gap=10), 3) == [1, 10, 10]
+    with pytest.raises(AssertionError):
+        Burst(count=0, interval=1, gap=10)
+
+
+def test_shared_arrival_per_schedule():
+    # one process passed for two operators, each goes through its own bursts
+    burst = Burst(count=2, interval=1, gap=10)
+    (a, b) = (OperatorSchedule(burst, None, None, g, count()) for g in range(2))
+    rng = Random(0)
+    assert [a.next_delay(rng), b.next_delay(rng), a.next_delay(rng), a.next_delay(rng), b.next_delay(rng),
+            b.next_delay(rng)] == [1, 1, 1, 10, 1, 10]
+
+
+def test_randoms_by_name():
+    r = Randoms(42)
+    first = [r.get('op', 'arrival').random() for _ in range(3)]
+    # drawing from another stream in between doesn't change what a stream draws
+    other = Randoms(42)
+    other.get('op', 'target').random()
+    assert [other.get('op', 'arrival').random() for _ in range(3)] == first
+    assert r.get('op', 'arrival') is r.get('op', 'arrival')
+    assert Randoms(43).get('op', 'arrival').random() != first[0]
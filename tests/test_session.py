@@ -0,0 +1,58 @@
+from test_template.session import MarkedOutput
+
+MARKER = '__done_1__'
+
+
+def feed_all(out: MarkedOutput, *chunks: str) -> bool:
+    return any([out.feed(c) for c in chunks])
+
+
+def test_marker_in_one_chunk():
+    out = MarkedOutput(MARKER, with_exit_code=True)
+    assert out.feed('hello\nworld\n' + MARKER + '0\n')
+    assert out.done
+    assert out.text == 'hello\nworld\n'
+    assert out.exit_code == 0
+
+
+def test_marker_split_across_chunks():
+    out = MarkedOutput(MARKER, with_exit_code=True)
+    assert not out.feed('a' * 100 + '__do')
+    assert not out.feed('ne_1')
+    assert not out.feed('__2')
+    assert out.feed('3\nleft over')
+    assert out.text == 'a' * 100
+    assert out.exit_code == 23
+
+
+def test_waits_for_line_of_exit_code():
+    out = MarkedOutput(MARKER, with_exit_code=True)
+    assert not out.feed('x' + MARKER + '1')
+    assert not out.done
+    assert out.feed('27\n')
+    assert out.exit_code == 127
+    assert out.text == 'x'
+
+
+def test_without_exit_code():
+    out = MarkedOutput(MARKER, with_exit_code=False)
+    assert not out.feed('error: ')
+    assert out.feed('oops\n' + MARKER)
+    assert out.text == 'error: oops\n'
+    assert out.exit_code is None
+
+
+def test_many_small_chunks():
+    out = MarkedOutput(MARKER, with_exit_code=True)
+    text = ''.join('line {}\n'.format(i) for i in range(1000))
+    data = text + MARKER + '3\n'
+    assert feed_all(out, *[data[i:i + 7] for i in range(0, len(data), 7)])
+    assert out.text == text
+    assert out.exit_code == 3
+
+
+def test_no_marker():
+    out = MarkedOutput(MARKER, with_exit_code=False)
+    assert not feed_all(out, 'a', '__done_', '2__')
+    assert not out.done
+    assert out.text == ''
@@ -0,0 +1,72 @@
+from random import Random
+
+import pytest
+
+from test_template.stats import Histogram
+
+
+def test_empty():
+    h = Histogram()
+    assert h.count == 0
+    assert h.percentile(50) is None
+    assert h.mean is None
+    assert h.to_dict()['p99'] is None
+
+
+def test_percentiles_within_precision():
+    h = Histogram(precision=0.01)
+    rng = Random(1)
+    values = [rng.uniform(0.001, 10) for _ in range(10000)]
+    for v in values:
+        h.record(v)
+    values.sort()
+    for p in (50, 90, 99):
+        exact = values[int(p / 100 * len(values)) - 1]
+        assert h.percentile(p) == pytest.approx(exact, rel=0.02)
+    assert h.percentile(100) == h.max == values[-1]
+    assert h.min == values[0]
+    assert h.mean == pytest.approx(sum(values) / len(values))
+
+
+def test_never_above_max():
+    h = Histogram()
+    h.record(0.5, count=3)
+    assert h.percentile(99) == 0.5
+    assert h.count == 3
+    assert h.total == pytest.approx(1.5)
+
+
+def test_below_lowest():
+    h = Histogram(lowest=1e-3)
+    h.record(0)
+    h.record(1e-4)
+    assert h.percentile(100) == pytest.approx(1e-4)
+    assert h.min == 0
+
+
+def test_merge():
+    (a, b, both) = (Histogram(), Histogram(), Histogram())
+    rng = Random(2)
+    for i in range(1000):
+        v = rng.expovariate(10)
+        (a if i % 2 else b).record(v)
+        both.record(v)
+    a.merge(b)
+    assert a.buckets == both.buckets
+    assert (a.count, a.min, a.max) == (both.count, both.min, both.max)
+    assert a.total == pytest.approx(both.total)
+    for p in (50, 90, 99):
+        assert a.percentile(p) == both.percentile(p)
+
+
+def test_merge_empty():
+    (a, b) = (Histogram(), Histogram())
+    b.record(2)
+    a.merge(Histogram())
+    a.merge(b)
+    assert (a.count, a.min, a.max) == (1, 2, 2)
+
+
+def test_merge_other_precision():
+    with pytest.raises(AssertionError):
+        Histogram(precision=0.01).merge(Histogram(precision=0.1))